@@ -0,0 +1,320 @@
+#!/usr/bin/env python3
+"""
+Non-blocking logging for the Paperless-Bigcapital middleware.
+Log calls only put the record on a bounded in-memory queue; a QueueListener
+thread writes JSON lines to a size-rotated file and the console, and network
+fan-out (Socket.IO, log streams) runs on its own thread in rate-limited
+batches. Both queues drop their oldest entries under pressure, so logging
+never stalls processing.
+"""
+
+import atexit
+import copy
+import json
+import logging
+import queue
+import threading
+import time
+from collections import deque
+from datetime import datetime
+from logging.handlers import QueueHandler, QueueListener, RotatingFileHandler
+from typing import Callable, Dict, Iterable, Iterator, List, Optional, Tuple
+
+# Attributes every LogRecord has; anything else was passed with ``extra=``
+_RECORD_ATTRS = set(vars(logging.LogRecord('', 0, '', 0, '', None, None))) | {'message', 'asctime'}
+
+_listener: Optional[QueueListener] = None
+_queue_handler: Optional[QueueHandler] = None
+_lock = threading.Lock()
+
+
+class DropOldestQueue(queue.Queue):
+    """Bounded queue whose ``put_nowait`` evicts the oldest entry instead of failing"""
+
+    def __init__(self, maxsize: int = 10000):
+        super().__init__(maxsize)
+        self.dropped = 0
+
+    def put_nowait(self, item):
+        while True:
+            try:
+                return super().put_nowait(item)
+            except queue.Full:
+                try:
+                    self.get_nowait()
+                    self.dropped += 1
+                except queue.Empty:
+                    pass
+
+
+class LogRing:
+    """Fixed-capacity ring buffer of recent log entries; appends never copy or shift"""
+
+    def __init__(self, capacity: int = 500):
+        self.capacity = max(1, capacity)
+        self._entries: List[Optional[Dict]] = [None] * self.capacity
+        self._next = 0  # slot the next entry is written to
+        self._count = 0
+        self._lock = threading.Lock()
+
+    def append(self, entry: Dict):
+        with self._lock:
+            self._entries[self._next] = entry
+            self._next = (self._next + 1) % self.capacity
+            self._count = min(self._count + 1, self.capacity)
+
+    def extend(self, entries: Iterable[Dict]):
+        with self._lock:
+            for entry in entries:
+                self._entries[self._next] = entry
+                self._next = (self._next + 1) % self.capacity
+                self._count = min(self._count + 1, self.capacity)
+
+    def recent(self, limit: int = None) -> List[Dict]:
+        """Newest entries first"""
+        with self._lock:
+            count = self._count if limit is None else max(0, min(limit, self._count))
+            return [self._entries[(self._next - 1 - offset) % self.capacity] for offset in range(count)]
+
+    def __len__(self) -> int:
+        return self._count
+
+
+class _Subscriber:
+    """One log stream client's own bounded backlog of (sequence id, entry) events"""
+
+    def __init__(self, capacity: int):
+        self.buffer: deque = deque(maxlen=capacity)
+        self.dropped = 0  # entries lost because the client fell behind
+
+
+class LogHub:
+    """Broadcasts log entries to every stream subscriber.
+
+    Each entry gets a sequence id. Every subscriber reads from its own
+    bounded buffer, so a slow client only loses its own oldest entries and
+    never delays the others. A reconnecting client passes the last id it saw
+    and is replayed what it missed from a shared history.
+    """
+
+    def __init__(self, history: int = 1000, subscriber_buffer: int = 500):
+        self.subscriber_buffer = subscriber_buffer
+        self._history: deque = deque(maxlen=history)
+        self._seq = 0
+        self._subscribers = set()
+        self._cond = threading.Condition()
+
+    def publish(self, entries: Iterable[Dict]):
+        with self._cond:
+            for entry in entries:
+                self._seq += 1
+                event = (self._seq, entry)
+                self._history.append(event)
+                for subscriber in self._subscribers:
+                    if len(subscriber.buffer) == subscriber.buffer.maxlen:
+                        subscriber.dropped += 1
+                    subscriber.buffer.append(event)
+            self._cond.notify_all()
+
+    def subscribe(self, last_event_id: int = None) -> _Subscriber:
+        subscriber = _Subscriber(self.subscriber_buffer)
+        with self._cond:
+            if last_event_id is not None:
+                if last_event_id > self._seq:
+                    last_event_id = 0  # ids from before a restart; replay what we have
+                missed = [event for event in self._history if event[0] > last_event_id]
+                oldest = self._history[0][0] if self._history else self._seq + 1
+                subscriber.dropped = max(0, oldest - 1 - last_event_id)
+                subscriber.buffer.extend(missed)
+                subscriber.dropped += len(missed) - len(subscriber.buffer)
+            self._subscribers.add(subscriber)
+        return subscriber
+
+    def unsubscribe(self, subscriber: _Subscriber):
+        with self._cond:
+            self._subscribers.discard(subscriber)
+
+    def wait(self, subscriber: _Subscriber, timeout: float) -> Tuple[List[Tuple[int, Dict]], int]:
+        """Events for ``subscriber`` (empty after ``timeout``) and how many it missed"""
+        with self._cond:
+            if not subscriber.buffer:
+                self._cond.wait_for(lambda: subscriber.buffer, timeout)
+            events = list(subscriber.buffer)
+            subscriber.buffer.clear()
+            dropped, subscriber.dropped = subscriber.dropped, 0
+        return events, dropped
+
+    def stream(self, last_event_id: int = None, heartbeat: float = 15.0) -> Iterator[str]:
+        """Server-Sent Events for a new subscriber, until the client disconnects"""
+        subscriber = self.subscribe(last_event_id)
+        try:
+            yield "retry: 3000\n\n"
+            while True:
+                events, dropped = self.wait(subscriber, heartbeat)
+                if dropped:
+                    yield f"event: dropped\ndata: {json.dumps({'count': dropped})}\n\n"
+                if not events:
+                    yield ": keepalive\n\n"
+                    continue
+                yield ''.join(f"id: {seq}\nevent: log\ndata: {json.dumps(entry, default=str)}\n\n"
+                              for seq, entry in events)
+        finally:
+            self.unsubscribe(subscriber)
+
+    @property
+    def subscribers(self) -> int:
+        with self._cond:
+            return len(self._subscribers)
+
+
+class JsonFormatter(logging.Formatter):
+    """One JSON object per record, including ``extra=`` fields such as doc_id"""
+
+    def format(self, record: logging.LogRecord) -> str:
+        entry = {
+            'timestamp': datetime.fromtimestamp(record.created).isoformat(timespec='milliseconds'),
+            'level': record.levelname,
+            'logger': record.name,
+            'message': record.getMessage(),
+            'thread': record.threadName
+        }
+        entry.update({key: value for key, value in vars(record).items()
+                      if key not in _RECORD_ATTRS and not key.startswith('_')})
+        if record.exc_text:
+            entry['exception'] = record.exc_text
+        return json.dumps(entry, default=str)
+
+
+class _NonBlockingQueueHandler(QueueHandler):
+    """QueueHandler that keeps the record's fields so listeners can format it as JSON"""
+
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        record = copy.copy(record)
+        record.message = record.getMessage()
+        if record.exc_info and not record.exc_text:
+            record.exc_text = logging.Formatter().formatException(record.exc_info)
+        record.msg = record.message
+        record.args = None
+        record.exc_info = None
+        return record
+
+
+class FanoutHandler(logging.Handler):
+    """Hands batches of log entries to a network sink on a dedicated thread.
+
+    ``emit`` only enqueues, so a slow or stuck sink (e.g. Socket.IO clients)
+    costs the listener nothing. Entries arriving within ``interval`` seconds
+    are coalesced into one sink call, so a burst of thousands of lines means
+    a few batches rather than thousands of messages; when the sink falls
+    behind by ``capacity`` entries the oldest are dropped.
+    """
+
+    def __init__(self, sink: Callable[[List[Dict]], None], capacity: int = 1000,
+                 interval: float = 0.25, level=logging.NOTSET):
+        super().__init__(level)
+        self.sink = sink
+        self.interval = interval
+        self.entries = DropOldestQueue(capacity)
+        self._thread = threading.Thread(target=self._run, name='log-fanout', daemon=True)
+        self._thread.start()
+
+    def emit(self, record: logging.LogRecord):
+        try:
+            self.entries.put_nowait({
+                'timestamp': datetime.fromtimestamp(record.created).strftime('%H:%M:%S'),
+                'level': record.levelname,
+                'message': self.format(record),
+                'id': int(record.created * 1000)
+            })
+        except Exception:
+            self.handleError(record)
+
+    def _run(self):
+        while True:
+            batch = [self.entries.get()]
+            # Let the rest of a burst arrive, then send it all at once
+            time.sleep(self.interval)
+            while True:
+                try:
+                    batch.append(self.entries.get_nowait())
+                except queue.Empty:
+                    break
+
+            closing = None in batch
+            batch = [entry for entry in batch if entry is not None]
+            if batch:
+                try:
+                    self.sink(batch)
+                except Exception:
+                    pass  # A failing client must not stop the fan-out
+            if closing:
+                return
+
+    def close(self):
+        self.entries.put_nowait(None)
+        super().close()
+
+
+def configure_logging(level: str = 'INFO', log_file: str = 'middleware.log', max_bytes: int = 10 * 1024 * 1024,
+                      backup_count: int = 5, console: bool = True, queue_size: int = 10000) -> QueueListener:
+    """Route the root logger through a non-blocking queue.
+
+    The first call installs the queue and listener; later calls only adjust
+    the level, so the web backend and the middleware can both call it.
+    """
+    global _listener, _queue_handler
+    root = logging.getLogger()
+    root.setLevel(getattr(logging, str(level).upper(), logging.INFO))
+
+    with _lock:
+        if _listener is not None:
+            return _listener
+
+        handlers = []
+        if log_file:
+            file_handler = RotatingFileHandler(log_file, maxBytes=max_bytes, backupCount=backup_count,
+                                               encoding='utf-8')
+            file_handler.setFormatter(JsonFormatter())
+            handlers.append(file_handler)
+        if console:
+            console_handler = logging.StreamHandler()
+            console_handler.setFormatter(logging.Formatter('%(asctime)s - %(levelname)s - %(message)s'))
+            handlers.append(console_handler)
+
+        records = DropOldestQueue(queue_size)
+        _queue_handler = _NonBlockingQueueHandler(records)
+        root.addHandler(_queue_handler)
+        _listener = QueueListener(records, *handlers, respect_handler_level=True)
+        _listener.start()
+        atexit.register(shutdown_logging)
+        return _listener
+
+
+def add_fanout(sink: Callable[[List[Dict]], None], capacity: int = 1000, interval: float = 0.25,
+               formatter: logging.Formatter = None) -> FanoutHandler:
+    """Deliver log entries to ``sink`` in batches, at most once per ``interval``, on its own thread"""
+    listener = _listener or configure_logging()
+    handler = FanoutHandler(sink, capacity, interval)
+    handler.setFormatter(formatter or logging.Formatter('%(name)s - %(message)s'))
+    with _lock:
+        listener.handlers = listener.handlers + (handler,)
+    return handler
+
+
+def dropped_records() -> int:
+    """Records discarded because the logging queue was full"""
+    return _queue_handler.queue.dropped if _queue_handler else 0
+
+
+def shutdown_logging():
+    """Flush queued records and stop the listener"""
+    global _listener, _queue_handler
+    with _lock:
+        listener, handler = _listener, _queue_handler
+        _listener = _queue_handler = None
+    if listener is None:
+        return
+    logging.getLogger().removeHandler(handler)
+    listener.stop()
+    for target in listener.handlers:
+        target.close()
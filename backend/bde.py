@@ -21,17 +21,29 @@
 
 
 
-import sqlite3
 import os
 from datetime import datetime
 from flask import Flask, render_template, request, jsonify, redirect, url_for, send_file
 from flask_socketio import SocketIO, emit
+import base64
+import configparser
 import json
 import logging
+import math
+import threading
+
+import requests
+
+from filecache import FileCache
+from lookups import LookupCatalog
+from middleware import BigcapitalClient, PaperlessNGXClient
+from sqlitepool import SQLitePool
+from webserver import socketio_options
 
 app = Flask(__name__)
 app.config['SECRET_KEY'] = 'your-secret-key-here'
-socketio = SocketIO(app, cors_allowed_origins="*")
+# Threading in development; gevent and a shared message queue under serve.py
+socketio = SocketIO(app, cors_allowed_origins="*", **socketio_options('paperless-bigcapital-editor'))
 
 # Configure logging
 logging.basicConfig(level=logging.INFO)
@@ -40,11 +52,21 @@ logger = logging.getLogger(__name__)
 # Database setup
 DB_PATH = 'middleware.db'
 
+# WAL-mode SQLite: pooled read-only connections plus one serialized writer
+db = SQLitePool(DB_PATH, readers=8)
+
+CONFIG_PATH = 'config.ini'
+file_cache = None
+file_cache_lock = threading.Lock()
+lookups = None
+lookups_lock = threading.Lock()
+
 def init_database():
     """Initialize the SQLite database with required tables"""
-    conn = sqlite3.connect(DB_PATH)
-    cursor = conn.cursor()
-    
+    with db.write() as conn:
+        _create_schema(conn.cursor())
+
+def _create_schema(cursor):
     # Documents table
     cursor.execute('''
         CREATE TABLE IF NOT EXISTS documents (
@@ -100,6 +122,21 @@ def init_database():
         )
     ''')
     
+    # Composite indexes for the keyset-paginated, filtered document list;
+    # each ends in the (created_date, id) sort key so pages are index range scans
+    cursor.execute('CREATE INDEX IF NOT EXISTS idx_documents_created ON documents (created_date DESC, id DESC)')
+    cursor.execute('CREATE INDEX IF NOT EXISTS idx_documents_status ON documents (status, created_date DESC, id DESC)')
+    cursor.execute('CREATE INDEX IF NOT EXISTS idx_documents_type ON documents (document_type, created_date DESC, id DESC)')
+    cursor.execute('''
+        CREATE INDEX IF NOT EXISTS idx_documents_customer
+        ON documents (customer_name COLLATE NOCASE, created_date DESC, id DESC)
+    ''')
+    
+    # Stats read the last processed time through this instead of scanning
+    cursor.execute('CREATE INDEX IF NOT EXISTS idx_documents_status_modified ON documents (status, modified_date)')
+    
+    _create_counters(cursor)
+    
     # Insert sample data if tables are empty
     cursor.execute('SELECT COUNT(*) FROM documents')
     if cursor.fetchone()[0] == 0:
@@ -135,9 +172,82 @@ def init_database():
             INSERT INTO account_codes (code, name, account_type)
             VALUES (?, ?, ?)
         ''', sample_accounts)
+
+def _create_counters(cursor):
+    """Per-status and per-day document counters, kept current by triggers"""
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS status_counts (
+            status TEXT PRIMARY KEY,
+            count INTEGER NOT NULL DEFAULT 0
+        )
+    ''')
+    
+    # Documents that entered each status on each (UTC) day
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS daily_status_counts (
+            day DATE NOT NULL,
+            status TEXT NOT NULL,
+            count INTEGER NOT NULL DEFAULT 0,
+            PRIMARY KEY (day, status)
+        )
+    ''')
+    
+    cursor.execute('''
+        CREATE TRIGGER IF NOT EXISTS documents_counts_insert AFTER INSERT ON documents
+        BEGIN
+            INSERT INTO status_counts (status, count) VALUES (COALESCE(NEW.status, 'unknown'), 1)
+                ON CONFLICT (status) DO UPDATE SET count = count + 1;
+            INSERT INTO daily_status_counts (day, status, count) VALUES (DATE('now'), COALESCE(NEW.status, 'unknown'), 1)
+                ON CONFLICT (day, status) DO UPDATE SET count = count + 1;
+        END
+    ''')
+    
+    cursor.execute('''
+        CREATE TRIGGER IF NOT EXISTS documents_counts_update AFTER UPDATE OF status ON documents
+        WHEN OLD.status IS NOT NEW.status
+        BEGIN
+            UPDATE status_counts SET count = count - 1 WHERE status = COALESCE(OLD.status, 'unknown');
+            INSERT INTO status_counts (status, count) VALUES (COALESCE(NEW.status, 'unknown'), 1)
+                ON CONFLICT (status) DO UPDATE SET count = count + 1;
+            INSERT INTO daily_status_counts (day, status, count) VALUES (DATE('now'), COALESCE(NEW.status, 'unknown'), 1)
+                ON CONFLICT (day, status) DO UPDATE SET count = count + 1;
+        END
+    ''')
+    
+    cursor.execute('''
+        CREATE TRIGGER IF NOT EXISTS documents_counts_delete AFTER DELETE ON documents
+        BEGIN
+            UPDATE status_counts SET count = count - 1 WHERE status = COALESCE(OLD.status, 'unknown');
+        END
+    ''')
     
-    conn.commit()
-    conn.close()
+    # Counters added to an existing database start from its current contents
+    cursor.execute('SELECT COUNT(*) FROM status_counts')
+    if cursor.fetchone()[0] == 0:
+        _rebuild_counters(cursor)
+
+def _rebuild_counters(cursor):
+    """Recompute the counters from the documents table.
+
+    Daily counts are approximated by each document's last modification day,
+    since the day a document entered its status is not recorded elsewhere.
+    """
+    cursor.execute('DELETE FROM status_counts')
+    cursor.execute('DELETE FROM daily_status_counts')
+    cursor.execute('''
+        INSERT INTO status_counts (status, count)
+        SELECT COALESCE(status, 'unknown'), COUNT(*) FROM documents GROUP BY 1
+    ''')
+    cursor.execute('''
+        INSERT INTO daily_status_counts (day, status, count)
+        SELECT DATE(modified_date), COALESCE(status, 'unknown'), COUNT(*)
+        FROM documents WHERE modified_date IS NOT NULL GROUP BY 1, 2
+    ''')
+
+def rebuild_counters():
+    """Repair the dashboard counters, e.g. after editing documents with triggers disabled"""
+    with db.write() as conn:
+        _rebuild_counters(conn.cursor())
 
 # Initialize database on startup
 init_database()
@@ -147,59 +257,124 @@ def index():
     """Serve the main dashboard"""
     return render_template('dashboard.html')
 
+# Page size limits for /api/documents
+DEFAULT_PAGE_SIZE = 50
+MAX_PAGE_SIZE = 200
+
+def _encode_cursor(created_date, document_id):
+    """Opaque cursor pointing just past a row in (created_date, id) order"""
+    return base64.urlsafe_b64encode(json.dumps([created_date, document_id]).encode()).decode()
+
+def _decode_cursor(cursor):
+    try:
+        created_date, document_id = json.loads(base64.urlsafe_b64decode(cursor.encode()))
+        return str(created_date), int(document_id)
+    except (ValueError, TypeError):
+        raise ValueError(f"Invalid cursor: {cursor}")
+
+def _document_filters(args):
+    """SQL conditions and parameters for the status, type, customer and date filters"""
+    conditions, params = [], []
+    if args.get('status'):
+        conditions.append('status = ?')
+        params.append(args['status'].lower())
+    if args.get('type'):
+        conditions.append('document_type = ?')
+        params.append(args['type'].lower())
+    if args.get('customer'):
+        # Case-insensitive prefix match as a range, so the NOCASE customer index serves it
+        conditions.append('customer_name COLLATE NOCASE >= ? AND customer_name COLLATE NOCASE < ?')
+        params.extend([args['customer'], args['customer'] + '\U0010ffff'])
+    for name, operator in (('since', '>='), ('until', '<=')):
+        if args.get(name):
+            value = datetime.fromisoformat(args[name])
+            if name == 'until' and len(args[name]) == 10:
+                value = value.replace(hour=23, minute=59, second=59)  # A date includes the whole day
+            conditions.append(f'created_date {operator} ?')
+            params.append(value.strftime('%Y-%m-%d %H:%M:%S'))
+    return conditions, params
+
+# Columns selected for a row of the documents table
+DOCUMENT_SUMMARY_COLUMNS = '''id, paperless_id, title, document_type, customer_name, 
+               amount, status, created_date, file_type'''
+
+def _document_summary(row):
+    """A documents table row as shown by the dashboard"""
+    return {
+        'id': row[0],
+        'paperless_id': row[1],
+        'title': row[2],
+        'type': row[3].title(),
+        'customer': row[4] or 'Unknown',
+        'amount': f'${row[5]:.2f}' if row[5] else '$0.00',
+        'status': row[6],
+        'date': row[7][:10] if row[7] else '',
+        'file_type': row[8] or 'pdf'
+    }
+
 @app.route('/api/documents')
 def get_documents():
-    """Get all documents for the documents table"""
-    conn = sqlite3.connect(DB_PATH)
-    cursor = conn.cursor()
-    
-    cursor.execute('''
-        SELECT id, paperless_id, title, document_type, customer_name, 
-               amount, status, created_date, file_type
+    """One page of documents, newest first.
+
+    Filters: ``status``, ``type``, ``customer`` (name prefix), ``since`` and
+    ``until`` (ISO dates). Pages are keyset-paginated: pass the
+    ``X-Next-Cursor`` header (also in the ``Link`` header) back as ``cursor``.
+    Responses carry an ETag, so an unchanged page answers 304.
+    """
+    try:
+        limit = min(max(int(request.args.get('limit', DEFAULT_PAGE_SIZE)), 1), MAX_PAGE_SIZE)
+        conditions, params = _document_filters(request.args)
+        if request.args.get('cursor'):
+            created_date, document_id = _decode_cursor(request.args['cursor'])
+            conditions.append('(created_date, id) < (?, ?)')
+            params.extend([created_date, document_id])
+    except ValueError as e:
+        return jsonify({'success': False, 'error': str(e)}), 400
+    
+    where = f"WHERE {' AND '.join(conditions)}" if conditions else ''
+    # One extra row tells whether there is a next page
+    rows = db.query(f'''
+        SELECT {DOCUMENT_SUMMARY_COLUMNS}
         FROM documents 
-        ORDER BY created_date DESC
-    ''')
-    
-    documents = []
-    for row in cursor.fetchall():
-        documents.append({
-            'id': row[0],
-            'paperless_id': row[1],
-            'title': row[2],
-            'type': row[3].title(),
-            'customer': row[4] or 'Unknown',
-            'amount': f'${row[5]:.2f}' if row[5] else '$0.00',
-            'status': row[6],
-            'date': row[7][:10] if row[7] else '',
-            'file_type': row[8] or 'pdf'
-        })
-    
-    conn.close()
-    return jsonify(documents)
+        {where}
+        ORDER BY created_date DESC, id DESC
+        LIMIT ?
+    ''', params + [limit + 1])
+    
+    documents = [_document_summary(row) for row in rows[:limit]]
+    
+    response = jsonify(documents)
+    if len(rows) > limit:
+        last = rows[limit - 1]
+        next_cursor = _encode_cursor(last['created_date'], last['id'])
+        args = request.args.to_dict()
+        args['cursor'] = next_cursor
+        response.headers['X-Next-Cursor'] = next_cursor
+        response.headers['Link'] = f'<{url_for("get_documents", **args)}>; rel="next"'
+    
+    # Polling clients revalidate; an unchanged page costs a 304 with no body
+    response.headers['Cache-Control'] = 'no-cache'
+    response.add_etag()
+    return response.make_conditional(request)
 
 @app.route('/document/edit/<int:document_id>')
 def edit_document(document_id):
     """Render the document editor page"""
-    conn = sqlite3.connect(DB_PATH)
-    cursor = conn.cursor()
-    
-    # Get document details
-    cursor.execute('''
-        SELECT id, paperless_id, title, content, document_type, customer_name,
-               amount, status, file_path, file_type, bigcapital_account_code,
-               bigcapital_customer_id, tags, created_date, modified_date
-        FROM documents WHERE id = ?
-    ''', (document_id,))
-    
-    document = cursor.fetchone()
-    if not document:
-        return "Document not found", 404
-    
-    # Get account codes for dropdown
-    cursor.execute('SELECT code, name, account_type FROM account_codes WHERE is_active = TRUE ORDER BY code')
-    account_codes = cursor.fetchall()
+    with db.read() as conn:
+        # Get document details
+        document = conn.execute('''
+            SELECT id, paperless_id, title, content, document_type, customer_name,
+                   amount, status, file_path, file_type, bigcapital_account_code,
+                   bigcapital_customer_id, tags, created_date, modified_date
+            FROM documents WHERE id = ?
+        ''', (document_id,)).fetchone()
+        
+        if not document:
+            return "Document not found", 404
     
-    conn.close()
+    # Account codes for the dropdown, from memory
+    account_codes = [(account['code'], account['name'], account['account_type'])
+                     for account in get_lookups().index('accounts').records]
     
     doc_data = {
         'id': document[0],
@@ -226,91 +401,284 @@ def save_document(document_id):
     """Save document changes"""
     data = request.json
     
-    conn = sqlite3.connect(DB_PATH)
-    cursor = conn.cursor()
-    
     try:
-        cursor.execute('''
-            UPDATE documents 
-            SET document_type = ?, customer_name = ?, amount = ?, 
-                bigcapital_account_code = ?, bigcapital_customer_id = ?,
-                tags = ?, modified_date = CURRENT_TIMESTAMP
-            WHERE id = ?
-        ''', (
-            data.get('document_type'),
-            data.get('customer_name'),
-            data.get('amount'),
-            data.get('bigcapital_account_code'),
-            data.get('bigcapital_customer_id'),
-            data.get('tags'),
-            document_id
-        ))
-        
-        conn.commit()
-        
-        # Log the update
-        cursor.execute('''
-            INSERT INTO logs (level, message, document_id)
-            VALUES (?, ?, ?)
-        ''', ('INFO', f'Document {document_id} updated successfully', document_id))
-        
-        conn.commit()
-        conn.close()
+        with db.write() as conn:
+            _update_document(conn, document_id, data)
         
         return jsonify({'success': True, 'message': 'Document updated successfully'})
         
     except Exception as e:
-        conn.rollback()
-        conn.close()
         logger.error(f"Error saving document {document_id}: {str(e)}")
         return jsonify({'success': False, 'error': str(e)}), 500
 
-@app.route('/api/document/<int:document_id>/file')
-def get_document_file(document_id):
-    """Serve document file (PDF/image)"""
-    conn = sqlite3.connect(DB_PATH)
-    cursor = conn.cursor()
+def _update_document(conn, document_id, data):
+    """Apply editor changes to one document and log it, inside the caller's transaction"""
+    conn.execute('''
+        UPDATE documents 
+        SET document_type = ?, customer_name = ?, amount = ?, 
+            bigcapital_account_code = ?, bigcapital_customer_id = ?,
+            tags = ?, modified_date = CURRENT_TIMESTAMP
+        WHERE id = ?
+    ''', (
+        data.get('document_type'),
+        data.get('customer_name'),
+        data.get('amount'),
+        data.get('bigcapital_account_code'),
+        data.get('bigcapital_customer_id'),
+        data.get('tags'),
+        document_id
+    ))
+    
+    # Log the update
+    conn.execute('''
+        INSERT INTO logs (level, message, document_id)
+        VALUES (?, ?, ?)
+    ''', ('INFO', f'Document {document_id} updated successfully', document_id))
+
+def get_file_cache():
+    """Cache of document files fetched from Paperless-NGX, created on first use"""
+    global file_cache
+    with file_cache_lock:
+        if file_cache is None:
+            config = configparser.ConfigParser()
+            config.read(CONFIG_PATH)
+            paperless = PaperlessNGXClient(config.get('paperless', 'url', fallback='http://localhost:8000'),
+                                           config.get('paperless', 'token', fallback=''))
+            file_cache = FileCache(
+                config.get('web_interface', 'file_cache_dir', fallback='file_cache'),
+                config.getint('web_interface', 'file_cache_max_mb', fallback=512) * 1024 * 1024,
+                paperless.stream_document_file,
+                max_age=config.getint('web_interface', 'file_cache_max_age', fallback=3600)
+            )
+        return file_cache
+
+def _account_records(accounts):
+    """Typeahead records for active Bigcapital accounts that have a code, by code"""
+    records = [{'code': str(account['code']), 'name': account.get('name', ''),
+                'account_type': account.get('account_type') or ''}
+               for account in accounts if account.get('code') and account.get('active', True)]
+    return sorted(records, key=lambda record: record['code'])
+
+def _customer_records(customers):
+    """Typeahead records for Bigcapital customers, by name"""
+    records = [{'id': customer['id'], 'name': customer.get('display_name') or customer.get('name', ''),
+                'email': customer.get('email') or ''}
+               for customer in customers]
+    return sorted(records, key=lambda record: record['name'].lower())
+
+def get_lookups():
+    """Account and customer typeahead indexes, synced from Bigcapital in the background"""
+    global lookups
+    with lookups_lock:
+        if lookups is None:
+            config = configparser.ConfigParser()
+            config.read(CONFIG_PATH)
+            bigcapital = BigcapitalClient(config.get('bigcapital', 'url', fallback='http://localhost:3000'),
+                                          config.get('bigcapital', 'token', fallback=''))
+            lookups = LookupCatalog(
+                {
+                    'accounts': (lambda: _account_records(bigcapital.list_accounts()), ('code', 'name')),
+                    'customers': (lambda: _customer_records(bigcapital.list_customers()), ('name', 'email'))
+                },
+                interval=config.getint('web_interface', 'lookup_sync_interval', fallback=300)
+            )
+            # The local chart of accounts serves until Bigcapital answers
+            lookups.seed('accounts', [dict(row) for row in db.query(
+                'SELECT code, name, account_type FROM account_codes WHERE is_active = TRUE ORDER BY code')])
+            lookups.start()
+        return lookups
+
+@app.route('/api/lookup/<catalogue>')
+def lookup(catalogue):
+    """Typeahead search of Bigcapital accounts or customers by prefix, answered from memory"""
+    if catalogue not in ('accounts', 'customers'):
+        return jsonify({'error': f'Unknown lookup {catalogue}'}), 404
+    try:
+        limit = min(max(int(request.args.get('limit', 20)), 1), 100)
+    except ValueError:
+        return jsonify({'error': 'limit must be an integer'}), 400
+    
+    index = get_lookups().index(catalogue)
+    response = jsonify({'version': index.version,
+                        'results': index.search(request.args.get('q', ''), limit)})
+    # Repeated keystrokes are answered by the browser cache; after that a 304 until the next sync
+    response.headers['Cache-Control'] = 'private, max-age=60'
+    response.add_etag()
+    return response.make_conditional(request)
+
+# Fields a bulk edit may change, and the document types the editor offers
+BULK_EDIT_FIELDS = ('document_type', 'customer_name', 'amount', 'bigcapital_account_code',
+                    'bigcapital_customer_id', 'tags')
+DOCUMENT_TYPES = ('invoice', 'invoice_ar', 'receipt')
+BULK_TEXT_FIELDS = ('customer_name', 'bigcapital_account_code', 'tags')
+MAX_BULK_EDITS = 1000
+
+# Version of the documents diffs sent to Socket.IO clients
+documents_version = 0
+documents_version_lock = threading.Lock()
+
+def _is_integer(value):
+    """JSON integers only: bool is an int subclass in Python but not an id"""
+    return isinstance(value, int) and not isinstance(value, bool)
+
+def _validate_edit(edit, known_ids, account_codes):
+    """Error message for an invalid bulk edit, or None"""
+    if not isinstance(edit, dict) or not _is_integer(edit.get('id')):
+        return 'Each edit needs an integer id'
+    if edit['id'] not in known_ids:
+        return 'Document not found'
+    fields = set(edit) - {'id'}
+    if not fields:
+        return 'Nothing to change'
+    unknown = fields - set(BULK_EDIT_FIELDS)
+    if unknown:
+        return f"Unknown fields: {', '.join(sorted(unknown))}"
+    if 'document_type' in fields and edit['document_type'] not in DOCUMENT_TYPES:
+        return f"Unknown document type: {edit['document_type']}"
+    for field in fields & set(BULK_TEXT_FIELDS):
+        if edit[field] is not None and not isinstance(edit[field], str):
+            return f"{field} must be a string or null"
+    amount = edit.get('amount')
+    if amount is not None and not (isinstance(amount, (int, float)) and not isinstance(amount, bool)
+                                   and math.isfinite(amount)):
+        return 'amount must be a number or null'
+    customer_id = edit.get('bigcapital_customer_id')
+    if customer_id is not None and not _is_integer(customer_id):
+        return 'bigcapital_customer_id must be an integer or null'
+    if edit.get('bigcapital_account_code') and edit['bigcapital_account_code'] not in account_codes:
+        return f"Unknown account code: {edit['bigcapital_account_code']}"
+    return None
+
+@app.route('/api/documents/bulk-save', methods=['POST'])
+def bulk_save_documents():
+    """Apply many document edits in one transaction.
+
+    The body is ``{"documents": [{"id": 1, "bigcapital_account_code": "6100"}, ...]}``;
+    each edit changes only the fields it names. Invalid edits are reported
+    per row and skipped; the valid ones are saved together, and connected
+    clients get one ``documents_diff`` event for all of them.
+    """
+    global documents_version
+    body = request.get_json(silent=True)
+    if not isinstance(body, dict):
+        return jsonify({'success': False, 'error': 'Expected a JSON object with a "documents" list'}), 400
+    edits = body.get('documents')
+    if not isinstance(edits, list) or not edits:
+        return jsonify({'success': False, 'error': 'Expected a non-empty "documents" list'}), 400
+    if len(edits) > MAX_BULK_EDITS:
+        return jsonify({'success': False, 'error': f'At most {MAX_BULK_EDITS} edits per request'}), 400
+    
+    ids = [edit['id'] for edit in edits if isinstance(edit, dict) and _is_integer(edit.get('id'))]
+    results = []
+    valid = {}
+    account_codes = {account['code'] for account in get_lookups().index('accounts').records}
+    try:
+        with db.write() as conn:
+            known_ids = set()
+            for start in range(0, len(ids), 500):  # Stay under SQLite's bound-parameter limit
+                chunk = ids[start:start + 500]
+                known_ids.update(row[0] for row in conn.execute(
+                    f"SELECT id FROM documents WHERE id IN ({','.join('?' * len(chunk))})", chunk))
+            
+            for edit in edits:
+                error = _validate_edit(edit, known_ids, account_codes)
+                doc_id = edit.get('id') if isinstance(edit, dict) else None
+                if error:
+                    results.append({'id': doc_id, 'success': False, 'error': error})
+                else:
+                    valid[doc_id] = edit  # A later edit of the same document wins
+                    results.append({'id': doc_id, 'success': True})
+            
+            # One UPDATE statement per distinct set of changed fields
+            groups = {}
+            for doc_id, edit in valid.items():
+                fields = tuple(field for field in BULK_EDIT_FIELDS if field in edit)
+                groups.setdefault(fields, []).append(tuple(edit[field] for field in fields) + (doc_id,))
+            for fields, params in groups.items():
+                assignments = ', '.join(f'{field} = ?' for field in fields)
+                conn.executemany(
+                    f'UPDATE documents SET {assignments}, modified_date = CURRENT_TIMESTAMP WHERE id = ?', params)
+            
+            conn.executemany('''
+                INSERT INTO logs (level, message, document_id)
+                VALUES (?, ?, ?)
+            ''', [('INFO', f'Document {doc_id} updated in bulk edit', doc_id) for doc_id in valid])
+            
+            updated = []
+            valid_ids = list(valid)
+            for start in range(0, len(valid_ids), 500):
+                chunk = valid_ids[start:start + 500]
+                updated.extend(_document_summary(row) for row in conn.execute(
+                    f"SELECT {DOCUMENT_SUMMARY_COLUMNS} FROM documents WHERE id IN ({','.join('?' * len(chunk))})",
+                    chunk))
+    except Exception as e:
+        logger.error(f"Bulk save of {len(edits)} documents failed: {str(e)}")
+        return jsonify({'success': False, 'error': str(e)}), 500
     
-    cursor.execute('SELECT file_path, file_type FROM documents WHERE id = ?', (document_id,))
-    result = cursor.fetchone()
-    conn.close()
+    if updated:
+        with documents_version_lock:
+            documents_version += 1
+            diff = {'version': documents_version, 'base_version': documents_version - 1,
+                    'added': [], 'updated': updated, 'removed': []}
+        socketio.emit('documents_diff', diff)
     
+    saved = sum(1 for result in results if result['success'])
+    return jsonify({'success': saved == len(results), 'saved': saved,
+                    'failed': len(results) - saved, 'results': results})
+
+@app.route('/api/document/<int:document_id>/file')
+def get_document_file(document_id):
+    """Serve the document's file from Paperless-NGX through the local cache.
+
+    ``variant`` is ``preview`` (default, an archived PDF), ``download`` (the
+    original) or ``thumb``. Files are sent from disk with a strong ETag and
+    support Range and If-None-Match requests.
+    """
+    variant = request.args.get('variant', 'preview')
+    if variant not in PaperlessNGXClient.FILE_VARIANTS:
+        return jsonify({'success': False, 'error': f'Unknown variant: {variant}'}), 400
+    
+    result = db.query_one('SELECT paperless_id FROM documents WHERE id = ?', (document_id,))
     if not result:
         return "Document not found", 404
     
-    file_path, file_type = result
-    
-    # For demo purposes, we'll return a placeholder response
-    # In production, you'd serve the actual file
-    if file_type == 'pdf':
-        # Return a simple PDF placeholder or redirect to actual file
-        return f"PDF file would be served here: {file_path}", 200, {'Content-Type': 'application/pdf'}
-    else:
-        # Return image placeholder
-        return f"Image file would be served here: {file_path}", 200, {'Content-Type': 'image/jpeg'}
+    try:
+        cached = get_file_cache().get(result['paperless_id'], variant)
+    except requests.HTTPError as e:
+        status = e.response.status_code if e.response is not None else 502
+        logger.error(f"Paperless refused {variant} of document {document_id}: {str(e)}")
+        return jsonify({'success': False, 'error': str(e)}), 404 if status == 404 else 502
+    except requests.RequestException as e:
+        logger.error(f"Failed to fetch {variant} of document {document_id}: {str(e)}")
+        return jsonify({'success': False, 'error': str(e)}), 502
+    
+    # send_file hands the open file to the server (sendfile where supported)
+    # and answers Range and conditional requests itself
+    response = send_file(cached.path, mimetype=cached.mimetype, conditional=True,
+                         etag=cached.etag, max_age=300)
+    response.cache_control.public = False
+    response.cache_control.private = True
+    return response
 
 @app.route('/api/stats')
 def get_stats():
     """Get dashboard statistics"""
-    conn = sqlite3.connect(DB_PATH)
-    cursor = conn.cursor()
-    
-    # Get counts by status
-    cursor.execute("SELECT status, COUNT(*) FROM documents GROUP BY status")
-    status_counts = dict(cursor.fetchall())
-    
-    # Get today's processed count
-    cursor.execute("""
-        SELECT COUNT(*) FROM documents 
-        WHERE status = 'processed' AND DATE(modified_date) = DATE('now')
-    """)
-    processed_today = cursor.fetchone()[0]
-    
-    # Get last run time
-    cursor.execute("SELECT MAX(modified_date) FROM documents WHERE status = 'processed'")
-    last_run = cursor.fetchone()[0]
-    
-    conn.close()
+    with db.read() as conn:
+        # Get counts by status from the trigger-maintained counters
+        # Counters that dropped to zero stay as rows; skip them as get_processing_stats does
+        status_counts = {row[0]: row[1] for row in conn.execute(
+            "SELECT status, count FROM status_counts WHERE count > 0")}
+        
+        # Get today's processed count
+        row = conn.execute("""
+            SELECT count FROM daily_status_counts
+            WHERE day = DATE('now') AND status = 'processed'
+        """).fetchone()
+        processed_today = row[0] if row else 0
+        
+        # Get last run time (served by idx_documents_status_modified)
+        last_run = conn.execute(
+            "SELECT MAX(modified_date) FROM documents WHERE status = 'processed'").fetchone()[0]
     
     return jsonify({
         'processed': processed_today,
@@ -322,10 +690,7 @@ def get_stats():
 @app.route('/api/logs')
 def get_logs():
     """Get recent logs"""
-    conn = sqlite3.connect(DB_PATH)
-    cursor = conn.cursor()
-    
-    cursor.execute('''
+    rows = db.query('''
         SELECT timestamp, level, message, document_id
         FROM logs 
         ORDER BY timestamp DESC 
@@ -333,7 +698,7 @@ def get_logs():
     ''')
     
     logs = []
-    for row in cursor.fetchall():
+    for row in rows:
         logs.append({
             'timestamp': row[0],
             'level': row[1],
@@ -341,7 +706,6 @@ def get_logs():
             'document_id': row[3]
         })
     
-    conn.close()
     return jsonify(logs)
 
 
@@ -359,23 +723,16 @@ def handle_toggle_service(data):
 @socketio.on('save_config')
 def handle_save_config(data):
     # Save configuration to database
-    conn = sqlite3.connect(DB_PATH)
-    cursor = conn.cursor()
-    
     try:
         config_json = json.dumps(data)
-        cursor.execute('''
+        db.execute('''
             INSERT OR REPLACE INTO configuration (key, value)
             VALUES (?, ?)
         ''', ('main_config', config_json))
         
-        conn.commit()
-        conn.close()
-        
         emit('config_saved', {'success': True})
         
     except Exception as e:
-        conn.close()
         emit('config_saved', {'success': False, 'error': str(e)})
 
 if __name__ == '__main__':
@@ -12,23 +12,32 @@ from flask import Flask, render_template, jsonify, request, Response
 from flask_socketio import SocketIO, emit
 import json
 import os
-import threading
-import time
 import logging
 from datetime import datetime
 import configparser
 from pathlib import Path
 import sys
+import threading
 from typing import Dict, List, Optional
-import queue
 import io
 
 # Import the middleware classes
+from asynclog import LogHub, LogRing, add_fanout, configure_logging
+from logexport import LogExport, gzip_chunks, parse_range
+from docview import DocumentView, document_entry
+from health import HealthMonitor
+from jobs import JobScheduler
+import metrics
+import tracing
+from profiling import CycleProfiler
 from middleware import PaperlessBigcapitalMiddleware, MiddlewareConfig
+from webhooks import HOOK_PATH, WebhookDebouncer, parse_webhook_payload
+from webserver import socketio_options
 
 app = Flask(__name__)
 app.config['SECRET_KEY'] = 'your-secret-key-here'
-socketio = SocketIO(app, cors_allowed_origins="*")
+# Threading in development; gevent and a shared message queue under serve.py
+socketio = SocketIO(app, cors_allowed_origins="*", **socketio_options('paperless-bigcapital-dashboard'))
 
 # Global state
 middleware_state = {
@@ -39,8 +48,6 @@ middleware_state = {
         'pending': 0,
         'last_run': None
     },
-    'logs': [],
-    'documents': [],
     'services': {
         'paperless': 'unknown',
         'bigcapital': 'unknown',
@@ -50,55 +57,50 @@ middleware_state = {
 
 # Global middleware instance
 middleware_instance = None
-middleware_thread = None
-log_queue = queue.Queue(maxsize=1000)
+# Set while the background worker task runs; a thread, or a green thread under gevent
+middleware_worker_active = False
+log_hub = LogHub(history=1000, subscriber_buffer=500)
+recent_logs = LogRing(capacity=500)
+
+# Recently finished documents, kept current from pipeline outcomes
+document_view = DocumentView(limit=200)
+# Held across apply and emit so diffs leave in version order
+document_publish_lock = threading.Lock()
+
+# Log entries are pushed to browsers in batches at most this often (seconds)
+LOG_BATCH_INTERVAL = 0.25
+webhook_debouncer = None
 
-class QueueLogHandler(logging.Handler):
-    """Custom log handler that puts log records into a queue"""
+# Probes Paperless-NGX and Bigcapital in the background for /api/status
+health_monitor = None
+
+# Armed through /api/profile/start; costs nothing otherwise
+cycle_profiler = CycleProfiler()
+
+def publish_log_entries(entries):
+    """Fan a batch of log entries out to the live stream, recent logs and WebSocket clients.
+
+    Runs on the logging fan-out thread at most every LOG_BATCH_INTERVAL
+    seconds, never on the thread that logged.
+    """
+    # Broadcast to every live log stream
+    log_hub.publish(entries)
     
-    def __init__(self, log_queue):
-        super().__init__()
-        self.log_queue = log_queue
+    recent_logs.extend(entries)
     
-    def emit(self, record):
-        try:
-            log_entry = {
-                'timestamp': datetime.fromtimestamp(record.created).strftime('%H:%M:%S'),
-                'level': record.levelname,
-                'message': self.format(record),
-                'id': int(record.created * 1000)
-            }
-            
-            # Add to our log queue for real-time streaming
-            if not self.log_queue.full():
-                self.log_queue.put(log_entry)
-            
-            # Add to middleware state logs (keep last 50)
-            middleware_state['logs'].insert(0, log_entry)
-            if len(middleware_state['logs']) > 50:
-                middleware_state['logs'] = middleware_state['logs'][:50]
-            
-            # Emit to WebSocket clients
-            socketio.emit('log_update', log_entry)
-            
-        except Exception:
-            pass  # Ignore errors in log handler
+    # One event per batch, newest entry first like /api/logs
+    socketio.emit('log_batch', {'entries': entries[::-1]})
 
 def setup_logging():
-    """Setup logging with queue handler for real-time log streaming"""
-    # Create custom handler
-    queue_handler = QueueLogHandler(log_queue)
-    queue_handler.setFormatter(logging.Formatter('%(name)s - %(message)s'))
-    
-    # Setup root logger
-    root_logger = logging.getLogger()
-    root_logger.setLevel(logging.INFO)
-    root_logger.addHandler(queue_handler)
-    
-    # Also setup file logging
-    file_handler = logging.FileHandler('middleware.log')
-    file_handler.setFormatter(logging.Formatter('%(asctime)s - %(levelname)s - %(message)s'))
-    root_logger.addHandler(file_handler)
+    """Setup non-blocking logging with a fan-out thread for real-time log streaming"""
+    processing = load_ini_config().get('processing', {})
+    configure_logging(
+        level=processing.get('log_level', 'INFO'),
+        log_file=processing.get('log_file', 'middleware.log'),
+        max_bytes=int(processing.get('log_max_bytes', 10 * 1024 * 1024)),
+        backup_count=int(processing.get('log_backup_count', 5))
+    )
+    add_fanout(publish_log_entries, interval=LOG_BATCH_INTERVAL)
 
 def load_ini_config(config_path='config.ini'):
     """Load configuration from INI file"""
@@ -161,129 +163,180 @@ def initialize_middleware():
     """Initialize the middleware instance"""
     global middleware_instance
     try:
+        previous = middleware_instance
         middleware_instance = PaperlessBigcapitalMiddleware('config.ini')
+        middleware_instance.outcome_listeners.append(publish_document_outcome)
+        if previous:
+            previous.close()
+        start_health_monitor().request_refresh()
         return True
     except Exception as e:
         logging.error(f"Failed to initialize middleware: {str(e)}")
         return False
 
+def flush_webhook_documents(doc_ids):
+    """Enqueue documents announced by Paperless once their events have settled"""
+    if middleware_instance:
+        middleware_instance.enqueue_document_ids(doc_ids)
+
+def start_webhook_debouncer():
+    """Start the debouncer that coalesces Paperless webhook events"""
+    global webhook_debouncer
+    if webhook_debouncer is None:
+        config = middleware_instance.config
+        webhook_debouncer = WebhookDebouncer(
+            flush_webhook_documents,
+            debounce_seconds=float(config.get('paperless', 'webhook_debounce', '5')),
+            max_wait_seconds=float(config.get('paperless', 'webhook_max_wait', '30'))
+        )
+        webhook_debouncer.start()
+    return webhook_debouncer
+
+def probe_paperless():
+    """Health probe for Paperless-NGX through the current middleware instance"""
+    if not middleware_instance:
+        raise RuntimeError('Middleware not initialized')
+    middleware_instance.paperless.ping()
+
+def probe_bigcapital():
+    """Health probe for Bigcapital through the current middleware instance"""
+    if not middleware_instance:
+        raise RuntimeError('Middleware not initialized')
+    middleware_instance.bigcapital.ping()
+
+def start_health_monitor():
+    """Start probing the external services in the background"""
+    global health_monitor
+    if health_monitor is None:
+        interval = middleware_instance.config.getint('processing', 'health_interval', 30) if middleware_instance else 30
+        health_monitor = HealthMonitor(
+            {'paperless': probe_paperless, 'bigcapital': probe_bigcapital},
+            interval=interval,
+            ttl=interval * 3
+        )
+        health_monitor.start()
+    return health_monitor
+
+def apply_web_settings(changed):
+    """Update the web backend's own helpers after a config reload"""
+    config = middleware_instance.config
+    if health_monitor and 'processing.health_interval' in changed:
+        health_monitor.interval = config.getint('processing', 'health_interval', 30)
+        health_monitor.ttl = health_monitor.interval * 3
+        health_monitor.request_refresh()
+    if webhook_debouncer and {'paperless.webhook_debounce', 'paperless.webhook_max_wait'} & set(changed):
+        webhook_debouncer.debounce_seconds = float(config.get('paperless', 'webhook_debounce', '5'))
+        webhook_debouncer.max_wait_seconds = max(float(config.get('paperless', 'webhook_max_wait', '30')),
+                                                 webhook_debouncer.debounce_seconds)
+
+def shutdown():
+    """Stop the background helpers and close the middleware once the server has exited"""
+    middleware_state['is_running'] = False
+    job_scheduler.stop(timeout=60)
+    if webhook_debouncer:
+        webhook_debouncer.stop()
+    if health_monitor:
+        health_monitor.stop()
+    if middleware_instance:
+        middleware_instance.close()
+
 def check_service_connections():
-    """Check the status of external services"""
+    """Status of external services from the cached health probes; never blocks on I/O"""
     services = {
         'paperless': 'unknown',
         'bigcapital': 'unknown',
         'middleware': 'stopped'
     }
     
-    if middleware_instance:
-        try:
-            # Test Paperless connection
-            docs = middleware_instance.paperless.get_documents()
-            services['paperless'] = 'connected'
-        except Exception:
-            services['paperless'] = 'error'
-        
-        try:
-            # Test Bigcapital connection (we'll try to get customers)
-            # This is a simple connection test
-            services['bigcapital'] = 'connected'  # Simplified for now
-        except Exception:
-            services['bigcapital'] = 'error'
-        
+    if middleware_instance and health_monitor:
+        services.update(health_monitor.statuses())
         services['middleware'] = 'active' if middleware_state['is_running'] else 'stopped'
     
     middleware_state['services'] = services
     return services
 
-def update_documents_list():
-    """Update the documents list from Paperless"""
-    if middleware_instance:
-        try:
-            # Get recent documents with invoice/receipt tags
-            invoice_docs = middleware_instance.paperless.get_documents(
-                tags=middleware_instance.invoice_tags
-            )
-            receipt_docs = middleware_instance.paperless.get_documents(
-                tags=middleware_instance.receipt_tags
-            )
-            
-            documents = []
-            
-            # Process invoice documents
-            for doc in invoice_docs[:10]:  # Limit to recent 10
-                doc_tags = [tag['name'] for tag in doc.get('tags', [])]
-                status = 'processed' if middleware_instance.processed_tag in doc_tags else \
-                        'error' if middleware_instance.error_tag in doc_tags else 'pending'
-                
-                documents.append({
-                    'id': doc['id'],
-                    'type': 'Invoice',
-                    'title': doc.get('title', f"Document {doc['id']}"),
-                    'correspondent': doc.get('correspondent', {}).get('name', 'Unknown') if doc.get('correspondent') else 'Unknown',
-                    'status': status,
-                    'date': doc.get('created', '').split('T')[0] if doc.get('created') else ''
-                })
-            
-            # Process receipt documents
-            for doc in receipt_docs[:10]:  # Limit to recent 10
-                doc_tags = [tag['name'] for tag in doc.get('tags', [])]
-                status = 'processed' if middleware_instance.processed_tag in doc_tags else \
-                        'error' if middleware_instance.error_tag in doc_tags else 'pending'
-                
-                documents.append({
-                    'id': doc['id'],
-                    'type': 'Receipt',
-                    'title': doc.get('title', f"Document {doc['id']}"),
-                    'correspondent': doc.get('correspondent', {}).get('name', 'Unknown') if doc.get('correspondent') else 'Unknown',
-                    'status': status,
-                    'date': doc.get('created', '').split('T')[0] if doc.get('created') else ''
-                })
-            
-            middleware_state['documents'] = documents
-            
-        except Exception as e:
-            logging.error(f"Failed to update documents list: {str(e)}")
+def publish_document_outcome(item, outcome):
+    """Outcome listener: update the document view and push the change to the dashboard"""
+    job_scheduler.record_outcome(outcome)
+    if outcome == 'skipped':
+        return  # Finished elsewhere; a row without extracted data would hide the real one
+    # Outcomes arrive from several tag workers at once; emitting outside the
+    # lock would let version N+1 overtake N and force clients to resync
+    with document_publish_lock:
+        diff = document_view.apply([document_entry(item, outcome)])
+        if diff:
+            socketio.emit('documents_diff', diff)
+
+def run_cycle(kind):
+    """Run one processing cycle; only ever called by the job scheduler, one at a time"""
+    if not middleware_instance:
+        raise RuntimeError('Middleware not initialized')
+    
+    with cycle_profiler.cycle():
+        if kind == 'sweep':
+            logging.info("Starting middleware processing cycle...")
+            middleware_instance.process_documents()
+        else:
+            logging.info("Processing documents announced by webhook...")
+            middleware_instance.drain_queue()
+    
+    # Update stats (simplified)
+    middleware_state['stats']['last_run'] = datetime.now().strftime('%H:%M:%S')
+    socketio.emit('stats_update', middleware_state['stats'])
+
+# Runs every processing cycle, so manual, scheduled and webhook cycles never overlap
+job_scheduler = JobScheduler(run_cycle)
 
 def middleware_worker():
-    """Background worker that runs the middleware processing"""
-    global middleware_instance
+    """Background worker that schedules the middleware processing cycles.
+
+    Started with ``socketio.start_background_task`` and only ever waits on
+    events and ``socketio.sleep``, so it cooperates with the async servers.
+    """
+    global middleware_worker_active
+    try:
+        _schedule_cycles()
+    finally:
+        middleware_worker_active = False
+
+def _schedule_cycles():
+    # Full sweeps run on the polling interval; webhook wakeups only drain the queue
+    sweep = True
     
     while middleware_state['is_running']:
         try:
             if middleware_instance:
-                logging.info("Starting middleware processing cycle...")
-                
-                # Process documents
-                middleware_instance.process_documents()
-                
-                # Update stats (simplified)
-                middleware_state['stats']['last_run'] = datetime.now().strftime('%H:%M:%S')
-                
-                # Update documents list
-                update_documents_list()
+                job = job_scheduler.submit('sweep' if sweep else 'drain',
+                                           trigger='schedule' if sweep else 'webhook')
+                job.wait()
+                if job.status == 'failed':
+                    raise RuntimeError(job.error)
                 
                 # Update service connections
                 check_service_connections()
                 
                 # Emit updates
-                socketio.emit('stats_update', middleware_state['stats'])
                 socketio.emit('status_change', {'is_running': middleware_state['is_running']})
                 
-                # Wait for configured interval
-                interval = middleware_instance.config.getint('processing', 'check_interval', 300)
+                # Wait for configured interval or a webhook wakeup
+                interval = middleware_instance.polling_interval()
                 logging.info(f"Waiting {interval} seconds until next cycle...")
                 
-                # Sleep in small chunks to allow for stopping
+                # Wait in small chunks to allow for stopping
+                sweep = True
                 for _ in range(interval):
                     if not middleware_state['is_running']:
                         break
-                    time.sleep(1)
+                    if middleware_instance.wakeup.wait(1):
+                        middleware_instance.wakeup.clear()
+                        sweep = False
+                        break
             else:
-                time.sleep(5)  # Wait if middleware not initialized
+                socketio.sleep(5)  # Wait if middleware not initialized
                 
         except Exception as e:
             logging.error(f"Error in middleware worker: {str(e)}")
-            time.sleep(30)  # Wait 30 seconds on error
+            socketio.sleep(30)  # Wait 30 seconds on error
 
 # Routes
 @app.route('/')
@@ -293,17 +346,32 @@ def index():
 @app.route('/api/status')
 def get_status():
     """Get current middleware status"""
-    check_service_connections()
+    scheduler = middleware_instance.scheduler if middleware_instance else None
     return jsonify({
         'is_running': middleware_state['is_running'],
         'stats': middleware_state['stats'],
-        'services': middleware_state['services']
+        'services': check_service_connections(),
+        'health': health_monitor.snapshot() if health_monitor else None,
+        'polling': scheduler.snapshot() if scheduler else None
     })
 
+@app.route('/health')
+def health():
+    """Liveness check for the container; upstream outages are reported, not failed on"""
+    return jsonify({
+        'status': 'ok',
+        'services': check_service_connections()
+    })
+
+@app.route('/metrics')
+def get_metrics():
+    """Prometheus scrape endpoint"""
+    return Response(metrics.render(), mimetype=metrics.CONTENT_TYPE)
+
 @app.route('/api/start', methods=['POST'])
 def start_middleware():
     """Start the middleware processing"""
-    global middleware_thread
+    global middleware_worker_active
     
     if not middleware_instance:
         if not initialize_middleware():
@@ -312,10 +380,10 @@ def start_middleware():
     if not middleware_state['is_running']:
         middleware_state['is_running'] = True
         
-        # Start background thread
-        if middleware_thread is None or not middleware_thread.is_alive():
-            middleware_thread = threading.Thread(target=middleware_worker, daemon=True)
-            middleware_thread.start()
+        # Start the background worker unless it is still winding down
+        if not middleware_worker_active:
+            middleware_worker_active = True
+            socketio.start_background_task(middleware_worker)
         
         logging.info("Middleware started")
         socketio.emit('status_change', {'is_running': True})
@@ -333,34 +401,106 @@ def stop_middleware():
 
 @app.route('/api/documents')
 def get_documents():
-    """Get list of recent documents"""
-    update_documents_list()
-    return jsonify(middleware_state['documents'])
+    """Get recent documents with the view version clients apply diffs on top of"""
+    return jsonify(document_view.snapshot())
+
+@app.route('/api/queue')
+def get_queue():
+    """Get work queue depth and which workers hold leases"""
+    if not middleware_instance:
+        return jsonify({'success': False, 'message': 'Middleware not initialized'}), 500
+    
+    try:
+        work_queue = middleware_instance.work_queue
+        return jsonify({
+            'worker_id': work_queue.worker_id,
+            'depth': work_queue.depth(),
+            'owners': work_queue.owners()
+        })
+    except Exception as e:
+        return jsonify({'success': False, 'message': str(e)}), 500
+
+@app.route('/api/dead-letters')
+def get_dead_letters():
+    """List documents that failed permanently or ran out of retries"""
+    if not middleware_instance:
+        return jsonify({'success': False, 'message': 'Middleware not initialized'}), 500
+    
+    try:
+        limit = request.args.get('limit', 100, type=int)
+        return jsonify(middleware_instance.work_queue.dead_letters(limit))
+    except Exception as e:
+        return jsonify({'success': False, 'message': str(e)}), 500
+
+@app.route('/api/trace/<int:doc_id>')
+def get_trace(doc_id):
+    """Span waterfall of a recent document's processing attempts (?format=text for a chart)"""
+    traces = tracing.TRACER.waterfall(doc_id)
+    if not traces:
+        return jsonify({'success': False, 'message': f'No recent trace for document {doc_id}'}), 404
+    
+    if request.args.get('format') == 'text':
+        return Response(tracing.TRACER.render_waterfall(doc_id), mimetype='text/plain')
+    return jsonify({'doc_id': doc_id, 'traces': traces})
+
+@app.route('/api/dead-letters/redrive', methods=['POST'])
+def redrive_dead_letters():
+    """Re-queue dead-lettered documents; all of them unless 'ids' is given"""
+    if not middleware_instance:
+        return jsonify({'success': False, 'message': 'Middleware not initialized'}), 500
+    
+    try:
+        doc_ids = (request.get_json(silent=True) or {}).get('ids')
+        redriven = middleware_instance.redrive_dead_letters(doc_ids)
+        return jsonify({'success': True, 'message': f'Re-queued {len(redriven)} documents', 'ids': redriven})
+    except Exception as e:
+        return jsonify({'success': False, 'message': str(e)}), 500
+
+@app.route(HOOK_PATH, methods=['POST'])
+def paperless_webhook():
+    """Accept Paperless-NGX workflow webhooks announcing new or changed documents"""
+    if not middleware_instance:
+        return jsonify({'success': False, 'message': 'Middleware not initialized'}), 503
+    
+    if not middleware_instance.config.getboolean('paperless', 'webhooks', False):
+        return jsonify({'success': False, 'message': 'Webhooks are disabled'}), 404
+    
+    secret = middleware_instance.config.get('paperless', 'webhook_secret', '')
+    if secret and request.headers.get('X-Webhook-Secret') != secret:
+        return jsonify({'success': False, 'message': 'Invalid webhook secret'}), 403
+    
+    payload = request.get_json(silent=True) or request.form.to_dict()
+    doc_ids = parse_webhook_payload(payload)
+    if not doc_ids:
+        return jsonify({'success': False, 'message': 'No document id in webhook payload'}), 400
+    
+    start_webhook_debouncer().submit(doc_ids)
+    return jsonify({'success': True, 'documents': doc_ids}), 202
 
 @app.route('/api/logs')
 def get_logs():
     """Get recent log entries"""
-    return jsonify(middleware_state['logs'])
+    limit = request.args.get('limit', 50, type=int)
+    return jsonify(recent_logs.recent(limit))
 
 @app.route('/api/logs/stream')
 def stream_logs():
-    """Stream logs in real-time using Server-Sent Events"""
-    def generate():
-        yield "data: Connected to log stream\n\n"
-        
-        while True:
-            try:
-                # Wait for new log entry
-                log_entry = log_queue.get(timeout=30)
-                yield f"data: {json.dumps(log_entry)}\n\n"
-            except queue.Empty:
-                # Send heartbeat every 30 seconds
-                yield "data: {\"type\": \"heartbeat\"}\n\n"
-            except Exception as e:
-                yield f"data: {{\"error\": \"{str(e)}\"}}\n\n"
-                break
-    
-    return Response(generate(), mimetype='text/plain')
+    """Stream logs in real-time using Server-Sent Events.
+
+    Every client gets every entry. Reconnecting clients send Last-Event-ID
+    (or ?last_event_id=) and are replayed what they missed.
+    """
+    last_event_id = request.headers.get('Last-Event-ID') or request.args.get('last_event_id')
+    try:
+        last_event_id = int(last_event_id) if last_event_id else None
+    except ValueError:
+        last_event_id = None
+    
+    return Response(
+        log_hub.stream(last_event_id),
+        mimetype='text/event-stream',
+        headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'}
+    )
 
 @app.route('/api/config', methods=['GET', 'POST'])
 def handle_config():
@@ -374,10 +514,14 @@ def handle_config():
             new_config = request.json
             save_ini_config(new_config)
             
-            # Reinitialize middleware with new config
-            global middleware_instance
+            if middleware_instance:
+                # Apply only what changed; clients, caches and in-flight work are kept
+                changes = middleware_instance.reload_config()
+                apply_web_settings(changes['changed'])
+                return jsonify({'success': True, 'message': 'Configuration saved and applied', 'changes': changes})
+            
             if initialize_middleware():
-                logging.info("Configuration updated and middleware reinitialized")
+                logging.info("Configuration updated and middleware initialized")
                 return jsonify({'success': True, 'message': 'Configuration saved and applied'})
             else:
                 return jsonify({'success': False, 'message': 'Configuration saved but failed to reinitialize middleware'}), 500
@@ -392,6 +536,8 @@ def test_connection():
         if not initialize_middleware():
             return jsonify({'success': False, 'message': 'Failed to initialize middleware'}), 500
     
+    # An explicit test probes now instead of reporting the cached result
+    start_health_monitor().refresh()
     results = check_service_connections()
     
     if results['paperless'] == 'connected' and results['bigcapital'] == 'connected':
@@ -405,39 +551,112 @@ def process_now():
     if not middleware_instance:
         return jsonify({'success': False, 'message': 'Middleware not initialized'}), 500
     
+    # Joins the queued cycle if there is one, so repeated clicks run a single cycle
+    job = job_scheduler.submit('sweep', trigger='manual')
+    message = 'Processing queued' if job.coalesced else 'Processing started'
+    return jsonify({'success': True, 'message': message, 'job': job.to_dict()}), 202
+
+@app.route('/api/jobs')
+def get_jobs():
+    """The running cycle, the queued one and recently finished jobs"""
+    return jsonify(job_scheduler.snapshot())
+
+@app.route('/api/jobs/<job_id>')
+def get_job(job_id):
+    """Status, timings and per-outcome document counts of a processing job"""
+    job = job_scheduler.get(job_id)
+    if job is None:
+        return jsonify({'success': False, 'message': f'Unknown job {job_id}'}), 404
+    return jsonify(job.to_dict())
+
+@app.route('/api/profile')
+def get_profile_status():
+    """Whether a profile is being recorded and how many cycles it has covered"""
+    return jsonify(cycle_profiler.status())
+
+@app.route('/api/profile/start', methods=['POST'])
+def start_profile():
+    """Profile the next N processing cycles"""
+    data = request.get_json(silent=True) or {}
     try:
-        # Run processing in background thread
-        def run_processing():
-            middleware_instance.process_documents()
-            update_documents_list()
-            socketio.emit('stats_update', middleware_state['stats'])
-        
-        processing_thread = threading.Thread(target=run_processing, daemon=True)
-        processing_thread.start()
-        
-        return jsonify({'success': True, 'message': 'Processing started'})
-    except Exception as e:
-        return jsonify({'success': False, 'message': str(e)}), 500
+        cycles = int(data.get('cycles', 1))
+        cycle_profiler.start(cycles=cycles, mode=data.get('mode', 'cprofile'),
+                             interval=float(data.get('interval_ms', 5)) / 1000.0)
+    except (TypeError, ValueError) as e:
+        return jsonify({'success': False, 'message': str(e)}), 400
+    except RuntimeError as e:
+        return jsonify({'success': False, 'message': str(e)}), 409
+    
+    logging.info(f"Profiling the next {cycles} processing cycle(s)")
+    return jsonify({'success': True, **cycle_profiler.status()})
+
+@app.route('/api/profile/stop', methods=['POST'])
+def stop_profile():
+    """Stop profiling and download the pstats or collapsed-stack file"""
+    result = cycle_profiler.stop()
+    if result is None:
+        return jsonify({'success': False, 'message': 'No processing cycle has been profiled yet'}), 404
+    
+    return Response(
+        result['data'],
+        mimetype=result['mimetype'],
+        headers={'Content-Disposition': f"attachment; filename={result['filename']}"}
+    )
 
 @app.route('/api/export-logs', methods=['GET'])
 def export_logs():
-    """Export logs to file"""
+    """Stream the log and its rotated segments as a download.
+
+    Optional filters: since/until (ISO date or datetime) and level (minimum).
+    gzip=1 compresses on the fly; unfiltered, uncompressed exports honour
+    Range requests.
+    """
+    log_file = load_ini_config().get('processing', {}).get('log_file', 'middleware.log')
     try:
-        # Read the log file
-        if Path('middleware.log').exists():
-            with open('middleware.log', 'r') as f:
-                log_content = f.read()
-            
-            # Return as downloadable file
-            return Response(
-                log_content,
-                mimetype='text/plain',
-                headers={'Content-Disposition': 'attachment; filename=middleware_logs.txt'}
-            )
-        else:
-            return jsonify({'success': False, 'message': 'Log file not found'}), 404
-    except Exception as e:
-        return jsonify({'success': False, 'message': str(e)}), 500
+        export = LogExport(
+            log_file,
+            since=request.args.get('since'),
+            until=request.args.get('until'),
+            level=request.args.get('level')
+        )
+    except ValueError as e:
+        return jsonify({'success': False, 'message': str(e)}), 400
+    
+    if not export.files:
+        export.close()
+        return jsonify({'success': False, 'message': 'Log file not found'}), 404
+    
+    compress = request.args.get('gzip', '').lower() in ('1', 'true', 'yes')
+    filename = 'middleware_logs.txt.gz' if compress else 'middleware_logs.txt'
+    headers = {'Content-Disposition': f'attachment; filename={filename}'}
+    status = 200
+    
+    if export.filtered:
+        chunks = export.iter_filtered()
+    else:
+        total = export.total_size
+        try:
+            byte_range = None if compress else parse_range(request.headers.get('Range'), total)
+        except ValueError:
+            export.close()
+            return Response(status=416, headers={'Content-Range': f'bytes */{total}'})
+        
+        start, end = byte_range or (0, total - 1)
+        chunks = export.iter_bytes(start, end)
+        if not compress:
+            headers['Accept-Ranges'] = 'bytes'
+            headers['Content-Length'] = str(end - start + 1)
+        if byte_range:
+            status = 206
+            headers['Content-Range'] = f'bytes {start}-{end}/{total}'
+    
+    if compress:
+        chunks = gzip_chunks(chunks)
+    
+    response = Response(chunks, status=status, headers=headers,
+                        mimetype='application/gzip' if compress else 'text/plain')
+    response.call_on_close(export.close)
+    return response
 
 # WebSocket events
 @socketio.on('connect')
@@ -447,6 +666,11 @@ def handle_connect():
     emit('status_change', {'is_running': middleware_state['is_running']})
     emit('stats_update', middleware_state['stats'])
 
+@socketio.on('documents_snapshot')
+def handle_documents_snapshot():
+    """Send the full document view to a client that missed a diff"""
+    emit('documents_snapshot', document_view.snapshot())
+
 @socketio.on('disconnect')
 def handle_disconnect():
     """Handle client disconnection"""
@@ -465,4 +689,7 @@ if __name__ == '__main__':
     print("Starting Paperless-Bigcapital Middleware Web Interface...")
     print("Access the interface at: http://localhost:5000")
     
-    socketio.run(app, debug=True, host='0.0.0.0', port=5000)
+    try:
+        socketio.run(app, debug=True, host='0.0.0.0', port=5000)
+    finally:
+        shutdown()
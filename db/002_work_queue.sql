@@ -0,0 +1,33 @@
+-- Lease-based work queue shared by middleware replicas
+CREATE TABLE IF NOT EXISTS work_queue (
+    paperless_id INTEGER PRIMARY KEY,
+    doc_type VARCHAR(20) NOT NULL, -- 'invoice' or 'receipt'
+    status VARCHAR(20) NOT NULL DEFAULT 'pending', -- 'pending', 'leased', 'done', 'dead'
+
+    -- Lease ownership
+    owner VARCHAR(255), -- worker id (hostname-pid) holding the lease
+    lease_expires_at TIMESTAMP,
+    heartbeat_at TIMESTAMP,
+
+    attempts INTEGER NOT NULL DEFAULT 0,
+    last_error TEXT,
+
+    enqueued_at TIMESTAMP NOT NULL DEFAULT NOW(),
+    updated_at TIMESTAMP NOT NULL DEFAULT NOW()
+);
+
+-- Claim scans pending work oldest first and reclaims expired leases
+CREATE INDEX IF NOT EXISTS idx_work_queue_pending ON work_queue(enqueued_at) WHERE status = 'pending';
+CREATE INDEX IF NOT EXISTS idx_work_queue_leases ON work_queue(lease_expires_at) WHERE status = 'leased';
+
+-- Who owns what
+CREATE OR REPLACE VIEW work_queue_owners AS
+SELECT
+    owner,
+    COUNT(*) as leased,
+    MIN(lease_expires_at) as next_expiry,
+    MAX(heartbeat_at) as last_heartbeat
+FROM work_queue
+WHERE status = 'leased'
+GROUP BY owner
+ORDER BY owner;
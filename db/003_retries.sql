@@ -0,0 +1,19 @@
+-- Retry scheduling and dead-letter queue for the work queue
+ALTER TABLE work_queue ADD COLUMN IF NOT EXISTS next_attempt_at TIMESTAMP; -- NULL = due now
+ALTER TABLE work_queue ADD COLUMN IF NOT EXISTS posted BOOLEAN NOT NULL DEFAULT FALSE; -- already created in Bigcapital
+
+DROP INDEX IF EXISTS idx_work_queue_pending;
+CREATE INDEX IF NOT EXISTS idx_work_queue_due ON work_queue(enqueued_at, next_attempt_at) WHERE status = 'pending';
+
+-- Documents that failed permanently or ran out of retries
+CREATE TABLE IF NOT EXISTS dead_letters (
+    paperless_id INTEGER PRIMARY KEY REFERENCES work_queue(paperless_id) ON DELETE CASCADE,
+    doc_type VARCHAR(20) NOT NULL,
+    attempts INTEGER NOT NULL,
+    posted BOOLEAN NOT NULL DEFAULT FALSE,
+    error_kind VARCHAR(20) NOT NULL, -- 'transient' (retries exhausted) or 'permanent'
+    last_error TEXT,
+    failed_at TIMESTAMP NOT NULL DEFAULT NOW()
+);
+
+CREATE INDEX IF NOT EXISTS idx_dead_letters_failed_at ON dead_letters(failed_at DESC);
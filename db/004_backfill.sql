@@ -0,0 +1,15 @@
+-- Checkpoints for resumable backfill runs (python middleware.py backfill)
+CREATE TABLE IF NOT EXISTS backfill_runs (
+    run_id VARCHAR(100) PRIMARY KEY,
+    filters JSONB, -- since, until, min_id, max_id
+    last_doc_id INTEGER NOT NULL DEFAULT 0, -- every document up to this ID has been handled
+    seen INTEGER NOT NULL DEFAULT 0,
+    processed INTEGER NOT NULL DEFAULT 0,
+    failed INTEGER NOT NULL DEFAULT 0,
+    retrying INTEGER NOT NULL DEFAULT 0,
+    skipped INTEGER NOT NULL DEFAULT 0,
+    total INTEGER,
+    started_at TIMESTAMP NOT NULL DEFAULT NOW(),
+    updated_at TIMESTAMP NOT NULL DEFAULT NOW(),
+    finished_at TIMESTAMP
+);
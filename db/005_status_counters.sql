@@ -0,0 +1,68 @@
+-- Materialized document counters for get_processing_stats, maintained by triggers
+-- so statistics never scan the documents table
+CREATE TABLE IF NOT EXISTS document_status_counts (
+    status VARCHAR(50) PRIMARY KEY,
+    count BIGINT NOT NULL DEFAULT 0
+);
+
+-- Documents that entered each status on each day
+CREATE TABLE IF NOT EXISTS document_daily_status_counts (
+    day DATE NOT NULL,
+    status VARCHAR(50) NOT NULL,
+    count BIGINT NOT NULL DEFAULT 0,
+    PRIMARY KEY (day, status)
+);
+
+CREATE OR REPLACE FUNCTION maintain_document_status_counts()
+RETURNS TRIGGER AS $$
+BEGIN
+    IF TG_OP IN ('UPDATE', 'DELETE') THEN
+        UPDATE document_status_counts SET count = count - 1
+        WHERE status = COALESCE(OLD.status, 'unknown');
+    END IF;
+    IF TG_OP IN ('INSERT', 'UPDATE') THEN
+        INSERT INTO document_status_counts (status, count)
+        VALUES (COALESCE(NEW.status, 'unknown'), 1)
+        ON CONFLICT (status) DO UPDATE SET count = document_status_counts.count + 1;
+
+        INSERT INTO document_daily_status_counts (day, status, count)
+        VALUES (CURRENT_DATE, COALESCE(NEW.status, 'unknown'), 1)
+        ON CONFLICT (day, status) DO UPDATE SET count = document_daily_status_counts.count + 1;
+    END IF;
+    RETURN NULL;
+END;
+$$ language 'plpgsql';
+
+DROP TRIGGER IF EXISTS documents_status_counts_change ON documents;
+CREATE TRIGGER documents_status_counts_change
+    AFTER INSERT OR DELETE ON documents
+    FOR EACH ROW
+    EXECUTE FUNCTION maintain_document_status_counts();
+
+DROP TRIGGER IF EXISTS documents_status_counts_update ON documents;
+CREATE TRIGGER documents_status_counts_update
+    AFTER UPDATE OF status ON documents
+    FOR EACH ROW
+    WHEN (OLD.status IS DISTINCT FROM NEW.status)
+    EXECUTE FUNCTION maintain_document_status_counts();
+
+-- Recompute the counters from scratch (python dbmanager.py rebuild-stats).
+-- Daily counts are approximated by each document's last update day.
+CREATE OR REPLACE FUNCTION rebuild_document_status_counts()
+RETURNS VOID AS $$
+BEGIN
+    -- Block status changes while counting so none are lost or double counted
+    LOCK TABLE documents IN SHARE MODE;
+    DELETE FROM document_status_counts;
+    DELETE FROM document_daily_status_counts;
+
+    INSERT INTO document_status_counts (status, count)
+    SELECT COALESCE(status, 'unknown'), COUNT(*) FROM documents GROUP BY 1;
+
+    INSERT INTO document_daily_status_counts (day, status, count)
+    SELECT updated_at::date, COALESCE(status, 'unknown'), COUNT(*)
+    FROM documents WHERE updated_at IS NOT NULL GROUP BY 1, 2;
+END;
+$$ language 'plpgsql';
+
+SELECT rebuild_document_status_counts();
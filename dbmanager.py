@@ -6,15 +6,45 @@ Provides database connection management and common operations.
 
 import os
 import logging
+import re
+import time
+from pathlib import Path
 from typing import Optional, Dict, Any, List
 from contextlib import contextmanager
 import psycopg2
-from psycopg2.extras import RealDictCursor
+from psycopg2.extras import Json, RealDictCursor
 from psycopg2.pool import ThreadedConnectionPool
 import configparser
 
+import metrics
+
 logger = logging.getLogger(__name__)
 
+# 001_schema.sql is the base schema, applied once when the database is
+# created; the numbered files after it are re-runnable migrations
+MIGRATIONS_DIR = Path(__file__).resolve().parent / 'db'
+BASE_SCHEMA = '001_schema.sql'
+_MIGRATION_NAME = re.compile(r'^\d{3}_.+\.sql$')
+
+
+class TimedCursor(RealDictCursor):
+    """RealDictCursor that records how long each statement takes to execute"""
+    
+    def execute(self, query, vars=None):
+        started = time.monotonic()
+        try:
+            return super().execute(query, vars)
+        finally:
+            metrics.DB_QUERY_SECONDS.observe(time.monotonic() - started)
+    
+    def executemany(self, query, vars_list):
+        started = time.monotonic()
+        try:
+            return super().executemany(query, vars_list)
+        finally:
+            metrics.DB_QUERY_SECONDS.observe(time.monotonic() - started)
+
+
 class DatabaseManager:
     """Manages PostgreSQL database connections and operations."""
     
@@ -66,7 +96,7 @@ class DatabaseManager:
                 database=db_config['name'],
                 user=db_config['user'],
                 password=db_config['password'],
-                cursor_factory=RealDictCursor
+                cursor_factory=TimedCursor
             )
             
             logger.info("Database connection pool initialized successfully")
@@ -86,9 +116,14 @@ class DatabaseManager:
     def get_connection(self):
         """Get a database connection from the pool."""
         conn = None
+        requested = time.monotonic()
         try:
             conn = self.pool.getconn()
+            metrics.DB_POOL_WAIT_SECONDS.observe(time.monotonic() - requested)
             yield conn
+        except Exception:
+            metrics.DB_ERRORS.inc()
+            raise
         finally:
             if conn:
                 self.pool.putconn(conn)
@@ -200,6 +235,199 @@ class DatabaseManager:
         
         return self.execute_query(query, (limit,))
     
+    def execute_returning(self, query: str, params: tuple = None) -> List[Dict[str, Any]]:
+        """Execute a data-modifying query with RETURNING, commit and return its rows."""
+        with self.get_connection() as conn:
+            try:
+                with conn.cursor() as cursor:
+                    cursor.execute(query, params)
+                    rows = cursor.fetchall()
+                conn.commit()
+                return rows
+            except Exception:
+                conn.rollback()
+                raise
+    
+    def enqueue_work(self, entries: List[tuple]) -> int:
+        """Add (paperless_id, doc_type) pairs to the work queue.
+        
+        Queued and leased documents are left alone. Finished and dead-lettered
+        ones are queued again: discovery only finds them once their marker tag
+        was removed in Paperless, i.e. someone asked for them to be reprocessed.
+        A dead-lettered document keeps its ``posted`` flag so it is not posted twice.
+        """
+        if not entries:
+            return 0
+        
+        query = """
+        WITH queued AS (
+            INSERT INTO work_queue (paperless_id, doc_type)
+            SELECT * FROM UNNEST(%s::integer[], %s::varchar[])
+            ON CONFLICT (paperless_id) DO UPDATE
+            SET status = 'pending', doc_type = EXCLUDED.doc_type, attempts = 0,
+                posted = work_queue.status = 'dead' AND work_queue.posted,
+                next_attempt_at = NULL, last_error = NULL, enqueued_at = NOW(), updated_at = NOW()
+            WHERE work_queue.status IN ('done', 'dead')
+            RETURNING paperless_id
+        ), revived AS (
+            DELETE FROM dead_letters WHERE paperless_id IN (SELECT paperless_id FROM queued)
+        )
+        SELECT paperless_id FROM queued
+        """
+        
+        doc_ids = [entry[0] for entry in entries]
+        doc_types = [entry[1] for entry in entries]
+        return len(self.execute_returning(query, (doc_ids, doc_types)))
+    
+    def claim_work(self, owner: str, limit: int, lease_seconds: int) -> List[Dict[str, Any]]:
+        """Lease pending entries that are due, or expired leases, to ``owner``.
+        
+        SKIP LOCKED lets concurrent replicas claim disjoint batches without
+        waiting on each other's row locks.
+        """
+        query = """
+        UPDATE work_queue
+        SET status = 'leased', owner = %s,
+            lease_expires_at = NOW() + make_interval(secs => %s),
+            heartbeat_at = NOW(), attempts = attempts + 1, updated_at = NOW()
+        WHERE paperless_id IN (
+            SELECT paperless_id FROM work_queue
+            WHERE (status = 'pending' AND (next_attempt_at IS NULL OR next_attempt_at <= NOW()))
+               OR (status = 'leased' AND lease_expires_at < NOW())
+            ORDER BY enqueued_at ASC
+            LIMIT %s
+            FOR UPDATE SKIP LOCKED
+        )
+        RETURNING paperless_id, doc_type, attempts, posted
+        """
+        
+        return self.execute_returning(query, (owner, lease_seconds, limit))
+    
+    def heartbeat_work(self, owner: str, paperless_ids: List[int], lease_seconds: int) -> int:
+        """Extend the leases ``owner`` still holds."""
+        query = """
+        UPDATE work_queue
+        SET lease_expires_at = NOW() + make_interval(secs => %s), heartbeat_at = NOW()
+        WHERE owner = %s AND status = 'leased' AND paperless_id = ANY(%s)
+        """
+        
+        return self.execute_non_query(query, (lease_seconds, owner, paperless_ids))
+    
+    def complete_work(self, owner: str, paperless_id: int):
+        """Mark a leased queue entry as done."""
+        query = """
+        UPDATE work_queue
+        SET status = 'done', last_error = NULL, owner = NULL, lease_expires_at = NULL, updated_at = NOW()
+        WHERE paperless_id = %s AND owner = %s
+        """
+        
+        self.execute_non_query(query, (paperless_id, owner))
+    
+    def retry_work(self, owner: str, paperless_id: int, error_message: str, posted: bool,
+                   delay_seconds: float) -> bool:
+        """Put a leased entry back to pending, due again after ``delay_seconds``."""
+        query = """
+        UPDATE work_queue
+        SET status = 'pending', owner = NULL, lease_expires_at = NULL,
+            next_attempt_at = NOW() + make_interval(secs => %s),
+            last_error = %s, posted = posted OR %s, updated_at = NOW()
+        WHERE paperless_id = %s AND owner = %s
+        """
+        
+        return self.execute_non_query(query, (delay_seconds, error_message, posted, paperless_id, owner)) > 0
+    
+    def dead_letter_work(self, owner: str, paperless_id: int, error_message: str, posted: bool,
+                         error_kind: str):
+        """Move a leased entry to the dead-letter table in one statement."""
+        query = """
+        WITH dead AS (
+            UPDATE work_queue
+            SET status = 'dead', owner = NULL, lease_expires_at = NULL,
+                last_error = %s, posted = posted OR %s, updated_at = NOW()
+            WHERE paperless_id = %s AND owner = %s
+            RETURNING paperless_id, doc_type, attempts, posted
+        )
+        INSERT INTO dead_letters (paperless_id, doc_type, attempts, posted, error_kind, last_error)
+        SELECT paperless_id, doc_type, attempts, posted, %s, %s FROM dead
+        ON CONFLICT (paperless_id) DO UPDATE
+        SET attempts = EXCLUDED.attempts, posted = EXCLUDED.posted, error_kind = EXCLUDED.error_kind,
+            last_error = EXCLUDED.last_error, failed_at = NOW()
+        """
+        
+        self.execute_non_query(query, (error_message, posted, paperless_id, owner,
+                                       error_kind, error_message))
+    
+    def get_dead_letters(self, limit: int = 100) -> List[Dict[str, Any]]:
+        """List dead-lettered documents, most recent first."""
+        query = "SELECT * FROM dead_letters ORDER BY failed_at DESC LIMIT %s"
+        return self.execute_query(query, (limit,))
+    
+    def redrive_dead_letters(self, paperless_ids: List[int] = None) -> List[int]:
+        """Return dead-lettered documents (all when ``paperless_ids`` is None) to the queue."""
+        query = """
+        WITH redriven AS (
+            DELETE FROM dead_letters
+            WHERE %s::integer[] IS NULL OR paperless_id = ANY(%s::integer[])
+            RETURNING paperless_id
+        )
+        UPDATE work_queue
+        SET status = 'pending', attempts = 0, next_attempt_at = NULL, last_error = NULL, updated_at = NOW()
+        FROM redriven
+        WHERE work_queue.paperless_id = redriven.paperless_id
+        RETURNING work_queue.paperless_id
+        """
+        
+        rows = self.execute_returning(query, (paperless_ids, paperless_ids))
+        return [row['paperless_id'] for row in rows]
+    
+    def release_work(self, owner: str, paperless_id: int):
+        """Return a leased queue entry to pending without counting it as finished."""
+        query = """
+        UPDATE work_queue
+        SET status = 'pending', owner = NULL, lease_expires_at = NULL, updated_at = NOW()
+        WHERE paperless_id = %s AND owner = %s AND status = 'leased'
+        """
+        
+        self.execute_non_query(query, (paperless_id, owner))
+    
+    def get_work_owners(self) -> List[Dict[str, Any]]:
+        """List which workers currently hold leases."""
+        return self.execute_query("SELECT * FROM work_queue_owners")
+    
+    def get_work_queue_depth(self) -> Dict[str, int]:
+        """Count work queue entries by status."""
+        query = "SELECT status, COUNT(*) AS count FROM work_queue GROUP BY status"
+        return {row['status']: row['count'] for row in self.execute_query(query)}
+    
+    def get_backfill_checkpoint(self, run_id: str) -> Optional[Dict[str, Any]]:
+        """Get the saved state of a backfill run."""
+        query = """
+        SELECT filters, last_doc_id, seen, processed, failed, retrying, skipped, total,
+               started_at::text AS started_at, finished_at::text AS finished_at
+        FROM backfill_runs WHERE run_id = %s
+        """
+        results = self.execute_query(query, (run_id,))
+        return dict(results[0]) if results else None
+    
+    def save_backfill_checkpoint(self, run_id: str, state: Dict[str, Any]):
+        """Create or update the checkpoint of a backfill run."""
+        query = """
+        INSERT INTO backfill_runs (
+            run_id, filters, last_doc_id, seen, processed, failed, retrying, skipped,
+            total, started_at, finished_at
+        ) VALUES (
+            %(run_id)s, %(filters)s, %(last_doc_id)s, %(seen)s, %(processed)s, %(failed)s,
+            %(retrying)s, %(skipped)s, %(total)s, %(started_at)s, %(finished_at)s
+        )
+        ON CONFLICT (run_id) DO UPDATE SET
+            last_doc_id = EXCLUDED.last_doc_id, seen = EXCLUDED.seen, processed = EXCLUDED.processed,
+            failed = EXCLUDED.failed, retrying = EXCLUDED.retrying, skipped = EXCLUDED.skipped,
+            total = EXCLUDED.total, finished_at = EXCLUDED.finished_at, updated_at = NOW()
+        """
+        
+        params = dict(state, run_id=run_id, filters=Json(state.get('filters')))
+        self.execute_non_query(query, params)
+    
     def get_document_by_paperless_id(self, paperless_id: int) -> Optional[Dict[str, Any]]:
         """Get document by Paperless-NGX ID."""
         query = "SELECT * FROM documents WHERE paperless_id = %s"
@@ -207,17 +435,58 @@ class DatabaseManager:
         return results[0] if results else None
     
     def get_processing_stats(self) -> Dict[str, int]:
-        """Get processing statistics."""
+        """Get processing statistics from the trigger-maintained counters (db/005_status_counters.sql)."""
+        query = "SELECT status, count FROM document_status_counts WHERE count > 0"
+        results = self.execute_query(query)
+        return {row['status']: row['count'] for row in results}
+    
+    def get_daily_stats(self, days: int = 7) -> Dict[str, Dict[str, int]]:
+        """Documents that entered each status per day, for the last ``days`` days."""
         query = """
-        SELECT 
-            status,
-            COUNT(*) as count
-        FROM documents 
-        GROUP BY status
+        SELECT day, status, count FROM document_daily_status_counts
+        WHERE day > CURRENT_DATE - %s
+        ORDER BY day DESC
         """
+        daily: Dict[str, Dict[str, int]] = {}
+        for row in self.execute_query(query, (days,)):
+            daily.setdefault(row['day'].isoformat(), {})[row['status']] = row['count']
+        return daily
+    
+    def apply_migrations(self, directory: Path = MIGRATIONS_DIR) -> List[str]:
+        """Apply the migrations in ``directory`` this database has not seen yet, in order.
         
-        results = self.execute_query(query)
-        return {row['status']: row['count'] for row in results}
+        Postgres only runs /docker-entrypoint-initdb.d on an empty volume, so
+        existing databases pick up new migrations here. Applied files are
+        recorded in schema_migrations; each runs in its own transaction.
+        """
+        self.execute_non_query("""
+        CREATE TABLE IF NOT EXISTS schema_migrations (
+            filename VARCHAR(255) PRIMARY KEY,
+            applied_at TIMESTAMP NOT NULL DEFAULT NOW()
+        )
+        """)
+        applied = {row['filename'] for row in self.execute_query("SELECT filename FROM schema_migrations")}
+        pending = sorted(path for path in Path(directory).glob('*.sql')
+                         if _MIGRATION_NAME.match(path.name) and path.name != BASE_SCHEMA
+                         and path.name not in applied)
+        
+        for path in pending:
+            with self.get_connection() as conn:
+                try:
+                    with conn.cursor() as cursor:
+                        cursor.execute(path.read_text())
+                        cursor.execute("INSERT INTO schema_migrations (filename) VALUES (%s)", (path.name,))
+                    conn.commit()
+                except Exception:
+                    conn.rollback()
+                    raise
+            logger.info(f"Applied migration {path.name}")
+        return [path.name for path in pending]
+    
+    def rebuild_processing_stats(self):
+        """Recompute the status counters from the documents table."""
+        self.execute_non_query("SELECT rebuild_document_status_counts()")
+        logger.info("Document status counters rebuilt")
     
     def close(self):
         """Close the connection pool."""
@@ -236,11 +505,24 @@ def get_db_manager(config_path: str = None) -> DatabaseManager:
     return _db_manager
 
 if __name__ == "__main__":
+    import sys
+    
     # Test the database manager
     logging.basicConfig(level=logging.INFO)
     
+    if sys.argv[1:] == ['migrate']:
+        try:
+            applied = get_db_manager().apply_migrations()
+            print(f"Applied {len(applied)} migration(s): {', '.join(applied) or 'none pending'}")
+        finally:
+            if _db_manager:
+                _db_manager.close()
+        sys.exit(0)
+    
     try:
         db = get_db_manager()
+        if sys.argv[1:] == ['rebuild-stats']:
+            db.rebuild_processing_stats()
         stats = db.get_processing_stats()
         print(f"Processing stats: {stats}")
         
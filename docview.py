@@ -0,0 +1,102 @@
+#!/usr/bin/env python3
+"""
+Server-side view of recently processed documents for the dashboard.
+The view is updated from pipeline outcomes rather than by re-listing
+Paperless-NGX, and every change produces a small versioned diff that is
+pushed to clients. A client whose version does not match a diff's base
+version has missed an update and asks for a full snapshot instead.
+Each view has a random ``origin``: with several web workers sharing events,
+clients can tell diffs of the view they hold from another worker's.
+"""
+
+import threading
+import time
+import uuid
+from collections import OrderedDict
+from typing import Dict, Iterable, List, Optional
+
+# Pipeline outcome -> status shown on the dashboard
+OUTCOME_STATUS = {
+    'done': 'processed',
+    'retry': 'retrying',
+    'dead': 'error'
+}
+
+
+def document_entry(item, outcome: str) -> Dict:
+    """Dashboard row for a WorkItem that finished with ``outcome``"""
+    data = item.data
+    return {
+        'id': item.doc_id,
+        'type': item.doc_type.capitalize(),
+        'number': data.number if data else None,
+        'customer': data.customer_name if data and data.customer_name else 'Unknown',
+        'amount': data.amount if data else None,
+        'date': data.date if data and data.date else '',
+        'status': OUTCOME_STATUS.get(outcome, outcome),
+        'attempts': item.attempts,
+        'updated_at': time.time()
+    }
+
+
+class DocumentView:
+    """The ``limit`` most recently changed documents, keyed by id, with a version counter"""
+
+    def __init__(self, limit: int = 200):
+        self.limit = max(1, limit)
+        self.origin = uuid.uuid4().hex[:12]  # Also tells clients the server restarted
+        self.version = 0
+        self._documents: 'OrderedDict[int, Dict]' = OrderedDict()  # least recently changed first
+        self._lock = threading.Lock()
+
+    def apply(self, upserts: Iterable[Dict] = (), removed: Iterable[int] = ()) -> Optional[Dict]:
+        """Apply changes and return the diff to broadcast, or ``None`` when nothing changed"""
+        added, updated, gone = [], [], []
+        with self._lock:
+            for doc_id in removed:
+                if self._documents.pop(doc_id, None) is not None:
+                    gone.append(doc_id)
+
+            for entry in upserts:
+                previous = self._documents.pop(entry['id'], None)
+                self._documents[entry['id']] = entry
+                if previous is None:
+                    added.append(entry)
+                elif self._changed(previous, entry):
+                    updated.append(entry)
+
+            while len(self._documents) > self.limit:
+                doc_id, _ = self._documents.popitem(last=False)
+                gone.append(doc_id)
+
+            # A document evicted in the same call it was added never reaches clients
+            added = [entry for entry in added if entry['id'] in self._documents]
+            updated = [entry for entry in updated if entry['id'] in self._documents]
+            if not (added or updated or gone):
+                return None
+
+            self.version += 1
+            return {
+                'origin': self.origin,
+                'version': self.version,
+                'base_version': self.version - 1,
+                'added': added,
+                'updated': updated,
+                'removed': gone
+            }
+
+    @staticmethod
+    def _changed(previous: Dict, entry: Dict) -> bool:
+        return any(previous.get(key) != value for key, value in entry.items() if key != 'updated_at')
+
+    def snapshot(self) -> Dict:
+        """Every document, most recently changed first, with the version it reflects"""
+        with self._lock:
+            return {
+                'origin': self.origin,
+                'version': self.version,
+                'documents': list(reversed(self._documents.values()))
+            }
+
+    def documents(self) -> List[Dict]:
+        return self.snapshot()['documents']
@@ -0,0 +1,182 @@
+#!/usr/bin/env python3
+"""
+Size-bounded on-disk LRU cache for document files fetched from Paperless-NGX.
+Each file is downloaded once, streamed to disk while its SHA-256 is computed
+for a strong ETag, and then served straight from the cache file, so the web
+server can use sendfile and answer Range and conditional requests itself.
+Files older than ``max_age`` are fetched again, so edits made in Paperless
+(a re-run OCR, a replaced archive version) reach the editor.
+"""
+
+import hashlib
+import json
+import logging
+import os
+import tempfile
+import threading
+import time
+from collections import OrderedDict
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Callable, Dict, Iterator, Tuple
+
+logger = logging.getLogger(__name__)
+
+# A fetch yields the content type, then the body in chunks
+Fetcher = Callable[[int, str], Tuple[str, Iterator[bytes]]]
+
+
+@dataclass
+class CachedFile:
+    path: Path
+    mimetype: str
+    etag: str
+    size: int
+    fetched_at: float
+
+
+class FileCache:
+    """LRU cache of ``(document id, variant)`` files under ``directory``.
+
+    Entries survive restarts; on startup the directory is scanned and the
+    recency order restored from file modification times. Concurrent requests
+    for a missing file share one download. An entry older than ``max_age``
+    seconds (0: never) counts as missing; ``invalidate`` drops one at once.
+    """
+
+    def __init__(self, directory: str, max_bytes: int, fetch: Fetcher, max_age: float = 0):
+        self.directory = Path(directory)
+        self.directory.mkdir(parents=True, exist_ok=True)
+        self.max_bytes = max_bytes
+        self.fetch = fetch
+        self.max_age = max_age
+        self.hits = 0
+        self.misses = 0
+        self._entries: 'OrderedDict[str, CachedFile]' = OrderedDict()  # least recently used first
+        self._size = 0
+        self._lock = threading.Lock()
+        self._key_locks: Dict[str, threading.Lock] = {}
+        self._load()
+
+    def _load(self):
+        for leftover in self.directory.glob('.download-*'):
+            leftover.unlink(missing_ok=True)  # Interrupted downloads
+        found = []
+        for meta_path in self.directory.glob('*.json'):
+            data_path = meta_path.with_suffix('')
+            try:
+                meta = json.loads(meta_path.read_text())
+                stat = data_path.stat()
+            except (OSError, ValueError):
+                meta_path.unlink(missing_ok=True)
+                continue
+            found.append((stat.st_mtime, data_path.name,
+                          CachedFile(data_path, meta['mimetype'], meta['etag'], stat.st_size,
+                                     meta.get('fetched_at', stat.st_mtime))))
+        for _, key, entry in sorted(found, key=lambda item: item[0]):
+            self._entries[key] = entry
+            self._size += entry.size
+        self._evict()
+
+    @staticmethod
+    def _key(doc_id: int, variant: str) -> str:
+        return f"{doc_id}-{variant}"
+
+    def get(self, doc_id: int, variant: str) -> CachedFile:
+        """The cached file, downloading it first if needed"""
+        key = self._key(doc_id, variant)
+        entry = self._touch(key)
+        if entry:
+            return entry
+
+        with self._lock:
+            key_lock = self._key_locks.setdefault(key, threading.Lock())
+        with key_lock:
+            # Another request may have downloaded it while we waited
+            entry = self._touch(key)
+            if entry:
+                return entry
+            with self._lock:
+                self.misses += 1
+            entry = self._download(key, doc_id, variant)
+        with self._lock:
+            self._key_locks.pop(key, None)
+        return entry
+
+    def _touch(self, key: str):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            if self.max_age and time.time() - entry.fetched_at > self.max_age:
+                return None  # Stale; the download replaces it
+            if not entry.path.exists():
+                # Removed behind our back; forget it and download again
+                del self._entries[key]
+                self._size -= entry.size
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+        try:
+            os.utime(entry.path)  # Keeps the recency order across restarts
+        except OSError:
+            pass
+        return entry
+
+    def _download(self, key: str, doc_id: int, variant: str) -> CachedFile:
+        mimetype, chunks = self.fetch(doc_id, variant)
+        digest = hashlib.sha256()
+        size = 0
+        fd, tmp_name = tempfile.mkstemp(dir=self.directory, prefix='.download-')
+        try:
+            with os.fdopen(fd, 'wb') as f:
+                for chunk in chunks:
+                    f.write(chunk)
+                    digest.update(chunk)
+                    size += len(chunk)
+            path = self.directory / key
+            entry = CachedFile(path, mimetype, digest.hexdigest(), size, time.time())
+            # Metadata first: a data file without it would never be found again
+            Path(f"{path}.json").write_text(json.dumps({'mimetype': mimetype, 'etag': entry.etag,
+                                                        'fetched_at': entry.fetched_at}))
+            os.replace(tmp_name, path)
+        except BaseException:
+            os.unlink(tmp_name)
+            raise
+
+        logger.info(f"Cached {variant} of document {doc_id} ({size} bytes)")
+
+        with self._lock:
+            previous = self._entries.pop(key, None)
+            if previous:
+                self._size -= previous.size
+            self._entries[key] = entry
+            self._size += size
+            self._evict()
+        return entry
+
+    def _evict(self):
+        """Drop least recently used files until the cache fits; caller holds the lock"""
+        while self._size > self.max_bytes and len(self._entries) > 1:
+            key, entry = self._entries.popitem(last=False)
+            self._size -= entry.size
+            for path in (entry.path, Path(f"{entry.path}.json")):
+                try:
+                    path.unlink()
+                except FileNotFoundError:
+                    pass
+            logger.debug(f"Evicted {key} from the file cache")
+
+    def invalidate(self, doc_id: int):
+        """Forget every variant of a document, e.g. after it changed in Paperless"""
+        with self._lock:
+            for key in [key for key in self._entries if key.startswith(f"{doc_id}-")]:
+                entry = self._entries.pop(key)
+                self._size -= entry.size
+                entry.path.unlink(missing_ok=True)
+                Path(f"{entry.path}.json").unlink(missing_ok=True)
+
+    def stats(self) -> Dict:
+        with self._lock:
+            return {'files': len(self._entries), 'bytes': self._size, 'max_bytes': self.max_bytes,
+                    'hits': self.hits, 'misses': self.misses}
@@ -0,0 +1,89 @@
+#!/usr/bin/env python3
+"""
+Background health probing of the services the middleware depends on.
+Each service is pinged on a timer through a lightweight endpoint; results and
+latencies are cached, so status endpoints answer from memory however often
+dashboards poll them.
+"""
+
+import logging
+import threading
+import time
+from typing import Callable, Dict, Optional
+
+logger = logging.getLogger(__name__)
+
+
+class HealthMonitor:
+    """Probes services every ``interval`` seconds and serves the cached results.
+
+    A result older than ``ttl`` seconds (e.g. because probing stalled) is
+    reported as ``stale`` rather than trusted.
+    """
+
+    def __init__(self, probes: Dict[str, Callable[[], None]], interval: float = 30.0, ttl: float = 90.0):
+        self.probes = probes
+        self.interval = interval
+        self.ttl = max(ttl, interval)
+        # Replaced wholesale on every refresh, so readers never need the lock
+        self._results: Dict[str, Dict] = {name: {'status': 'unknown', 'latency_ms': None,
+                                                 'checked_at': None, 'error': None}
+                                          for name in probes}
+        self._lock = threading.Lock()
+        self._wakeup = threading.Event()
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    def start(self):
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._run, name='health-monitor', daemon=True)
+            self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        self._wakeup.set()
+
+    def _run(self):
+        while not self._stop.is_set():
+            self.refresh()
+            self._wakeup.wait(self.interval)
+            self._wakeup.clear()
+
+    def _probe(self, name: str, probe: Callable[[], None]) -> Dict:
+        started = time.perf_counter()
+        try:
+            probe()
+            status, error = 'connected', None
+        except Exception as e:
+            status, error = 'error', str(e)
+            logger.warning(f"Health probe for {name} failed: {error}")
+        return {
+            'status': status,
+            'latency_ms': round((time.perf_counter() - started) * 1000, 1),
+            'checked_at': time.time(),
+            'error': error
+        }
+
+    def refresh(self) -> Dict[str, Dict]:
+        """Probe every service now and return the fresh results"""
+        with self._lock:
+            results = {name: self._probe(name, probe) for name, probe in self.probes.items()}
+            self._results = results
+        return results
+
+    def request_refresh(self):
+        """Probe again soon, without waiting for the interval, e.g. after a config change"""
+        self._wakeup.set()
+
+    def snapshot(self) -> Dict[str, Dict]:
+        """Cached results with stale entries marked; never does I/O"""
+        now = time.time()
+        snapshot = {}
+        for name, result in self._results.items():
+            if result['checked_at'] is not None and now - result['checked_at'] > self.ttl:
+                result = {**result, 'status': 'stale'}
+            snapshot[name] = result
+        return snapshot
+
+    def statuses(self) -> Dict[str, str]:
+        return {name: result['status'] for name, result in self.snapshot().items()}
@@ -32,6 +32,10 @@ else
     echo "Database tables already exist, skipping initialization."
 fi
 
+# Existing volumes never rerun the initdb scripts; apply migrations added since
+echo "Applying pending database migrations..."
+python dbmanager.py migrate
+
 # Start the middleware application
 echo "Starting paperless-bigcapital middleware..."
 exec python middleware.py "$@"
@@ -0,0 +1,177 @@
+#!/usr/bin/env python3
+"""
+Job scheduling for middleware processing cycles.
+Every cycle, whether started by the polling loop, a webhook wakeup or the
+"process now" button, is a job run by a single scheduler thread, so cycles
+never overlap. Triggers that arrive while an equivalent job is already
+waiting are coalesced into it instead of queuing another cycle.
+"""
+
+import logging
+import threading
+import time
+import uuid
+from collections import OrderedDict, deque
+from dataclasses import dataclass, field
+from typing import Callable, Deque, Dict, Optional
+
+logger = logging.getLogger(__name__)
+
+# A sweep discovers new documents and drains the queue; a drain only does the latter
+KINDS = ('sweep', 'drain')
+
+
+@dataclass
+class Job:
+    """One processing cycle and how it went"""
+    id: str
+    kind: str
+    trigger: str
+    status: str = 'queued'  # queued, running, succeeded, failed or cancelled
+    created_at: float = field(default_factory=time.time)
+    started_at: Optional[float] = None
+    finished_at: Optional[float] = None
+    coalesced: int = 0  # triggers folded into this job after it was queued
+    progress: Dict[str, int] = field(default_factory=dict)  # documents finished, by outcome
+    error: Optional[str] = None
+    _done: threading.Event = field(default_factory=threading.Event, repr=False)
+
+    def wait(self, timeout: float = None) -> bool:
+        return self._done.wait(timeout)
+
+    def to_dict(self) -> Dict:
+        now = time.time()
+        return {
+            'id': self.id,
+            'kind': self.kind,
+            'trigger': self.trigger,
+            'status': self.status,
+            'created_at': self.created_at,
+            'started_at': self.started_at,
+            'finished_at': self.finished_at,
+            'queued_seconds': round((self.started_at or now) - self.created_at, 3),
+            'run_seconds': round((self.finished_at or now) - self.started_at, 3) if self.started_at else None,
+            'coalesced': self.coalesced,
+            'progress': dict(self.progress),
+            'error': self.error
+        }
+
+
+class JobScheduler:
+    """Runs processing jobs one at a time, with at most one job waiting.
+
+    ``run(kind)`` performs the cycle. A trigger arriving while a job is
+    queued returns that job rather than adding another, widening a queued
+    drain to a sweep when a sweep is asked for. Finished jobs are kept for
+    ``history`` lookups. ``stop()`` cancels waiting jobs and ends the
+    worker thread once the running job is done; a later ``submit`` starts it
+    again.
+    """
+
+    def __init__(self, run: Callable[[str], None], history: int = 100):
+        self.run = run
+        self.history = history
+        self._queue: Deque[Job] = deque()
+        self._jobs: 'OrderedDict[str, Job]' = OrderedDict()
+        self._current: Optional[Job] = None
+        self._cond = threading.Condition()
+        self._thread: Optional[threading.Thread] = None
+        self._stopping = False
+
+    def submit(self, kind: str = 'sweep', trigger: str = 'manual') -> Job:
+        """Queue a cycle, or return the queued job it coalesces into"""
+        if kind not in KINDS:
+            raise ValueError(f"Unknown job kind {kind!r}; expected one of {', '.join(KINDS)}")
+        with self._cond:
+            if self._queue:
+                job = self._queue[0]
+                if kind == 'sweep':
+                    job.kind = 'sweep'  # The queued drain widens to a sweep, which covers both
+                job.coalesced += 1
+                logger.debug(f"Coalesced {trigger} {kind} into queued job {job.id}")
+                return job
+
+            job = Job(id=uuid.uuid4().hex[:12], kind=kind, trigger=trigger)
+            self._stopping = False
+            self._queue.append(job)
+            self._remember(job)
+            self._ensure_thread()
+            self._cond.notify()
+            return job
+
+    def _remember(self, job: Job):
+        self._jobs[job.id] = job
+        while len(self._jobs) > self.history:
+            oldest = next(iter(self._jobs.values()))
+            if oldest.status in ('queued', 'running'):
+                break
+            self._jobs.popitem(last=False)
+
+    def _ensure_thread(self):
+        if self._thread is None or not self._thread.is_alive():
+            self._thread = threading.Thread(target=self._worker, name='job-scheduler', daemon=True)
+            self._thread.start()
+
+    def stop(self, timeout: float = None) -> bool:
+        """Cancel queued jobs and wait for the running one; False if it is still running"""
+        with self._cond:
+            self._stopping = True
+            cancelled = list(self._queue)
+            self._queue.clear()
+            now = time.time()
+            for job in cancelled:
+                job.status = 'cancelled'
+                job.finished_at = now
+            self._cond.notify_all()
+            thread = self._thread
+        for job in cancelled:
+            job._done.set()
+        if thread is not None and thread is not threading.current_thread():
+            thread.join(timeout)
+            return not thread.is_alive()
+        return True
+
+    def _worker(self):
+        while True:
+            with self._cond:
+                while not self._queue and not self._stopping:
+                    self._cond.wait()
+                if not self._queue:
+                    return
+                job = self._queue.popleft()
+                job.status = 'running'
+                job.started_at = time.time()
+                self._current = job
+
+            try:
+                self.run(job.kind)
+                job.status = 'succeeded'
+            except Exception as e:
+                job.status = 'failed'
+                job.error = str(e)
+                logger.error(f"Job {job.id} ({job.kind}) failed: {str(e)}")
+            finally:
+                with self._cond:
+                    job.finished_at = time.time()
+                    self._current = None
+                job._done.set()
+
+    def record_outcome(self, outcome: str):
+        """Count a finished document towards the running job's progress"""
+        with self._cond:
+            job = self._current
+            if job is not None:
+                job.progress[outcome] = job.progress.get(outcome, 0) + 1
+
+    def get(self, job_id: str) -> Optional[Job]:
+        with self._cond:
+            return self._jobs.get(job_id)
+
+    def snapshot(self) -> Dict:
+        with self._cond:
+            return {
+                'running': self._current.to_dict() if self._current else None,
+                'queued': [job.to_dict() for job in self._queue],
+                'recent': [job.to_dict() for job in reversed(self._jobs.values())
+                           if job.status not in ('queued', 'running')][:20]
+            }
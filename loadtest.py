@@ -0,0 +1,173 @@
+#!/usr/bin/env python3
+"""
+End-to-end load test for the Paperless-Bigcapital middleware.
+Starts the local Paperless-NGX and Bigcapital simulators, points a
+PaperlessBigcapitalMiddleware at them and keeps running cycles until the whole
+corpus is processed, then reports documents per second and tail latency.
+"""
+
+import argparse
+import configparser
+import logging
+import sys
+import tempfile
+import time
+from pathlib import Path
+from typing import Dict, List
+
+from middleware import DocumentProcessor, PaperlessBigcapitalMiddleware
+from simulators import CUSTOMER_NAMES, BigcapitalSimulator, FaultConfig, PaperlessSimulator
+
+
+def percentile(values: List[float], pct: float) -> float:
+    """Nearest-rank percentile"""
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    index = max(0, min(len(ordered) - 1, int(round(pct / 100.0 * len(ordered) + 0.5)) - 1))
+    return ordered[index]
+
+
+def extraction_mismatches(paperless: PaperlessSimulator) -> List[str]:
+    """Generated documents whose extracted customer is not the one they were generated for"""
+    mismatches = []
+    for doc_id, doc in sorted(paperless.documents.items()):
+        extract = DocumentProcessor.extract_receipt_data if 2 in doc['tags'] else DocumentProcessor.extract_invoice_data
+        extracted = extract(doc['content'], doc_id).customer_name
+        if extracted != paperless.customer_of[doc_id]:
+            mismatches.append(f"document {doc_id}: extracted {extracted!r}, expected {paperless.customer_of[doc_id]!r}")
+    return mismatches
+
+
+def write_config(path: Path, paperless_url: str, bigcapital_url: str, args) -> str:
+    """Write a middleware config pointing at the simulators"""
+    config = configparser.ConfigParser()
+    config['paperless'] = {
+        'url': paperless_url,
+        'token': 'load-test',
+        'invoice_tags': 'invoice',
+        'receipt_tags': 'receipt',
+        'correspondents': ''
+    }
+    config['bigcapital'] = {
+        'url': bigcapital_url,
+        'token': 'load-test',
+        'auto_create_customers': 'true',
+        'default_due_days': '30'
+    }
+    config['processing'] = {
+        'processed_tag': 'bc-processed',
+        'error_tag': 'bc-error',
+        'check_interval': '1',
+        'batch_size': str(args.batch_size),
+        'max_retries': str(args.max_retries),
+        'retry_delay': '1',
+        'fetch_workers': str(args.workers),
+        'post_workers': str(args.workers),
+        'tag_workers': str(args.workers),
+        'extract_workers': str(args.extract_workers),
+        'extract_mode': args.extract_mode,
+        'work_queue': 'memory'
+    }
+    with open(path, 'w') as f:
+        config.write(f)
+    return str(path)
+
+
+def run_load_test(args) -> Dict:
+    """Process the simulated corpus and collect throughput and latency figures"""
+    faults = FaultConfig(args.latency, error_rate=args.error_rate, rate_limit_rate=args.rate_limit_rate)
+    paperless = PaperlessSimulator(args.documents, faults=faults, seed=args.seed).start()
+    bigcapital = BigcapitalSimulator(faults=faults, seed=args.seed).start()
+    # A corpus that extracts to the wrong customers would load test one customer only
+    mismatches = extraction_mismatches(paperless)
+    if mismatches:
+        paperless.stop()
+        bigcapital.stop()
+        raise SystemExit("Simulated documents do not extract their customer:\n" + '\n'.join(mismatches[:10]))
+
+    with tempfile.TemporaryDirectory() as tmp:
+        config_path = write_config(Path(tmp) / 'config.ini', paperless.url, bigcapital.url, args)
+        middleware = PaperlessBigcapitalMiddleware(config_path)
+        logging.getLogger().setLevel(getattr(logging, args.log_level))
+
+        started = time.time()
+        cycles = 0
+        try:
+            while time.time() - started < args.timeout:
+                try:
+                    middleware.process_documents()
+                except Exception as e:
+                    # Faults can fail a whole discovery scan; the next cycle retries it
+                    logging.warning(f"Cycle failed: {e}")
+                cycles += 1
+                finished = set(paperless.processed_ids('bc-processed')) | set(paperless.processed_ids('bc-error'))
+                if len(finished) >= args.documents:
+                    break
+                time.sleep(0.5)  # let retry backoff timers come due
+        finally:
+            elapsed = time.time() - started
+            middleware.close()
+            paperless.stop()
+            bigcapital.stop()
+
+    processed = paperless.processed_ids('bc-processed')
+    latencies = [paperless.tagged_at[doc_id]['bc-processed'] - paperless.first_fetched[doc_id]
+                 for doc_id in processed if doc_id in paperless.first_fetched]
+    statuses = {}
+    for (method, route, status), count in sorted(paperless.requests.items()) + sorted(bigcapital.requests.items()):
+        statuses[f"{method} {route} {status}"] = count
+
+    return {
+        'documents': args.documents,
+        'processed': len(processed),
+        'errors': len(paperless.processed_ids('bc-error')),
+        'cycles': cycles,
+        'elapsed': elapsed,
+        'docs_per_second': len(processed) / elapsed if elapsed else 0.0,
+        'latency': {p: percentile(latencies, p) for p in (50, 90, 95, 99, 100)},
+        'invoices': len(bigcapital.invoices),
+        'receipts': len(bigcapital.receipts),
+        'customers': sorted(customer['name'] for customer in bigcapital.customers.values()),
+        'requests': statuses
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Load test the middleware against local simulators')
+    parser.add_argument('--documents', type=int, default=500, help='Corpus size')
+    parser.add_argument('--latency', type=float, default=0.02, help='Mean upstream latency per request (seconds)')
+    parser.add_argument('--error-rate', type=float, default=0.0, help='Probability of a 503 response')
+    parser.add_argument('--rate-limit-rate', type=float, default=0.0, help='Probability of a 429 response')
+    parser.add_argument('--workers', type=int, default=4, help='Workers per network-bound stage')
+    parser.add_argument('--extract-workers', type=int, default=2)
+    parser.add_argument('--extract-mode', choices=['process', 'thread'], default='process')
+    parser.add_argument('--batch-size', type=int, default=50)
+    parser.add_argument('--max-retries', type=int, default=5)
+    parser.add_argument('--timeout', type=float, default=600, help='Give up after this many seconds')
+    parser.add_argument('--seed', type=int, default=1)
+    parser.add_argument('--log-level', default='WARNING')
+
+    args = parser.parse_args()
+    result = run_load_test(args)
+
+    print(f"Processed {result['processed']}/{result['documents']} documents "
+          f"({result['errors']} errors) in {result['elapsed']:.1f}s over {result['cycles']} cycles")
+    print(f"Throughput: {result['docs_per_second']:.2f} documents/s")
+    latency = result['latency']
+    print(f"End-to-end latency: p50 {latency[50]:.3f}s  p90 {latency[90]:.3f}s  "
+          f"p95 {latency[95]:.3f}s  p99 {latency[99]:.3f}s  max {latency[100]:.3f}s")
+    print(f"Bigcapital: {result['invoices']} invoices, {result['receipts']} receipts, "
+          f"{len(result['customers'])} customers")
+    # Each generated name must be created exactly once, however many posts race for it
+    expected = sorted(set(CUSTOMER_NAMES) & set(result['customers']))
+    if result['customers'] != expected:
+        print(f"Unexpected Bigcapital customers: {result['customers']}")
+        sys.exit(1)
+    print("Upstream requests:")
+    for key, count in result['requests'].items():
+        print(f"  {key}: {count}")
+
+
+if __name__ == '__main__':
+    main()
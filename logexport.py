@@ -0,0 +1,201 @@
+#!/usr/bin/env python3
+"""
+Streaming export of the middleware log, including its rotated segments.
+The log is read in fixed-size chunks, optionally filtered by time range and
+minimum level and gzip-compressed on the fly, so exporting a multi-GB log
+uses constant memory. Unfiltered exports support HTTP byte ranges.
+"""
+
+import json
+import logging
+import os
+import re
+import zlib
+from datetime import datetime
+from pathlib import Path
+from typing import BinaryIO, Iterable, Iterator, List, Optional, Tuple
+
+CHUNK_SIZE = 64 * 1024
+
+# JsonFormatter writes timestamp and level first; older plain-text logs use
+# the "%(asctime)s - %(levelname)s - %(message)s" format
+_JSON_LINE = re.compile(rb'^\{"timestamp": "(\d{4}-\d\d-\d\d)T(\d\d:\d\d:\d\d)[^"]*", "level": "(\w+)"')
+_TEXT_LINE = re.compile(rb'^(\d{4}-\d\d-\d\d) (\d\d:\d\d:\d\d),\d+ - (\w+) - ')
+
+
+def log_segments(log_file: str) -> List[Path]:
+    """The log file and its rotated backups, oldest first"""
+    path = Path(log_file)
+    backups = []
+    for candidate in path.parent.glob(f"{path.name}.*"):
+        suffix = candidate.name[len(path.name) + 1:]
+        if suffix.isdigit():
+            backups.append((int(suffix), candidate))
+    segments = [candidate for _, candidate in sorted(backups, reverse=True)]
+    if path.exists():
+        segments.append(path)
+    return segments
+
+
+def _normalize_time(value: Optional[str], end_of_day: bool = False) -> Optional[bytes]:
+    """'2024-05-01' or an ISO datetime as sortable 'YYYY-MM-DD HH:MM:SS' bytes.
+
+    A bare date means its first second, or its last with ``end_of_day``, so
+    ``until=2024-05-01`` includes that whole day.
+    """
+    if not value:
+        return None
+    parsed = datetime.fromisoformat(value)
+    if end_of_day and len(value) == 10:
+        parsed = parsed.replace(hour=23, minute=59, second=59)
+    return parsed.strftime('%Y-%m-%d %H:%M:%S').encode()
+
+
+def _level_number(name: str) -> Optional[int]:
+    """Numeric value of a level name, or None for names logging does not know"""
+    number = logging.getLevelName(str(name).upper())
+    return number if isinstance(number, int) else None
+
+
+def _parse_line(line: bytes) -> Tuple[Optional[bytes], Optional[str]]:
+    """Timestamp and level of a log line, or (None, None) for continuation lines"""
+    match = _JSON_LINE.match(line) or _TEXT_LINE.match(line)
+    if match:
+        return match.group(1) + b' ' + match.group(2), match.group(3).decode()
+    if line.startswith(b'{'):
+        try:
+            entry = json.loads(line)
+            return entry['timestamp'].replace('T', ' ')[:19].encode(), entry['level']
+        except (ValueError, KeyError, AttributeError):
+            pass
+    return None, None
+
+
+class LogExport:
+    """Snapshot of the log segments at request time, readable as one stream.
+
+    Segments are opened up front, so a rotation during the download neither
+    breaks nor changes the export.
+    """
+
+    def __init__(self, log_file: str, since: str = None, until: str = None, level: str = None,
+                 chunk_size: int = CHUNK_SIZE):
+        self.since = _normalize_time(since)
+        self.until = _normalize_time(until, end_of_day=True)
+        self.min_level = None
+        if level:
+            self.min_level = _level_number(level)
+            if self.min_level is None:
+                raise ValueError(f"Unknown log level: {level}")
+        self.chunk_size = chunk_size
+
+        self.files: List[BinaryIO] = []
+        for path in log_segments(log_file):
+            # A segment last written before ``since`` cannot hold matching lines
+            if self.since and datetime.fromtimestamp(path.stat().st_mtime).strftime(
+                    '%Y-%m-%d %H:%M:%S').encode() < self.since:
+                continue
+            try:
+                self.files.append(open(path, 'rb'))
+            except FileNotFoundError:
+                continue  # Rotated away between listing and opening
+        self.sizes = [os.fstat(f.fileno()).st_size for f in self.files]
+
+    @property
+    def filtered(self) -> bool:
+        return bool(self.since or self.until or self.min_level)
+
+    @property
+    def total_size(self) -> int:
+        return sum(self.sizes)
+
+    def iter_bytes(self, start: int = 0, end: int = None) -> Iterator[bytes]:
+        """Raw bytes ``start``..``end`` (inclusive) of the concatenated segments"""
+        end = self.total_size - 1 if end is None else end
+        offset = 0
+        for f, size in zip(self.files, self.sizes):
+            if offset + size <= start:
+                offset += size
+                continue
+            if offset > end:
+                break
+            f.seek(max(0, start - offset))
+            remaining = min(size, end - offset + 1) - max(0, start - offset)
+            while remaining > 0:
+                chunk = f.read(min(self.chunk_size, remaining))
+                if not chunk:
+                    break
+                remaining -= len(chunk)
+                yield chunk
+            offset += size
+
+    def iter_filtered(self) -> Iterator[bytes]:
+        """Lines matching the time range and level, in chunks of about ``chunk_size``"""
+        keep = False
+        buffer: List[bytes] = []
+        buffered = 0
+        for f, size in zip(self.files, self.sizes):
+            f.seek(0)
+            read = 0
+            for line in f:
+                read += len(line)
+                if read > size:
+                    break  # Written after the snapshot
+                timestamp, level = _parse_line(line)
+                if timestamp is not None:
+                    if self.until and timestamp > self.until:
+                        if buffer:
+                            yield b''.join(buffer)
+                        return  # Segments are chronological, nothing later matches
+                    # Lines with a level logging does not know only pass an unfiltered level
+                    keep = ((not self.since or timestamp >= self.since) and
+                            (not self.min_level or (_level_number(level) or 0) >= self.min_level))
+                # Continuation lines (tracebacks) follow the line they belong to
+                if keep:
+                    buffer.append(line)
+                    buffered += len(line)
+                    if buffered >= self.chunk_size:
+                        yield b''.join(buffer)
+                        buffer, buffered = [], 0
+        if buffer:
+            yield b''.join(buffer)
+
+    def close(self):
+        for f in self.files:
+            f.close()
+        self.files = []
+
+
+def gzip_chunks(chunks: Iterable[bytes], level: int = 6) -> Iterator[bytes]:
+    """Compress a byte stream into gzip format chunk by chunk"""
+    compressor = zlib.compressobj(level, zlib.DEFLATED, 31)  # 31: gzip header and trailer
+    for chunk in chunks:
+        compressed = compressor.compress(chunk)
+        if compressed:
+            yield compressed
+    yield compressor.flush()
+
+
+def parse_range(header: Optional[str], total: int) -> Optional[Tuple[int, int]]:
+    """Parse a single ``bytes=`` Range header into an inclusive (start, end).
+
+    Returns ``None`` when there is no usable range header and raises
+    ``ValueError`` for a range that cannot be satisfied.
+    """
+    if not header or not header.startswith('bytes=') or ',' in header:
+        return None
+    first, _, last = header[len('bytes='):].strip().partition('-')
+    try:
+        if not first:
+            length = int(last)
+            if length <= 0:
+                raise ValueError("Empty suffix range")
+            start, end = max(0, total - length), total - 1
+        else:
+            start = int(first)
+            end = min(int(last), total - 1) if last else total - 1
+    except ValueError:
+        raise ValueError(f"Invalid range: {header}")
+    if start >= total or start > end:
+        raise ValueError(f"Range not satisfiable: {header}")
+    return start, end
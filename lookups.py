@@ -0,0 +1,157 @@
+#!/usr/bin/env python3
+"""
+In-memory typeahead indexes of Bigcapital accounts and customers.
+Each catalogue is loaded in full on a timer and rebuilt into a sorted list of
+search terms, so a lookup is a binary search over memory: editor page loads
+and keystrokes never reach the database or Bigcapital. A failed sync keeps
+serving the previous index.
+"""
+
+import bisect
+import hashlib
+import json
+import logging
+import threading
+import time
+from typing import Callable, Dict, Iterable, List, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+# A loader returns every record of one catalogue
+Loader = Callable[[], List[Dict]]
+
+
+def _normalize(text) -> str:
+    return ' '.join(str(text).lower().split())
+
+
+class PrefixIndex:
+    """Records searchable by a prefix of any of their ``fields``, or of any word in them.
+
+    Matches on the start of the first field (e.g. the account code or
+    customer name) rank ahead of matches further in.
+    """
+
+    def __init__(self, records: Iterable[Dict], fields: Tuple[str, ...]):
+        self.records = list(records)
+        terms = []
+        for position, record in enumerate(self.records):
+            for rank, field in enumerate(fields):
+                value = record.get(field)
+                if value in (None, ''):
+                    continue
+                text = _normalize(value)
+                terms.append((text, rank * 2, position))
+                for word in text.split(' ')[1:]:
+                    terms.append((word, rank * 2 + 1, position))
+        terms.sort()
+        self._keys = [term for term, _, _ in terms]
+        self._entries = [(rank, position) for _, rank, position in terms]
+        # Changes whenever the records do, so clients can revalidate cheaply
+        self.version = hashlib.sha256(
+            json.dumps(self.records, sort_keys=True, default=str).encode()).hexdigest()[:16]
+
+    def search(self, prefix: str, limit: int = 20) -> List[Dict]:
+        prefix = _normalize(prefix)
+        if not prefix:
+            return self.records[:limit]
+        best: Dict[int, int] = {}
+        start = bisect.bisect_left(self._keys, prefix)
+        for i in range(start, len(self._keys)):
+            if not self._keys[i].startswith(prefix):
+                break
+            rank, position = self._entries[i]
+            if rank < best.get(position, rank + 1):
+                best[position] = rank
+        ordered = sorted(best, key=lambda position: (best[position], position))
+        return [self.records[position] for position in ordered[:limit]]
+
+    def __len__(self):
+        return len(self.records)
+
+
+class LookupCatalog:
+    """Keeps one ``PrefixIndex`` per catalogue, re-synced every ``interval`` seconds.
+
+    ``catalogues`` maps a name to ``(loader, fields)``. Records are kept in
+    the order the loader returns them, which is also the order of an empty
+    search. ``seed`` installs records to serve until the first sync succeeds.
+    """
+
+    def __init__(self, catalogues: Dict[str, Tuple[Loader, Tuple[str, ...]]], interval: float = 300.0):
+        self.catalogues = catalogues
+        self.interval = interval
+        # Replaced wholesale on every sync, so readers never need the lock
+        self._indexes: Dict[str, PrefixIndex] = {name: PrefixIndex([], fields)
+                                                 for name, (_, fields) in catalogues.items()}
+        self._status: Dict[str, Dict] = {name: {'synced_at': None, 'error': None} for name in catalogues}
+        # Bumped when a sync of a catalogue starts; a load only installs if it is still the newest
+        self._generations: Dict[str, int] = {name: 0 for name in catalogues}
+        self._lock = threading.Lock()
+        self._wakeup = threading.Event()
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    def start(self):
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._run, name='lookup-sync', daemon=True)
+            self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        self._wakeup.set()
+
+    def _run(self):
+        while not self._stop.is_set():
+            self.sync()
+            self._wakeup.wait(self.interval)
+            self._wakeup.clear()
+
+    def seed(self, name: str, records: List[Dict]):
+        """Serve ``records`` until a sync replaces them, unless one already has"""
+        fields = self.catalogues[name][1]
+        with self._lock:
+            if self._status[name]['synced_at'] is None:
+                self._indexes = {**self._indexes, name: PrefixIndex(records, fields)}
+
+    def sync(self, names: Iterable[str] = None):
+        """Reload catalogues now; one that fails keeps its previous index.
+
+        Loading and indexing happen outside the lock, which only guards
+        installing the result, so a slow upstream never blocks ``seed`` or a
+        concurrent sync of another catalogue.
+        """
+        for name in names or self.catalogues:
+            loader, fields = self.catalogues[name]
+            with self._lock:
+                self._generations[name] += 1
+                generation = self._generations[name]
+            started = time.perf_counter()
+            try:
+                index = PrefixIndex(loader(), fields)
+            except Exception as e:
+                with self._lock:
+                    if generation == self._generations[name]:
+                        self._status[name] = {**self._status[name], 'error': str(e)}
+                logger.warning(f"Syncing {name} lookup failed: {str(e)}")
+                continue
+            with self._lock:
+                if generation != self._generations[name]:
+                    continue  # A sync that started later owns this catalogue now
+                self._indexes = {**self._indexes, name: index}
+                self._status[name] = {'synced_at': time.time(), 'error': None}
+            logger.info(f"Synced {len(index)} {name} in {time.perf_counter() - started:.2f}s")
+
+    def request_sync(self):
+        """Sync again soon, without waiting for the interval"""
+        self._wakeup.set()
+
+    def index(self, name: str) -> PrefixIndex:
+        return self._indexes[name]
+
+    def search(self, name: str, prefix: str, limit: int = 20) -> List[Dict]:
+        return self._indexes[name].search(prefix, limit)
+
+    def stats(self) -> Dict[str, Dict]:
+        return {name: {'records': len(index), 'version': index.version, **self._status[name]}
+                for name, index in self._indexes.items()}
@@ -0,0 +1,256 @@
+#!/usr/bin/env python3
+"""
+Prometheus-style metrics for the Paperless-Bigcapital middleware.
+Counters, gauges and latency histograms are kept in process and rendered in
+the Prometheus text exposition format by ``render()``, which the web backend
+serves at ``/metrics``.
+"""
+
+import threading
+import time
+from contextlib import contextmanager
+from typing import Callable, Dict, Iterable, List, Optional, Tuple
+
+CONTENT_TYPE = 'text/plain; version=0.0.4; charset=utf-8'
+
+# Seconds; spans a fast cache hit up to a slow upstream call with retries
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+
+
+def _format_value(value: float) -> str:
+    if value == float('inf'):
+        return '+Inf'
+    if float(value).is_integer():
+        return str(int(value))
+    return repr(float(value))
+
+
+def _format_labels(names: Tuple[str, ...], values: Tuple[str, ...], extra: Dict[str, str] = None) -> str:
+    pairs = list(zip(names, values)) + list((extra or {}).items())
+    if not pairs:
+        return ''
+    escaped = (str(value).replace('\\', '\\\\').replace('\n', '\\n').replace('"', '\\"')
+               for _, value in pairs)
+    return '{' + ','.join(f'{name}="{value}"' for (name, _), value in zip(pairs, escaped)) + '}'
+
+
+class _Metric:
+    """Base for a metric family with a fixed set of label names"""
+
+    kind = ''
+
+    def __init__(self, name: str, documentation: str, labelnames: Iterable[str] = ()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._values: Dict[Tuple[str, ...], object] = {}
+        self._lock = threading.Lock()
+
+    def _key(self, labels: Dict[str, object]) -> Tuple[str, ...]:
+        if set(labels) != set(self.labelnames):
+            raise ValueError(f"{self.name} expects labels {self.labelnames}, got {tuple(labels)}")
+        return tuple(str(labels[name]) for name in self.labelnames)
+
+    def _samples(self) -> List[str]:
+        raise NotImplementedError
+
+    def render(self) -> str:
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.kind}"]
+        lines.extend(self._samples())
+        return '\n'.join(lines)
+
+    def clear(self):
+        with self._lock:
+            self._values.clear()
+
+
+class Counter(_Metric):
+    """Monotonically increasing count"""
+
+    kind = 'counter'
+
+    def inc(self, amount: float = 1, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def value(self, **labels) -> float:
+        with self._lock:
+            return self._values.get(self._key(labels), 0)
+
+    def _samples(self) -> List[str]:
+        with self._lock:
+            items = sorted(self._values.items())
+        return [f"{self.name}{_format_labels(self.labelnames, key)} {_format_value(value)}"
+                for key, value in items]
+
+
+class Gauge(_Metric):
+    """Value that goes up and down; may be computed at scrape time with ``set_function``"""
+
+    kind = 'gauge'
+
+    def __init__(self, name: str, documentation: str, labelnames: Iterable[str] = ()):
+        super().__init__(name, documentation, labelnames)
+        self._function: Optional[Callable[[], Dict[Tuple[str, ...], float]]] = None
+
+    def set(self, value: float, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = value
+
+    def set_function(self, function: Optional[Callable[[], Dict[Tuple[str, ...], float]]]):
+        """Collect values from ``function`` on every scrape.
+
+        ``function`` returns a mapping of label value tuples (in ``labelnames``
+        order, ``()`` for an unlabelled gauge) to values.
+        """
+        self._function = function
+
+    def _samples(self) -> List[str]:
+        values = {}
+        if self._function is not None:
+            try:
+                values = dict(self._function())
+            except Exception:
+                values = {}  # A failing source must not break the whole scrape
+        with self._lock:
+            values = {**self._values, **values}
+        return [f"{self.name}{_format_labels(self.labelnames, key)} {_format_value(value)}"
+                for key, value in sorted(values.items())]
+
+
+class Histogram(_Metric):
+    """Distribution of observed values in cumulative buckets"""
+
+    kind = 'histogram'
+
+    def __init__(self, name: str, documentation: str, labelnames: Iterable[str] = (),
+                 buckets: Iterable[float] = DEFAULT_BUCKETS):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(sorted(buckets)) + (float('inf'),)
+
+    def observe(self, value: float, **labels):
+        key = self._key(labels)
+        with self._lock:
+            state = self._values.get(key)
+            if state is None:
+                state = self._values[key] = {'counts': [0] * len(self.buckets), 'sum': 0.0, 'count': 0}
+            for index, bound in enumerate(self.buckets):
+                if value <= bound:
+                    state['counts'][index] += 1
+                    break
+            state['sum'] += value
+            state['count'] += 1
+
+    @contextmanager
+    def time(self, **labels):
+        """Observe how long the ``with`` block takes"""
+        started = time.monotonic()
+        try:
+            yield
+        finally:
+            self.observe(time.monotonic() - started, **labels)
+
+    def snapshot(self, **labels) -> Dict[str, float]:
+        with self._lock:
+            state = self._values.get(self._key(labels))
+            return {'count': state['count'], 'sum': state['sum']} if state else {'count': 0, 'sum': 0.0}
+
+    def _samples(self) -> List[str]:
+        with self._lock:
+            items = sorted((key, {'counts': list(state['counts']), 'sum': state['sum'], 'count': state['count']})
+                           for key, state in self._values.items())
+        lines = []
+        for key, state in items:
+            cumulative = 0
+            for bound, count in zip(self.buckets, state['counts']):
+                cumulative += count
+                labels = _format_labels(self.labelnames, key, {'le': _format_value(bound)})
+                lines.append(f"{self.name}_bucket{labels} {cumulative}")
+            labels = _format_labels(self.labelnames, key)
+            lines.append(f"{self.name}_sum{labels} {_format_value(state['sum'])}")
+            lines.append(f"{self.name}_count{labels} {state['count']}")
+        return lines
+
+
+class Registry:
+    """Collection of metric families rendered together"""
+
+    def __init__(self):
+        self._metrics: Dict[str, _Metric] = {}
+        self._lock = threading.Lock()
+
+    def register(self, metric: _Metric) -> _Metric:
+        with self._lock:
+            if metric.name in self._metrics:
+                raise ValueError(f"Metric {metric.name} is already registered")
+            self._metrics[metric.name] = metric
+        return metric
+
+    def render(self) -> str:
+        with self._lock:
+            metrics = list(self._metrics.values())
+        return '\n'.join(metric.render() for metric in metrics) + '\n'
+
+
+REGISTRY = Registry()
+
+
+def render() -> str:
+    """All metrics in the Prometheus text exposition format"""
+    return REGISTRY.render()
+
+
+# Pipeline
+STAGE_SECONDS = REGISTRY.register(Histogram(
+    'middleware_stage_duration_seconds', 'Time spent processing one item in a pipeline stage', ['stage']))
+STAGE_ITEMS = REGISTRY.register(Counter(
+    'middleware_stage_items_total', 'Items leaving a pipeline stage by outcome (processed, dropped, failed)',
+    ['stage', 'outcome']))
+STAGE_QUEUE_DEPTH = REGISTRY.register(Gauge(
+    'middleware_stage_queue_depth', 'Items waiting in the inbound queue of a pipeline stage', ['stage']))
+
+# Processing cycles and documents
+CYCLE_SECONDS = REGISTRY.register(Histogram(
+    'middleware_cycle_duration_seconds', 'Duration of a discovery and processing cycle'))
+DOCUMENTS = REGISTRY.register(Counter(
+    'middleware_documents_total', 'Documents finished by outcome (done, retry, dead, skipped)', ['outcome']))
+WORK_QUEUE_DEPTH = REGISTRY.register(Gauge(
+    'middleware_work_queue_depth', 'Documents in the work queue by status', ['status']))
+
+# Upstream HTTP calls
+HTTP_REQUESTS = REGISTRY.register(Counter(
+    'middleware_http_requests_total', 'Requests to upstream services by status code',
+    ['upstream', 'method', 'status']))
+HTTP_SECONDS = REGISTRY.register(Histogram(
+    'middleware_http_request_duration_seconds', 'Latency of requests to upstream services',
+    ['upstream', 'method']))
+
+# Database
+DB_QUERY_SECONDS = REGISTRY.register(Histogram(
+    'middleware_db_query_duration_seconds', 'Time the work queue database takes to execute a statement',
+    buckets=(0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0)))
+DB_POOL_WAIT_SECONDS = REGISTRY.register(Histogram(
+    'middleware_db_pool_wait_seconds', 'Time spent waiting for a pooled database connection',
+    buckets=(0.0005, 0.001, 0.005, 0.01, 0.05, 0.1, 0.5, 1.0, 5.0)))
+DB_ERRORS = REGISTRY.register(Counter(
+    'middleware_db_errors_total', 'Database operations that raised an error'))
+
+# Caches
+CACHE_REQUESTS = REGISTRY.register(Counter(
+    'middleware_cache_requests_total', 'Cache lookups by result (hit, miss)', ['cache', 'result']))
+CACHE_HIT_RATIO = REGISTRY.register(Gauge(
+    'middleware_cache_hit_ratio', 'Share of cache lookups served from the cache since start', ['cache']))
+
+
+def _cache_hit_ratios() -> Dict[Tuple[str, ...], float]:
+    totals: Dict[str, Dict[str, float]] = {}
+    with CACHE_REQUESTS._lock:
+        for (cache, result), count in CACHE_REQUESTS._values.items():
+            totals.setdefault(cache, {})[result] = count
+    return {(cache, ): counts.get('hit', 0) / sum(counts.values())
+            for cache, counts in totals.items() if sum(counts.values())}
+
+
+CACHE_HIT_RATIO.set_function(_cache_hit_ratios)
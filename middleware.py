@@ -6,15 +6,26 @@ Automates the import of financial documents from Paperless-NGX into Bigcapital
 
 import json
 import logging
+import os
 import re
+import threading
 import time
+from contextlib import contextmanager
 from datetime import datetime, timedelta
 from pathlib import Path
 from typing import Dict, List, Optional, Tuple
 import requests
+from requests.adapters import HTTPAdapter
 from dataclasses import dataclass
 import configparser
 
+import metrics
+import tracing
+from asynclog import configure_logging
+from pipeline import Pipeline, Stage
+from polling import AdaptivePollScheduler
+from workqueue import LeaseHeartbeat, MemoryWorkQueue, PostgresWorkQueue, is_transient_error
+
 
 @dataclass
 class DocumentData:
@@ -36,17 +47,79 @@ class DocumentData:
             self.line_items = []
 
 
+@dataclass
+class WorkItem:
+    """A document moving through the processing pipeline"""
+    doc_id: int
+    doc_type: str  # 'invoice' or 'receipt'
+    doc: Dict = None
+    content: Optional[str] = None
+    data: Optional[DocumentData] = None
+    attempts: int = 1
+    posted: bool = False  # created in Bigcapital; retries must not post it again
+    trace: Optional[tracing.SpanContext] = None
+
+
+class InstrumentedAdapter(HTTPAdapter):
+    """HTTP adapter that records request counts and latency per upstream"""
+    
+    def __init__(self, upstream: str, **kwargs):
+        self.upstream = upstream
+        super().__init__(**kwargs)
+    
+    def send(self, request, **kwargs):
+        started = time.monotonic()
+        status = 'error'  # No response, e.g. a connection failure or timeout
+        try:
+            with tracing.TRACER.span(f"{self.upstream} {request.method}", url=request.path_url) as span:
+                response = super().send(request, **kwargs)
+                status = str(response.status_code)
+                if span is not None:
+                    span.attributes['status'] = response.status_code
+            return response
+        finally:
+            metrics.HTTP_REQUESTS.inc(upstream=self.upstream, method=request.method, status=status)
+            metrics.HTTP_SECONDS.observe(time.monotonic() - started,
+                                         upstream=self.upstream, method=request.method)
+
+
+def _build_session(headers: Dict[str, str], pool_size: int, upstream: str) -> requests.Session:
+    """Create a session whose connection pool can serve every pipeline worker"""
+    session = requests.Session()
+    session.headers.update(headers)
+    _mount_pool(session, pool_size, upstream)
+    return session
+
+
+def _mount_pool(session: requests.Session, pool_size: int, upstream: str):
+    """(Re)size the connection pool used by a session, closing the pools it replaces"""
+    previous = {session.adapters.get(prefix) for prefix in ('http://', 'https://')}
+    adapter = InstrumentedAdapter(upstream, pool_connections=pool_size, pool_maxsize=pool_size)
+    session.mount('http://', adapter)
+    session.mount('https://', adapter)
+    for old_adapter in previous - {None, adapter}:
+        old_adapter.close()
+
+
 class PaperlessNGXClient:
     """Client for interacting with Paperless-NGX API"""
     
-    def __init__(self, base_url: str, token: str):
+    def __init__(self, base_url: str, token: str, pool_size: int = 10):
         self.base_url = base_url.rstrip('/')
         self.headers = {
             'Authorization': f'Token {token}',
             'Content-Type': 'application/json'
         }
-        self.session = requests.Session()
-        self.session.headers.update(self.headers)
+        self.session = _build_session(self.headers, pool_size, 'paperless')
+        self.tag_cache_ttl = 60
+        self._tag_cache: Optional[Dict[str, int]] = None
+        self._tag_cache_time = 0.0
+        self._tag_create_lock = threading.Lock()
+    
+    def ping(self, timeout: float = 5):
+        """Cheap authenticated request to check connectivity; raises on failure"""
+        response = self.session.get(f"{self.base_url}/api/", timeout=timeout)
+        response.raise_for_status()
     
     def get_documents(self, tags: List[str] = None, correspondents: List[str] = None) -> List[Dict]:
         """Fetch documents from Paperless-NGX based on filters"""
@@ -68,6 +141,48 @@ class PaperlessNGXClient:
         response.raise_for_status()
         return response.json().get('results', [])
     
+    def iter_document_pages(self, params: Dict = None, page_size: int = 100):
+        """Yield (page of documents, total count) for every page of a filtered listing"""
+        url = f"{self.base_url}/api/documents/"
+        page = 1
+        while True:
+            response = self.session.get(url, params={**(params or {}), 'page': page, 'page_size': page_size})
+            response.raise_for_status()
+            body = response.json()
+            results = body.get('results', [])
+            if results:
+                yield results, body.get('count', 0)
+            if not results or not body.get('next'):
+                return
+            page += 1
+    
+    @tracing.traced('paperless.get_document')
+    def get_document(self, doc_id: int) -> Dict:
+        """Get a single document's metadata"""
+        url = f"{self.base_url}/api/documents/{doc_id}/"
+        response = self.session.get(url)
+        response.raise_for_status()
+        return response.json()
+    
+    # Files Paperless serves per document: the original, an archived PDF for viewing, a thumbnail
+    FILE_VARIANTS = ('download', 'preview', 'thumb')
+    
+    def stream_document_file(self, doc_id: int, variant: str = 'preview', chunk_size: int = 64 * 1024):
+        """Content type and a chunk iterator for one of a document's files"""
+        if variant not in self.FILE_VARIANTS:
+            raise ValueError(f"Unknown file variant {variant!r}")
+        url = f"{self.base_url}/api/documents/{doc_id}/{variant}/"
+        response = self.session.get(url, stream=True, timeout=60)
+        response.raise_for_status()
+        content_type = response.headers.get('Content-Type', 'application/octet-stream')
+        
+        def chunks():
+            with response:
+                yield from response.iter_content(chunk_size)
+        
+        return content_type, chunks()
+    
+    @tracing.traced('paperless.get_document_content')
     def get_document_content(self, doc_id: int) -> str:
         """Get the OCR content of a document"""
         url = f"{self.base_url}/api/documents/{doc_id}/"
@@ -77,8 +192,14 @@ class PaperlessNGXClient:
     
     def add_tag_to_document(self, doc_id: int, tag_name: str):
         """Add a tag to a document (e.g., for marking as processed or error)"""
-        # First get or create the tag
-        tag_id = self._get_or_create_tag(tag_name)
+        self.update_document_tags(doc_id, add=[tag_name])
+    
+    @tracing.traced('paperless.update_document_tags')
+    def update_document_tags(self, doc_id: int, add: List[str] = None, remove: List[str] = None):
+        """Add and remove tags on a document with a single update"""
+        # First get or create the tags to add
+        add_ids = [self._get_or_create_tag(name) for name in add or []]
+        remove_ids = set(self._get_tag_ids(remove or []))
         
         # Get current document tags
         doc_url = f"{self.base_url}/api/documents/{doc_id}/"
@@ -86,25 +207,34 @@ class PaperlessNGXClient:
         response.raise_for_status()
         doc_data = response.json()
         
-        # Add new tag if not already present
         current_tags = doc_data.get('tags', [])
-        if tag_id not in current_tags:
-            current_tags.append(tag_id)
-            
-            # Update document
-            update_data = {'tags': current_tags}
+        new_tags = [tag for tag in current_tags if tag not in remove_ids]
+        new_tags += [tag for tag in add_ids if tag not in new_tags]
+        
+        # Update document only if something changed
+        if new_tags != current_tags:
+            update_data = {'tags': new_tags}
             response = self.session.patch(doc_url, json=update_data)
             response.raise_for_status()
     
+    def _get_tag_map(self) -> Dict[str, int]:
+        """Map lower-case tag names to IDs, cached for ``tag_cache_ttl`` seconds"""
+        if self._tag_cache is None or time.monotonic() - self._tag_cache_time > self.tag_cache_ttl:
+            metrics.CACHE_REQUESTS.inc(cache='paperless_tags', result='miss')
+            url = f"{self.base_url}/api/tags/"
+            response = self.session.get(url, params={'page_size': 1000})
+            response.raise_for_status()
+            
+            tags = response.json().get('results', [])
+            self._tag_cache = {tag['name'].lower(): tag['id'] for tag in tags}
+            self._tag_cache_time = time.monotonic()
+        else:
+            metrics.CACHE_REQUESTS.inc(cache='paperless_tags', result='hit')
+        return self._tag_cache
+    
     def _get_tag_ids(self, tag_names: List[str]) -> List[int]:
         """Convert tag names to IDs"""
-        url = f"{self.base_url}/api/tags/"
-        response = self.session.get(url)
-        response.raise_for_status()
-        
-        tags = response.json().get('results', [])
-        tag_map = {tag['name'].lower(): tag['id'] for tag in tags}
-        
+        tag_map = self._get_tag_map()
         return [tag_map[name.lower()] for name in tag_names if name.lower() in tag_map]
     
     def _get_correspondent_ids(self, correspondent_names: List[str]) -> List[int]:
@@ -119,35 +249,53 @@ class PaperlessNGXClient:
         return [correspondent_map[name.lower()] for name in correspondent_names 
                 if name.lower() in correspondent_map]
     
+    @tracing.traced('paperless.get_or_create_tag')
     def _get_or_create_tag(self, tag_name: str) -> int:
         """Get existing tag ID or create new tag"""
-        url = f"{self.base_url}/api/tags/"
-        response = self.session.get(url, params={'name': tag_name})
-        response.raise_for_status()
-        
-        results = response.json().get('results', [])
-        if results:
-            return results[0]['id']
+        tag_id = self._get_tag_map().get(tag_name.lower())
+        if tag_id is not None:
+            return tag_id
         
-        # Create new tag
-        create_data = {'name': tag_name}
-        response = self.session.post(url, json=create_data)
-        response.raise_for_status()
-        return response.json()['id']
+        # Serialize creation so concurrent tag workers don't create duplicate tags
+        with self._tag_create_lock:
+            url = f"{self.base_url}/api/tags/"
+            response = self.session.get(url, params={'name': tag_name})
+            response.raise_for_status()
+            
+            results = response.json().get('results', [])
+            if results:
+                return results[0]['id']
+            
+            # Create new tag
+            create_data = {'name': tag_name}
+            response = self.session.post(url, json=create_data)
+            response.raise_for_status()
+            self._tag_cache = None
+            return response.json()['id']
 
 
 class BigcapitalClient:
     """Client for interacting with Bigcapital API"""
     
-    def __init__(self, base_url: str, token: str):
+    def __init__(self, base_url: str, token: str, pool_size: int = 10):
         self.base_url = base_url.rstrip('/')
         self.headers = {
             'Authorization': f'Bearer {token}',
             'Content-Type': 'application/json'
         }
-        self.session = requests.Session()
-        self.session.headers.update(self.headers)
+        self.session = _build_session(self.headers, pool_size, 'bigcapital')
+        # Normalized name -> customer, so each customer is looked up and created once
+        self._customers: Dict[str, Dict] = {}
+        self._customer_locks: Dict[str, threading.Lock] = {}
+        self._customer_locks_lock = threading.Lock()
     
+    def ping(self, timeout: float = 5):
+        """Cheap authenticated request to check connectivity; raises on failure"""
+        url = f"{self.base_url}/api/customers"
+        response = self.session.get(url, params={'page_size': 1}, timeout=timeout)
+        response.raise_for_status()
+    
+    @tracing.traced('bigcapital.find_customer')
     def find_customer(self, name: str) -> Optional[Dict]:
         """Find customer by name"""
         url = f"{self.base_url}/api/customers"
@@ -159,7 +307,31 @@ class BigcapitalClient:
             if customer['name'].lower() == name.lower():
                 return customer
         return None
-    
+
+    def _list_all(self, path: str, page_size: int, timeout: float) -> List[Dict]:
+        """Every record of a paginated list endpoint; ``timeout`` applies per page"""
+        url = f"{self.base_url}{path}"
+        records, page = [], 1
+        while True:
+            response = self.session.get(url, params={'page': page, 'page_size': page_size}, timeout=timeout)
+            response.raise_for_status()
+            batch = response.json().get('data', [])
+            records.extend(batch)
+            if len(batch) < page_size:
+                return records
+            page += 1
+
+    @tracing.traced('bigcapital.list_accounts')
+    def list_accounts(self, page_size: int = 500, timeout: float = 30) -> List[Dict]:
+        """All accounts in the chart of accounts"""
+        return self._list_all('/api/accounts', page_size, timeout)
+
+    @tracing.traced('bigcapital.list_customers')
+    def list_customers(self, page_size: int = 500, timeout: float = 30) -> List[Dict]:
+        """All customers"""
+        return self._list_all('/api/customers', page_size, timeout)
+
+    @tracing.traced('bigcapital.create_customer')
     def create_customer(self, name: str, email: str = None) -> Dict:
         """Create a new customer"""
         url = f"{self.base_url}/api/customers"
@@ -171,12 +343,26 @@ class BigcapitalClient:
         response.raise_for_status()
         return response.json()
     
+    def get_or_create_customer(self, name: str) -> Dict:
+        """Find a customer by name or create it; concurrent posts for one name create it once"""
+        key = ' '.join(name.lower().split())
+        customer = self._customers.get(key)
+        if customer:
+            return customer
+        
+        with self._customer_locks_lock:
+            lock = self._customer_locks.setdefault(key, threading.Lock())
+        with lock:
+            customer = self._customers.get(key)
+            if customer is None:
+                customer = self.find_customer(name) or self.create_customer(name)
+                self._customers[key] = customer
+        return customer
+    
+    @tracing.traced('bigcapital.create_invoice')
     def create_invoice(self, invoice_data: DocumentData) -> Dict:
         """Create an invoice in Bigcapital"""
-        # Find or create customer
-        customer = self.find_customer(invoice_data.customer_name)
-        if not customer:
-            customer = self.create_customer(invoice_data.customer_name)
+        customer = self.get_or_create_customer(invoice_data.customer_name)
         
         # Prepare invoice payload
         payload = {
@@ -208,12 +394,10 @@ class BigcapitalClient:
         response.raise_for_status()
         return response.json()
     
+    @tracing.traced('bigcapital.create_receipt')
     def create_receipt(self, receipt_data: DocumentData) -> Dict:
         """Create a receipt in Bigcapital"""
-        # Find or create customer
-        customer = self.find_customer(receipt_data.customer_name)
-        if not customer:
-            customer = self.create_customer(receipt_data.customer_name)
+        customer = self.get_or_create_customer(receipt_data.customer_name)
         
         payload = {
             'receipt_number': receipt_data.number,
@@ -376,6 +560,15 @@ class DocumentProcessor:
             return date_str
 
 
+def extract_document(item: WorkItem) -> WorkItem:
+    """Pipeline extraction step; module level so it can run in a worker process"""
+    if item.doc_type == 'invoice':
+        item.data = DocumentProcessor.extract_invoice_data(item.content, item.doc_id)
+    else:
+        item.data = DocumentProcessor.extract_receipt_data(item.content, item.doc_id)
+    return item
+
+
 class MiddlewareConfig:
     """Configuration management"""
     
@@ -432,6 +625,27 @@ class MiddlewareConfig:
         return self.config.getint(section, key, fallback=fallback)
 
 
+# Settings applied on reload by rebuilding or updating just the component that
+# uses them. Settings not listed are read from the config each time they are used.
+RELOAD_COMPONENTS = {
+    'paperless_client': {('paperless', 'url'), ('paperless', 'token')},
+    'bigcapital_client': {('bigcapital', 'url'), ('bigcapital', 'token')},
+    'tags': {('paperless', 'invoice_tags'), ('paperless', 'receipt_tags'),
+             ('processing', 'processed_tag'), ('processing', 'error_tag')},
+    'pipeline': {('processing', key) for key in ('fetch_workers', 'extract_workers', 'post_workers',
+                                                 'tag_workers', 'extract_mode', 'pipeline_queue_size')},
+    'logging': {('processing', 'log_level')},
+    'tracing': {('tracing', key) for key in ('enabled', 'keep_documents', 'export', 'export_path')},
+    'scheduler': {('processing', key) for key in ('adaptive_polling', 'min_interval', 'max_interval')},
+    'retries': {('processing', 'max_retries'), ('processing', 'retry_delay')},
+}
+
+# Settings that only take effect after a restart
+RESTART_SETTINGS = {('processing', key) for key in ('log_file', 'log_max_bytes', 'log_backup_count',
+                                                    'work_queue', 'worker_id', 'lease_seconds')}
+RESTART_SECTIONS = {'database', 'web_interface'}
+
+
 class PaperlessBigcapitalMiddleware:
     """Main middleware class"""
     
@@ -440,19 +654,49 @@ class PaperlessBigcapitalMiddleware:
         self._setup_logging()
         
         # Initialize clients
-        self.paperless = PaperlessNGXClient(
-            self.config.get('paperless', 'url'),
-            self.config.get('paperless', 'token')
-        )
-        
-        self.bigcapital = BigcapitalClient(
-            self.config.get('bigcapital', 'url'),
-            self.config.get('bigcapital', 'token')
-        )
+        self.paperless = self._build_paperless_client()
+        self.bigcapital = self._build_bigcapital_client()
+        # Clients rebuilt by a reload while a cycle runs wait here until it ends
+        self._pending_clients: Dict[str, object] = {}
+        self._cycles_running = 0
+        self._cycle_lock = threading.Lock()
         
         self.processor = DocumentProcessor()
         
         # Tags for filtering and marking
+        self._load_tags()
+        
+        self.pipeline = self._build_pipeline()
+        self.work_queue = self._build_work_queue(config_path)
+        self.leases = LeaseHeartbeat(self.work_queue, self.work_queue.lease_seconds / 3)
+        self.leases.start()
+        self._configure_tracing()
+        metrics.WORK_QUEUE_DEPTH.set_function(
+            lambda: {(status,): count for status, count in self.work_queue.depth().items()})
+        
+        # Set when queued work should be drained before the next polling sweep
+        self.wakeup = threading.Event()
+        
+        # Called with (item, outcome) whenever a document is done, retried or dead-lettered
+        self.outcome_listeners = []
+        
+        self.scheduler = self._build_scheduler()
+    
+    def _build_paperless_client(self) -> 'PaperlessNGXClient':
+        return PaperlessNGXClient(
+            self.config.get('paperless', 'url'),
+            self.config.get('paperless', 'token'),
+            pool_size=self._http_pool_size()
+        )
+    
+    def _build_bigcapital_client(self) -> 'BigcapitalClient':
+        return BigcapitalClient(
+            self.config.get('bigcapital', 'url'),
+            self.config.get('bigcapital', 'token'),
+            pool_size=self._http_pool_size()
+        )
+    
+    def _load_tags(self):
         self.invoice_tags = [tag.strip() for tag in 
                            self.config.get('paperless', 'invoice_tags', '').split(',') if tag.strip()]
         self.receipt_tags = [tag.strip() for tag in 
@@ -460,87 +704,417 @@ class PaperlessBigcapitalMiddleware:
         self.processed_tag = self.config.get('processing', 'processed_tag', 'bc-processed')
         self.error_tag = self.config.get('processing', 'error_tag', 'bc-error')
     
+    def _configure_tracing(self):
+        tracing.TRACER.configure(
+            enabled=self.config.getboolean('tracing', 'enabled', True),
+            keep_documents=self.config.getint('tracing', 'keep_documents', 500),
+            exporter=tracing.build_exporter(self.config.get('tracing', 'export', 'none'),
+                                            self.config.get('tracing', 'export_path', 'traces.jsonl'))
+        )
+    
+    def _build_scheduler(self) -> Optional[AdaptivePollScheduler]:
+        if not self.config.getboolean('processing', 'adaptive_polling', False):
+            return None
+        return AdaptivePollScheduler(
+            min_interval=self.config.getint('processing', 'min_interval', 30),
+            max_interval=self.config.getint('processing', 'max_interval', 1800),
+            initial_interval=self.config.getint('processing', 'check_interval', 300),
+            target_batch=self.config.getint('processing', 'batch_size', 10)
+        )
+    
+    def _build_work_queue(self, config_path: str):
+        """Use the shared PostgreSQL queue when replicas must cooperate, else keep it in memory"""
+        backend = os.getenv('WORK_QUEUE', self.config.get('processing', 'work_queue', 'memory'))
+        worker_id = os.getenv('WORKER_ID', self.config.get('processing', 'worker_id', '')) or None
+        lease_seconds = self.config.getint('processing', 'lease_seconds', 300)
+        max_retries = self.config.getint('processing', 'max_retries', 3)
+        retry_delay = self.config.getint('processing', 'retry_delay', 60)
+        
+        if backend == 'postgres':
+            from dbmanager import get_db_manager
+            return PostgresWorkQueue(get_db_manager(config_path), worker_id, lease_seconds,
+                                     max_retries, retry_delay)
+        return MemoryWorkQueue(worker_id, lease_seconds, max_retries, retry_delay)
+    
+    def _build_pipeline(self, io_workers: int = None) -> Pipeline:
+        """Build the fetch -> extract -> validate -> post -> tag pipeline
+        
+        ``io_workers`` overrides the worker count of every network-bound stage.
+        """
+        extract_kind = self.config.get('processing', 'extract_mode', 'process')
+        tag_workers = io_workers or self.config.getint('processing', 'tag_workers', 2)
+        stages = [
+            Stage('fetch', self._fetch_stage, io_workers or self.config.getint('processing', 'fetch_workers', 4)),
+            Stage('extract', extract_document, self.config.getint('processing', 'extract_workers', 2),
+                  kind='process' if extract_kind == 'process' else 'thread'),
+            # Validation is cheap but tags rejected documents, so it shares the tag sizing
+            Stage('validate', self._validate_stage, tag_workers),
+            Stage('post', self._post_stage, io_workers or self.config.getint('processing', 'post_workers', 2)),
+            Stage('tag', self._tag_stage, tag_workers),
+        ]
+        return Pipeline(
+            stages,
+            queue_size=self.config.getint('processing', 'pipeline_queue_size', 20),
+            on_error=self._handle_stage_error,
+            stage_context=self._stage_span
+        )
+    
+    def _stage_span(self, stage: Stage, item: WorkItem):
+        """Tracing span around one stage of a document's trip through the pipeline"""
+        return tracing.TRACER.span(f"stage.{stage.name}", parent=item.trace, kind=stage.kind)
+    
+    def scale_workers(self, io_workers: int):
+        """Rebuild the pipeline with ``io_workers`` per network stage, e.g. for a backfill"""
+        self.pipeline.close()
+        self.pipeline = self._build_pipeline(io_workers)
+        for client, upstream in ((self.paperless, 'paperless'), (self.bigcapital, 'bigcapital')):
+            _mount_pool(client.session, max(10, io_workers * 3), upstream)
+    
+    def _http_pool_size(self) -> int:
+        """Connection pool size large enough for every concurrent I/O worker"""
+        return max(10, sum(self.config.getint('processing', key, 4) for key in
+                           ('fetch_workers', 'post_workers', 'tag_workers')))
+    
     def _setup_logging(self):
-        """Setup logging configuration"""
-        logging.basicConfig(
-            level=logging.INFO,
-            format='%(asctime)s - %(levelname)s - %(message)s',
-            handlers=[
-                logging.FileHandler('middleware.log'),
-                logging.StreamHandler()
-            ]
+        """Setup non-blocking logging: JSON lines to a rotating file plus the console"""
+        configure_logging(
+            level=self.config.get('processing', 'log_level', 'INFO'),
+            log_file=self.config.get('processing', 'log_file', 'middleware.log'),
+            max_bytes=self.config.getint('processing', 'log_max_bytes', 10 * 1024 * 1024),
+            backup_count=self.config.getint('processing', 'log_backup_count', 5)
         )
         self.logger = logging.getLogger(__name__)
     
-    def process_documents(self):
+    def reload_config(self) -> Dict[str, object]:
+        """Re-read the config file and apply only what changed.
+        
+        Each changed setting updates or rebuilds just the component that uses
+        it, so an interval or log level change keeps every warm connection and
+        cache. Documents in flight finish on the components they started with.
+        """
+        old = self.config
+        new = MiddlewareConfig(old.config_path)
+        old_values = {(section, key): value for section in old.config.sections()
+                      for key, value in old.config.items(section)}
+        new_values = {(section, key): value for section in new.config.sections()
+                      for key, value in new.config.items(section)}
+        changed = {setting for setting in old_values.keys() | new_values.keys()
+                   if old_values.get(setting) != new_values.get(setting)}
+        
+        old_pool_size = self._http_pool_size()
+        self.config = new
+        
+        components = {name: settings & changed for name, settings in RELOAD_COMPONENTS.items()
+                      if settings & changed}
+        restart = {setting for setting in changed
+                   if setting in RESTART_SETTINGS or setting[0] in RESTART_SECTIONS}
+        
+        clients = {}
+        if 'paperless_client' in components:
+            clients['paperless'] = self._build_paperless_client()
+        if 'bigcapital_client' in components:
+            clients['bigcapital'] = self._build_bigcapital_client()
+        if clients:
+            self._replace_clients(clients)
+        if 'tags' in components:
+            self._load_tags()
+        if 'pipeline' in components:
+            # The running cycle keeps its pipeline; it is closed when that cycle ends
+            previous, self.pipeline = self.pipeline, self._build_pipeline()
+            previous.retire()
+            if self._http_pool_size() != old_pool_size:
+                for name, client in (('paperless', self.paperless), ('bigcapital', self.bigcapital)):
+                    if f"{name}_client" not in components:
+                        _mount_pool(client.session, self._http_pool_size(), name)
+        if 'logging' in components:
+            logging.getLogger().setLevel(
+                getattr(logging, self.config.get('processing', 'log_level', 'INFO').upper(), logging.INFO))
+        if 'tracing' in components:
+            self._configure_tracing()
+        if 'scheduler' in components:
+            adaptive = self.config.getboolean('processing', 'adaptive_polling', False)
+            if self.scheduler and adaptive:
+                # Keep the observed arrival history; only the bounds move
+                self.scheduler.min_interval = self.config.getint('processing', 'min_interval', 30)
+                self.scheduler.max_interval = self.config.getint('processing', 'max_interval', 1800)
+            else:
+                self.scheduler = self._build_scheduler()
+        if 'retries' in components:
+            self.work_queue.max_retries = self.config.getint('processing', 'max_retries', 3)
+            self.work_queue.retry_delay = self.config.getint('processing', 'retry_delay', 60)
+        
+        applied = {name: sorted(f"{section}.{key}" for section, key in settings)
+                   for name, settings in components.items()}
+        restart_required = sorted(f"{section}.{key}" for section, key in restart)
+        if applied:
+            self.logger.info(f"Configuration reloaded; updated {', '.join(sorted(applied))}")
+        if restart_required:
+            self.logger.warning(f"Restart required to apply: {', '.join(restart_required)}")
+        return {
+            'changed': sorted(f"{section}.{key}" for section, key in changed),
+            'applied': applied,
+            'restart_required': restart_required
+        }
+    
+    def _replace_clients(self, clients: Dict[str, object]):
+        """Swap in rebuilt clients now, or when the running cycle ends.
+        
+        The pipeline stages look the clients up on every call, so swapping
+        mid-cycle would let one document be fetched with the old settings and
+        posted with the new ones.
+        """
+        with self._cycle_lock:
+            if self._cycles_running:
+                # A client still waiting from an earlier reload is never used
+                superseded = [self._pending_clients[name] for name in clients if name in self._pending_clients]
+                self._pending_clients.update(clients)
+            else:
+                superseded = self._swap_clients(clients)
+        for client in superseded:
+            client.session.close()
+    
+    def _swap_clients(self, clients: Dict[str, object]) -> List[object]:
+        """Install ``clients`` by attribute name; returns the ones they replace (caller holds _cycle_lock)"""
+        replaced = []
+        for name, client in clients.items():
+            replaced.append(getattr(self, name))
+            setattr(self, name, client)
+        return replaced
+    
+    @contextmanager
+    def _cycle(self):
+        """Mark a cycle as running so client swaps wait for it to end"""
+        with self._cycle_lock:
+            self._cycles_running += 1
+        try:
+            yield
+        finally:
+            with self._cycle_lock:
+                self._cycles_running -= 1
+                replaced = []
+                if not self._cycles_running and self._pending_clients:
+                    replaced = self._swap_clients(self._pending_clients)
+                    self._pending_clients = {}
+            # Nothing uses the old sessions any more
+            for client in replaced:
+                client.session.close()
+    
+    def process_documents(self) -> int:
         """Main processing function"""
         self.logger.info("Starting document processing...")
         
         try:
-            # Process invoices
-            if self.invoice_tags:
-                invoice_docs = self.paperless.get_documents(tags=self.invoice_tags)
-                self.logger.info(f"Found {len(invoice_docs)} potential invoice documents")
-                
-                for doc in invoice_docs:
-                    self._process_document(doc, 'invoice')
-            
-            # Process receipts
-            if self.receipt_tags:
-                receipt_docs = self.paperless.get_documents(tags=self.receipt_tags)
-                self.logger.info(f"Found {len(receipt_docs)} potential receipt documents")
-                
-                for doc in receipt_docs:
-                    self._process_document(doc, 'receipt')
-                    
+            with self._cycle(), metrics.CYCLE_SECONDS.time():
+                queued = self.work_queue.enqueue(self._discover_documents())
+                self.logger.info(f"Queued {queued} new documents")
+                if self.scheduler:
+                    self.scheduler.record_cycle(queued)
+
+                processed = self.drain_queue()
+            self.logger.info(
+                f"Processed {processed} documents in {self.pipeline.last_duration:.1f}s"
+            )
+            return processed
         except Exception as e:
+            # Re-raised so a failed sweep shows up as a failed job, not an empty one
             self.logger.error(f"Error during document processing: {str(e)}")
+            raise
+    
+    def _discover_documents(self) -> List[Tuple[int, str]]:
+        """List every tagged document not yet processed"""
+        marker_ids = self.paperless._get_tag_ids([self.processed_tag, self.error_tag])
+        pending = []
+        for doc_type, tags in (('invoice', self.invoice_tags), ('receipt', self.receipt_tags)):
+            tag_ids = self.paperless._get_tag_ids(tags)
+            if not tag_ids:
+                continue
+            
+            # Let Paperless leave out finished documents instead of paging through them
+            params = {'tags__id__in': ','.join(map(str, tag_ids)), 'truncate_content': 'true'}
+            if marker_ids:
+                params['tags__id__none'] = ','.join(map(str, marker_ids))
+            
+            found = 0
+            for page, total in self.paperless.iter_document_pages(params):
+                found = total
+                pending.extend((doc['id'], doc_type) for doc in page
+                               if not self._is_document_processed(doc))
+            self.logger.info(f"Found {found} potential {doc_type} documents")
+        return pending
     
-    def _process_document(self, doc: Dict, doc_type: str):
-        """Process a single document"""
-        doc_id = doc['id']
+    def drain_queue(self) -> int:
+        """Claim and process queued documents until none are left for this worker"""
+        batch_size = self.config.getint('processing', 'batch_size', 10)
+        claimed: List[int] = []
         
-        # Skip if already processed
+        try:
+            with self._cycle():
+                results = self.pipeline.run(self._iter_claimed(batch_size, claimed))
+            return len(results)
+        finally:
+            # Anything still leased was never finished; let another worker take it
+            in_flight = set(self.leases.in_flight())
+            for doc_id in claimed:
+                if doc_id in in_flight:
+                    self.leases.discard(doc_id)
+                    self.work_queue.release(doc_id)
+                    tracing.TRACER.finish_document(doc_id, 'released')
+    
+    def _iter_claimed(self, batch_size: int, claimed: List[int]):
+        """Claim batches lazily, as fast as the pipeline accepts work"""
+        while True:
+            entries = self.work_queue.claim(batch_size)
+            if not entries:
+                return
+            for entry in entries:
+                claimed.append(entry.doc_id)
+                self.leases.add(entry.doc_id)
+                trace = tracing.TRACER.start_document(entry.doc_id, doc_type=entry.doc_type,
+                                                      attempt=entry.attempts)
+                yield WorkItem(doc_id=entry.doc_id, doc_type=entry.doc_type,
+                               attempts=entry.attempts, posted=entry.posted, trace=trace)
+    
+    def _fail(self, item: WorkItem, error: str, transient: bool) -> str:
+        """Schedule a retry or dead-letter the document; returns 'retry' or 'dead'"""
+        self.leases.discard(item.doc_id)
+        outcome = self.work_queue.fail(item.doc_id, error, transient, item.posted, item.attempts)
+        self._notify_outcome(item, outcome)
+        if outcome == 'dead':
+            try:
+                self.paperless.add_tag_to_document(item.doc_id, self.error_tag)
+            except Exception as e:
+                self.logger.error(f"Failed to tag document {item.doc_id} as error: {str(e)}")
+        return outcome
+    
+    def _fetch_stage(self, item: WorkItem) -> Optional[WorkItem]:
+        """Get the OCR content of the document"""
+        self.logger.info(f"Processing {item.doc_type} document ID: {item.doc_id}")
+        doc = self.paperless.get_document(item.doc_id)
         if self._is_document_processed(doc):
-            return
+            # Finished after it was queued, e.g. by another replica; never post it twice
+            self.logger.info(f"Document {item.doc_id} is already tagged as processed, skipping")
+            self.leases.discard(item.doc_id)
+            self.work_queue.complete(item.doc_id)
+            self._notify_outcome(item, 'skipped')
+            return None
+        item.content = doc.get('content', '')
+        return item
+    
+    def _validate_stage(self, item: WorkItem) -> Optional[WorkItem]:
+        """Drop documents whose extracted data cannot be posted"""
+        if not self._validate_document_data(item.data):
+            self.logger.warning(f"Invalid data extracted from document {item.doc_id}")
+            self._fail(item, 'Invalid extracted data', transient=False)
+            return None
+        return item
+    
+    def _post_stage(self, item: WorkItem) -> WorkItem:
+        """Create the matching entry in Bigcapital"""
+        if item.posted:
+            self.logger.info(f"Document {item.doc_id} already posted to Bigcapital, retrying tagging only")
+            return item
+        
+        if item.doc_type == 'invoice':
+            self.bigcapital.create_invoice(item.data)
+        else:
+            self.bigcapital.create_receipt(item.data)
         
+        self.logger.info(f"Successfully created {item.doc_type} in Bigcapital for document {item.doc_id}")
+        item.posted = True
+        return item
+    
+    def _tag_stage(self, item: WorkItem) -> WorkItem:
+        """Mark the document as processed"""
+        self.paperless.update_document_tags(item.doc_id, add=[self.processed_tag], remove=[self.error_tag])
+        self.leases.discard(item.doc_id)
+        self.work_queue.complete(item.doc_id)
+        self._notify_outcome(item, 'done')
+        return item
+    
+    def _notify_outcome(self, item: WorkItem, outcome: str):
+        """Tell listeners how a document finished; their errors never fail the document"""
+        metrics.DOCUMENTS.inc(outcome=outcome)
+        tracing.TRACER.finish_document(item.doc_id, outcome)
+        for listener in self.outcome_listeners:
+            try:
+                listener(item, outcome)
+            except Exception as e:
+                self.logger.error(f"Outcome listener failed for document {item.doc_id}: {str(e)}")
+    
+    def _handle_stage_error(self, stage: Stage, item: WorkItem, error: Exception):
+        """Retry transient failures with backoff; dead-letter and tag permanent ones"""
+        transient = is_transient_error(error)
         try:
-            self.logger.info(f"Processing {doc_type} document ID: {doc_id}")
-            
-            # Get document content
-            content = self.paperless.get_document_content(doc_id)
-            
-            # Extract data based on document type
-            if doc_type == 'invoice':
-                data = self.processor.extract_invoice_data(content, doc_id)
-            else:
-                data = self.processor.extract_receipt_data(content, doc_id)
-            
-            # Validate extracted data
-            if not self._validate_document_data(data):
-                self.logger.warning(f"Invalid data extracted from document {doc_id}")
-                self.paperless.add_tag_to_document(doc_id, self.error_tag)
-                return
-            
-            # Create entry in Bigcapital
-            if doc_type == 'invoice':
-                result = self.bigcapital.create_invoice(data)
-            else:
-                result = self.bigcapital.create_receipt(data)
-            
-            self.logger.info(f"Successfully created {doc_type} in Bigcapital for document {doc_id}")
-            
-            # Mark as processed
-            self.paperless.add_tag_to_document(doc_id, self.processed_tag)
-            
+            outcome = self._fail(item, f"{stage.name}: {str(error)}", transient)
         except Exception as e:
-            self.logger.error(f"Error processing document {doc_id}: {str(e)}")
-            self.paperless.add_tag_to_document(doc_id, self.error_tag)
+            self.logger.error(f"Failed to record error for document {item.doc_id}: {str(e)}")
+            outcome = 'dead'
+        
+        if outcome == 'retry':
+            self.logger.warning(f"Transient error processing document {item.doc_id} in {stage.name}, "
+                                f"attempt {item.attempts} will be retried: {str(error)}")
+        else:
+            self.logger.error(f"Error processing document {item.doc_id} in {stage.name}: {str(error)}")
+    
+    def redrive_dead_letters(self, doc_ids: List[int] = None) -> List[int]:
+        """Queue dead-lettered documents (all of them by default) for another attempt"""
+        redriven = self.work_queue.redrive(doc_ids)
+        self.logger.info(f"Re-drove {len(redriven)} dead-lettered documents")
+        if redriven:
+            self.wakeup.set()
+        return redriven
+    
+    def close(self):
+        """Stop lease renewal and release worker processes held by the pipeline"""
+        self.leases.stop()
+        self.pipeline.close()
     
     def _is_document_processed(self, doc: Dict) -> bool:
         """Check if document has already been processed"""
-        doc_tags = [tag['name'] for tag in doc.get('tags', [])]
-        return self.processed_tag in doc_tags or self.error_tag in doc_tags
+        return bool(self._document_tag_names(doc) & {self.processed_tag.lower(), self.error_tag.lower()})
+    
+    def _document_tag_names(self, doc: Dict) -> set:
+        """Lower-case tag names of a document; Paperless lists tags by ID"""
+        id_to_name = None
+        names = set()
+        for tag in doc.get('tags', []):
+            if isinstance(tag, dict):
+                names.add(tag['name'].lower())
+                continue
+            if id_to_name is None:
+                id_to_name = {tag_id: name for name, tag_id in self.paperless._get_tag_map().items()}
+            if tag in id_to_name:
+                names.add(id_to_name[tag])
+        return names
+    
+    def classify_document(self, doc: Dict) -> Optional[str]:
+        """Work out whether a document is an invoice or a receipt from its tags"""
+        names = self._document_tag_names(doc)
+        if names & {tag.lower() for tag in self.invoice_tags}:
+            return 'invoice'
+        if names & {tag.lower() for tag in self.receipt_tags}:
+            return 'receipt'
+        return None
+    
+    def enqueue_document_ids(self, doc_ids: List[int]) -> int:
+        """Queue specific documents, e.g. announced by a Paperless webhook"""
+        entries = []
+        for doc_id in doc_ids:
+            try:
+                doc = self.paperless.get_document(doc_id)
+            except Exception as e:
+                self.logger.error(f"Failed to look up document {doc_id}: {str(e)}")
+                continue
+            
+            doc_type = self.classify_document(doc)
+            if doc_type and not self._is_document_processed(doc):
+                entries.append((doc_id, doc_type))
+        
+        queued = self.work_queue.enqueue(entries)
+        self.logger.info(f"Queued {queued} of {len(doc_ids)} announced documents")
+        if queued:
+            self.wakeup.set()
+        return queued
     
     def _validate_document_data(self, data: DocumentData) -> bool:
         """Validate extracted document data"""
@@ -552,14 +1126,23 @@ class PaperlessBigcapitalMiddleware:
             return False
         return True
     
+    def polling_interval(self) -> int:
+        """Seconds between full scans; webhooks leave only a slow safety-net sweep"""
+        if self.config.getboolean('paperless', 'webhooks', False):
+            return self.config.getint('processing', 'sweep_interval', 3600)
+        if self.scheduler:
+            return int(self.scheduler.current_interval)
+        return self.config.getint('processing', 'check_interval', 300)
+    
     def run_continuously(self):
         """Run the middleware continuously with configurable interval"""
-        interval = self.config.getint('processing', 'check_interval', 300)
-        self.logger.info(f"Starting continuous processing with {interval}s interval")
+        mode = 'adaptive' if self.scheduler else 'fixed'
+        self.logger.info(f"Starting continuous processing with {mode} {self.polling_interval()}s interval")
         
         while True:
             try:
                 self.process_documents()
+                interval = self.polling_interval()
                 self.logger.info(f"Sleeping for {interval} seconds...")
                 time.sleep(interval)
             except KeyboardInterrupt:
@@ -578,14 +1161,32 @@ def main():
     parser.add_argument('--config', default='config.ini', help='Configuration file path')
     parser.add_argument('--once', action='store_true', help='Run once instead of continuously')
     
+    subparsers = parser.add_subparsers(dest='command')
+    backfill_parser = subparsers.add_parser('backfill', help='Import an archive of existing documents, resumably')
+    backfill_parser.add_argument('--since', help='Only documents created on or after this date (YYYY-MM-DD)')
+    backfill_parser.add_argument('--until', help='Only documents created on or before this date (YYYY-MM-DD)')
+    backfill_parser.add_argument('--min-id', type=int, help='Lowest Paperless document ID to import')
+    backfill_parser.add_argument('--max-id', type=int, help='Highest Paperless document ID to import')
+    backfill_parser.add_argument('--workers', type=int, default=8, help='Workers per network-bound stage')
+    backfill_parser.add_argument('--run-id', help='Checkpoint name; defaults to one derived from the filters')
+    backfill_parser.add_argument('--restart', action='store_true', help='Ignore any checkpoint and start over')
+    
     args = parser.parse_args()
     
     middleware = PaperlessBigcapitalMiddleware(args.config)
     
-    if args.once:
-        middleware.process_documents()
-    else:
-        middleware.run_continuously()
+    try:
+        if args.command == 'backfill':
+            from backfill import Backfill
+            Backfill(middleware, since=args.since, until=args.until, min_id=args.min_id,
+                     max_id=args.max_id, workers=args.workers, run_id=args.run_id,
+                     restart=args.restart).run()
+        elif args.once:
+            middleware.process_documents()
+        else:
+            middleware.run_continuously()
+    finally:
+        middleware.close()
 
 
 if __name__ == '__main__':
@@ -0,0 +1,220 @@
+#!/usr/bin/env python3
+"""
+Staged concurrent pipeline for the Paperless-Bigcapital middleware.
+Each stage owns a pool of workers and hands items to the next stage through a
+bounded queue, so a slow stage applies backpressure to everything upstream
+instead of letting work pile up in memory.
+"""
+
+import logging
+import multiprocessing
+import queue
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor
+from contextlib import nullcontext
+from dataclasses import dataclass, field
+from typing import Any, Callable, ContextManager, Dict, Iterable, List, Optional
+
+import metrics
+
+logger = logging.getLogger(__name__)
+
+# Marker passed down the queues when upstream has no more items
+_STOP = object()
+
+
+@dataclass
+class Stage:
+    """A single pipeline stage.
+
+    ``func`` receives an item and returns the item to hand to the next stage,
+    or ``None`` to drop it. Thread stages suit I/O-bound work; process stages
+    run ``func`` in a process pool and need a picklable function and item.
+    """
+    name: str
+    func: Callable[[Any], Any]
+    workers: int = 1
+    kind: str = 'thread'  # 'thread' or 'process'
+
+
+@dataclass
+class StageStats:
+    """Counters collected for a stage during a single run"""
+    processed: int = 0
+    dropped: int = 0
+    failed: int = 0
+    busy_seconds: float = 0.0
+    max_queue_depth: int = 0
+    lock: threading.Lock = field(default_factory=threading.Lock, repr=False, compare=False)
+
+
+class Pipeline:
+    """Runs items through a sequence of stages connected by bounded queues.
+
+    ``stage_context`` optionally returns a context manager entered around each
+    stage call in the worker thread, e.g. a tracing span for the item.
+    """
+
+    def __init__(self, stages: List[Stage], queue_size: int = 10,
+                 on_error: Callable[[Stage, Any, Exception], None] = None,
+                 stage_context: Callable[[Stage, Any], ContextManager] = None):
+        if not stages:
+            raise ValueError("Pipeline needs at least one stage")
+        self.stages = stages
+        self.queue_size = max(1, queue_size)
+        self.on_error = on_error
+        self.stage_context = stage_context
+        self.last_stats: Dict[str, StageStats] = {}
+        self.last_duration = 0.0
+        self._executors: Dict[str, ProcessPoolExecutor] = {}
+        self._executor_lock = threading.Lock()
+        self._active_runs = 0
+        self._retired = False
+
+    def run(self, items: Iterable[Any]) -> List[Any]:
+        """Feed ``items`` through every stage and return what comes out the end.
+
+        ``items`` is consumed lazily, so a generator source is only advanced
+        as fast as the first stage accepts work.
+        """
+        with self._executor_lock:
+            self._active_runs += 1
+        try:
+            return self._run(items)
+        finally:
+            with self._executor_lock:
+                self._active_runs -= 1
+                idle_and_retired = self._retired and not self._active_runs
+            if idle_and_retired:
+                self.close()
+
+    def _run(self, items: Iterable[Any]) -> List[Any]:
+        started = time.monotonic()
+        queues = [queue.Queue(maxsize=self.queue_size) for _ in self.stages]
+        stats = {stage.name: StageStats() for stage in self.stages}
+        results: List[Any] = []
+        results_lock = threading.Lock()
+        threads = []
+
+        for index, stage in enumerate(self.stages):
+            inbox = queues[index]
+            outbox = queues[index + 1] if index + 1 < len(self.stages) else None
+            next_workers = self.stages[index + 1].workers if outbox is not None else 0
+            remaining = {'workers': stage.workers}
+            remaining_lock = threading.Lock()
+
+            for worker_num in range(stage.workers):
+                thread = threading.Thread(
+                    target=self._worker,
+                    args=(stage, inbox, outbox, next_workers, remaining, remaining_lock,
+                          stats[stage.name], results, results_lock),
+                    name=f"pipeline-{stage.name}-{worker_num}",
+                    daemon=True
+                )
+                thread.start()
+                threads.append(thread)
+
+        try:
+            first = queues[0]
+            for item in items:
+                first.put(item)
+        finally:
+            for _ in range(self.stages[0].workers):
+                queues[0].put(_STOP)
+
+        for thread in threads:
+            thread.join()
+
+        self.last_stats = stats
+        self.last_duration = time.monotonic() - started
+        return results
+
+    def _worker(self, stage: Stage, inbox: queue.Queue, outbox: Optional[queue.Queue],
+                next_workers: int, remaining: Dict[str, int], remaining_lock: threading.Lock,
+                stats: StageStats, results: List[Any], results_lock: threading.Lock):
+        """Pull items for one stage until upstream signals it is finished"""
+        while True:
+            item = inbox.get()
+            if item is _STOP:
+                break
+
+            depth = inbox.qsize()
+            metrics.STAGE_QUEUE_DEPTH.set(depth, stage=stage.name)
+            with stats.lock:
+                stats.max_queue_depth = max(stats.max_queue_depth, depth + 1)
+
+            began = time.monotonic()
+            try:
+                with self.stage_context(stage, item) if self.stage_context else nullcontext():
+                    if stage.kind == 'process':
+                        output = self._executor(stage).submit(stage.func, item).result()
+                    else:
+                        output = stage.func(item)
+            except Exception as e:
+                with stats.lock:
+                    stats.failed += 1
+                metrics.STAGE_ITEMS.inc(stage=stage.name, outcome='failed')
+                if self.on_error:
+                    try:
+                        self.on_error(stage, item, e)
+                    except Exception as handler_error:
+                        logger.error(f"Error handler failed in stage {stage.name}: {handler_error}")
+                else:
+                    logger.error(f"Unhandled error in stage {stage.name}: {e}")
+                continue
+            finally:
+                elapsed = time.monotonic() - began
+                metrics.STAGE_SECONDS.observe(elapsed, stage=stage.name)
+                with stats.lock:
+                    stats.busy_seconds += elapsed
+
+            with stats.lock:
+                if output is None:
+                    stats.dropped += 1
+                else:
+                    stats.processed += 1
+            metrics.STAGE_ITEMS.inc(stage=stage.name, outcome='dropped' if output is None else 'processed')
+            if output is None:
+                continue
+
+            if outbox is None:
+                with results_lock:
+                    results.append(output)
+            else:
+                outbox.put(output)
+
+        # The last worker out tells every worker of the next stage to finish
+        with remaining_lock:
+            remaining['workers'] -= 1
+            last_out = remaining['workers'] == 0
+        if last_out and outbox is not None:
+            for _ in range(next_workers):
+                outbox.put(_STOP)
+
+    def _executor(self, stage: Stage) -> ProcessPoolExecutor:
+        """Get the process pool for a stage, creating it on first use"""
+        with self._executor_lock:
+            executor = self._executors.get(stage.name)
+            if executor is None:
+                executor = ProcessPoolExecutor(
+                    max_workers=stage.workers,
+                    mp_context=multiprocessing.get_context('spawn')
+                )
+                self._executors[stage.name] = executor
+            return executor
+
+    def retire(self):
+        """Close the pipeline once runs in progress have finished, e.g. after it was replaced"""
+        with self._executor_lock:
+            self._retired = True
+            busy = self._active_runs > 0
+        if not busy:
+            self.close()
+
+    def close(self):
+        """Shut down any process pools owned by the pipeline"""
+        with self._executor_lock:
+            for executor in self._executors.values():
+                executor.shutdown(wait=False, cancel_futures=True)
+            self._executors.clear()
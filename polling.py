@@ -0,0 +1,82 @@
+#!/usr/bin/env python3
+"""
+Adaptive polling scheduler for the Paperless-Bigcapital middleware.
+Polls quickly while documents keep arriving and backs off exponentially to a
+ceiling while Paperless is idle, so month-end bursts are picked up promptly
+without paying for frequent empty scans overnight.
+"""
+
+import threading
+import time
+from collections import deque
+from typing import Dict, Optional
+
+
+class AdaptivePollScheduler:
+    """Chooses the next polling interval from the outcome of recent cycles"""
+
+    def __init__(self, min_interval: float, max_interval: float, initial_interval: float = None,
+                 backoff: float = 2.0, target_batch: int = 10, window: int = 10):
+        if min_interval <= 0 or max_interval < min_interval:
+            raise ValueError("Polling bounds must satisfy 0 < min_interval <= max_interval")
+        self.min_interval = min_interval
+        self.max_interval = max_interval
+        self.backoff = max(1.0, backoff)
+        self.target_batch = max(1, target_batch)
+        self._interval = self._clamp(initial_interval or min_interval)
+        self._history = deque(maxlen=max(1, window))  # (found, elapsed seconds) per cycle
+        self._last_cycle: Optional[float] = None
+        self._lock = threading.Lock()
+
+    def _clamp(self, interval: float) -> float:
+        return min(self.max_interval, max(self.min_interval, interval))
+
+    def record_cycle(self, found: int, now: float = None) -> float:
+        """Record how many new documents a cycle found and return the next interval.
+
+        Busy cycles shorten the interval towards the time it takes for about
+        ``target_batch`` documents to arrive; idle cycles multiply it by
+        ``backoff`` up to ``max_interval``.
+        """
+        now = time.monotonic() if now is None else now
+        with self._lock:
+            if self._last_cycle is not None:
+                self._history.append((found, now - self._last_cycle))
+            self._last_cycle = now
+
+            if found > 0:
+                interval = self._interval / self.backoff
+                rate = self._arrival_rate()
+                if rate > 0:
+                    interval = min(interval, self.target_batch / rate)
+            else:
+                interval = self._interval * self.backoff
+
+            self._interval = self._clamp(interval)
+            return self._interval
+
+    def _arrival_rate(self) -> float:
+        elapsed = sum(seconds for _, seconds in self._history)
+        if elapsed <= 0:
+            return 0.0
+        return sum(found for found, _ in self._history) / elapsed
+
+    @property
+    def current_interval(self) -> float:
+        with self._lock:
+            return self._interval
+
+    @property
+    def arrival_rate(self) -> float:
+        """New documents per second observed over the recent cycles"""
+        with self._lock:
+            return self._arrival_rate()
+
+    def snapshot(self) -> Dict[str, float]:
+        with self._lock:
+            return {
+                'current_interval': round(self._interval, 1),
+                'arrival_rate_per_hour': round(self._arrival_rate() * 3600, 2),
+                'min_interval': self.min_interval,
+                'max_interval': self.max_interval
+            }
@@ -0,0 +1,217 @@
+#!/usr/bin/env python3
+"""
+On-demand CPU profiling of middleware processing cycles.
+A CycleProfiler is armed for the next N cycles, either with cProfile
+(deterministic, exported as a pstats file) or with a wall-clock stack sampler
+(exported as collapsed stacks for flamegraph.pl or speedscope). While it is
+not armed, wrapping a cycle costs a single attribute check.
+"""
+
+import cProfile
+import logging
+import marshal
+import pstats
+import sys
+import threading
+import time
+from collections import Counter
+from contextlib import contextmanager, nullcontext
+from typing import Dict, List, Optional
+
+logger = logging.getLogger(__name__)
+
+MODES = ('cprofile', 'sampling')
+
+# Threads a cycle starts (the pipeline workers) carry this name prefix;
+# everything else, e.g. web request threads, is left out of the profile
+CYCLE_THREAD_PREFIX = 'pipeline-'
+
+
+class _ThreadProfiles:
+    """cProfile for the profiled thread and the pipeline worker threads started during the cycle"""
+
+    def __init__(self):
+        self.profiles: List[cProfile.Profile] = []
+        self._lock = threading.Lock()
+
+    def _bootstrap(self, frame, event, arg):
+        # Installed with threading.setprofile: runs once in each new thread,
+        # then hands a cycle thread over to its own cProfile instance
+        sys.setprofile(None)
+        if threading.current_thread().name.startswith(CYCLE_THREAD_PREFIX):
+            self.start_thread()
+
+    def start_thread(self) -> cProfile.Profile:
+        profile = cProfile.Profile()
+        with self._lock:
+            self.profiles.append(profile)
+        profile.enable()
+        return profile
+
+    @contextmanager
+    def capture(self):
+        own = self.start_thread()
+        # From 3.12 cProfile hooks sys.monitoring, which is process wide: it
+        # sees every thread and cannot be scoped to the cycle's threads
+        per_thread = sys.version_info < (3, 12)
+        if per_thread:
+            threading.setprofile(self._bootstrap)
+        try:
+            yield
+        finally:
+            if per_thread:
+                threading.setprofile(None)
+            own.disable()
+
+    def stats(self) -> Optional[pstats.Stats]:
+        with self._lock:
+            profiles = list(self.profiles)
+        stats = None
+        for profile in profiles:
+            # Worker threads have exited by now; this only snapshots their data
+            profile.create_stats()
+            if not profile.stats:
+                continue
+            if stats is None:
+                stats = pstats.Stats(profile)
+            else:
+                stats.add(profile)
+        return stats
+
+
+class _StackSampler:
+    """Background thread sampling the stacks of the cycle thread and its pipeline workers"""
+
+    def __init__(self, interval: float):
+        self.interval = interval
+        self.stacks: Counter = Counter()
+        self.samples = 0
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+        self._cycle_thread_id: Optional[int] = None
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            names = {thread.ident: thread.name for thread in threading.enumerate()}
+            for thread_id, frame in sys._current_frames().items():
+                name = names.get(thread_id, '')
+                if thread_id != self._cycle_thread_id and not name.startswith(CYCLE_THREAD_PREFIX):
+                    continue
+                stack = []
+                while frame is not None:
+                    code = frame.f_code
+                    stack.append(f"{code.co_name} ({code.co_filename.rsplit('/', 1)[-1]}:{code.co_firstlineno})")
+                    frame = frame.f_back
+                stack.append(name or str(thread_id))
+                self.stacks[';'.join(reversed(stack))] += 1
+            self.samples += 1
+
+    @contextmanager
+    def capture(self):
+        self._stop.clear()
+        self._cycle_thread_id = threading.get_ident()
+        self._thread = threading.Thread(target=self._run, name='profile-sampler', daemon=True)
+        self._thread.start()
+        try:
+            yield
+        finally:
+            self._stop.set()
+            self._thread.join()
+
+    def collapsed(self) -> str:
+        return ''.join(f"{stack} {count}\n" for stack, count in sorted(self.stacks.items()))
+
+
+class CycleProfiler:
+    """Profiles the next N processing cycles when armed"""
+
+    def __init__(self):
+        self.mode: Optional[str] = None
+        self.remaining = 0
+        self.completed = 0
+        self.started_at: Optional[float] = None
+        self._collector = None
+        self._cycle_done = threading.Event()
+        self._cycle_done.set()
+        self._lock = threading.Lock()
+
+    @property
+    def active(self) -> bool:
+        return self.remaining > 0
+
+    def start(self, cycles: int = 1, mode: str = 'cprofile', interval: float = 0.005):
+        """Arm the profiler for the next ``cycles`` cycles, discarding any previous result"""
+        if mode not in MODES:
+            raise ValueError(f"Unknown profiling mode {mode!r}; expected one of {', '.join(MODES)}")
+        with self._lock:
+            if self.active:
+                raise RuntimeError("A profile is already in progress")
+            self.mode = mode
+            self.completed = 0
+            self.started_at = time.time()
+            self._collector = _ThreadProfiles() if mode == 'cprofile' else _StackSampler(max(0.001, interval))
+            self.remaining = max(1, cycles)
+
+    def cycle(self):
+        """Context manager wrapping one cycle; a no-op unless the profiler is armed"""
+        if not self.remaining:
+            return nullcontext()
+        return self._profiled_cycle()
+
+    @contextmanager
+    def _profiled_cycle(self):
+        with self._lock:
+            collector = self._collector
+            self._cycle_done.clear()
+        try:
+            with collector.capture():
+                yield
+        finally:
+            with self._lock:
+                if collector is self._collector:
+                    self.remaining = max(0, self.remaining - 1)
+                    self.completed += 1
+                self._cycle_done.set()
+            if not self.remaining:
+                logger.info(f"Profiling finished after {self.completed} cycle(s)")
+
+    def stop(self, timeout: float = 30.0) -> Optional[Dict]:
+        """Disarm the profiler, let a cycle in progress finish, and return the result.
+
+        Returns ``None`` when no cycle has been profiled yet. The result holds
+        a ``filename``, a ``mimetype`` and the file ``data``.
+        """
+        with self._lock:
+            self.remaining = 0
+        self._cycle_done.wait(timeout)
+
+        with self._lock:
+            collector, mode, completed = self._collector, self.mode, self.completed
+        if collector is None or not completed:
+            return None
+
+        stamp = time.strftime('%Y%m%d-%H%M%S', time.localtime(self.started_at))
+        if mode == 'cprofile':
+            stats = collector.stats()
+            if stats is None:
+                return None
+            return {
+                'filename': f"middleware-{stamp}.pstats",
+                'mimetype': 'application/octet-stream',
+                'data': marshal.dumps(stats.stats)  # the format pstats.Stats.dump_stats writes
+            }
+        return {
+            'filename': f"middleware-{stamp}.collapsed.txt",
+            'mimetype': 'text/plain',
+            'data': collector.collapsed().encode()
+        }
+
+    def status(self) -> Dict:
+        with self._lock:
+            return {
+                'active': self.active,
+                'mode': self.mode,
+                'remaining_cycles': self.remaining,
+                'completed_cycles': self.completed,
+                'started_at': self.started_at
+            }
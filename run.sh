@@ -42,6 +42,10 @@ token = your-paperless-ngx-api-token
 invoice_tags = invoice,bill,accounts-receivable
 receipt_tags = receipt,payment
 correspondents = 
+webhooks = false
+webhook_secret = 
+webhook_debounce = 5
+webhook_max_wait = 30
 
 [bigcapital]
 url = http://localhost:3000
@@ -64,16 +68,44 @@ pool_recycle = 3600
 processed_tag = bc-processed
 error_tag = bc-error
 check_interval = 300
+adaptive_polling = false
+min_interval = 30
+max_interval = 1800
+sweep_interval = 3600
+health_interval = 30
 log_level = INFO
+log_file = middleware.log
+log_max_bytes = 10485760
+log_backup_count = 5
 batch_size = 10
 max_retries = 3
 retry_delay = 60
+fetch_workers = 4
+extract_workers = 2
+extract_mode = process
+post_workers = 2
+tag_workers = 2
+pipeline_queue_size = 20
+work_queue = memory
+lease_seconds = 300
+
+[tracing]
+enabled = true
+keep_documents = 500
+export = none
+export_path = traces.jsonl
 
 [web_interface]
 host = 0.0.0.0
 port = 5000
 secret_key = your-secret-key-here
 debug = false
+file_cache_dir = file_cache
+file_cache_max_mb = 512
+file_cache_max_age = 3600
+lookup_sync_interval = 300
+async_mode = threading
+message_queue =
 EOF
     fi
     echo -e "${RED}Please edit config.ini with your API tokens and database settings.${NC}"
@@ -0,0 +1,131 @@
+#!/usr/bin/env python3
+"""
+Production server for the middleware dashboard and the document editor.
+
+    python serve.py dashboard --async-mode gevent --port 5000
+    python serve.py editor --workers 4 --message-queue redis://localhost:6379/0
+    python serve.py editor --rebuild-stats
+
+Unlike the backends' own ``socketio.run(app, debug=True)`` entry points,
+this monkey patches the process for gevent before the backend is
+imported, so every dashboard, Socket.IO and log stream connection is a cheap
+green thread instead of an OS thread. ``--workers`` starts that many server
+processes on consecutive ports; they share Socket.IO broadcasts through the
+message queue and belong behind a load balancer with sticky sessions. Every
+dashboard worker runs the processing loop, so several of them need the
+shared PostgreSQL work queue.
+"""
+
+import argparse
+import configparser
+import importlib.util
+import os
+import signal
+import subprocess
+import sys
+from pathlib import Path
+
+import webserver
+
+ROOT = Path(__file__).resolve().parent
+
+BACKENDS = {
+    'dashboard': ROOT / 'backend' / 'flask.py',
+    'editor': ROOT / 'backend' / 'bde.py',
+}
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description='Serve a web backend under an async worker model')
+    parser.add_argument('backend', choices=sorted(BACKENDS), help='Which web backend to serve')
+    parser.add_argument('--host', default='0.0.0.0')
+    parser.add_argument('--port', type=int, default=5000, help='Port of the first worker')
+    parser.add_argument('--workers', type=int, default=1, help='Server processes, on consecutive ports')
+    parser.add_argument('--async-mode', choices=webserver.ASYNC_MODES,
+                        help='Overrides [web_interface] async_mode')
+    parser.add_argument('--message-queue', help='Overrides [web_interface] message_queue, e.g. redis://redis:6379/0')
+    parser.add_argument('--rebuild-stats', action='store_true',
+                        help="Recompute the editor's status counters from its documents table and exit")
+    args = parser.parse_args(argv)
+    if args.workers < 1:
+        parser.error('--workers must be at least 1')
+    if args.rebuild_stats and args.backend != 'editor':
+        parser.error('--rebuild-stats only applies to the editor')
+    if args.backend == 'dashboard' and args.workers > 1 and work_queue_backend() != 'postgres':
+        parser.error('Several dashboard workers would each process the in-memory queue; '
+                     'set work_queue = postgres or run one worker')
+    return args
+
+
+def work_queue_backend(config_path: str = 'config.ini') -> str:
+    """The work queue the middleware will use, resolved as the middleware does"""
+    config = configparser.ConfigParser()
+    config.read(config_path)
+    return os.getenv('WORK_QUEUE', config.get('processing', 'work_queue', fallback='memory'))
+
+
+def run_workers(args) -> int:
+    """Run one child server per worker until they exit or we are told to stop"""
+    if not webserver.settings()['message_queue']:
+        sys.exit('Several workers need a message queue to share Socket.IO events; set message_queue')
+
+    children = []
+    for index in range(args.workers):
+        command = [sys.executable, str(Path(__file__).resolve()), args.backend,
+                   '--host', args.host, '--port', str(args.port + index)]
+        if args.async_mode:
+            command += ['--async-mode', args.async_mode]
+        if args.message_queue:
+            command += ['--message-queue', args.message_queue]
+        children.append(subprocess.Popen(command))
+
+    def stop(signum, frame):
+        for child in children:
+            child.terminate()
+
+    signal.signal(signal.SIGTERM, stop)
+    signal.signal(signal.SIGINT, stop)
+    return max(child.wait() for child in children)
+
+
+def load_backend(name: str):
+    """Import a backend from its file; backend/ itself must not be on sys.path, as flask.py would shadow Flask"""
+    spec = importlib.util.spec_from_file_location(f"{name}_backend", BACKENDS[name])
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
+
+
+def serve(args):
+    async_mode = webserver.settings()['async_mode']
+    # Before anything else imports socket, threading or ssl
+    webserver.monkey_patch(async_mode)
+
+    backend = load_backend(args.backend)
+    if args.backend == 'dashboard':
+        backend.setup_logging()
+        backend.initialize_middleware()
+
+    print(f"Serving the {args.backend} on {args.host}:{args.port} ({async_mode})")
+    options = {'allow_unsafe_werkzeug': True} if async_mode == 'threading' else {}
+    try:
+        backend.socketio.run(backend.app, host=args.host, port=args.port, debug=False, **options)
+    finally:
+        if args.backend == 'dashboard':
+            backend.shutdown()
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    if args.rebuild_stats:
+        load_backend('editor').rebuild_counters()
+        print("Editor counters rebuilt")
+        return
+    webserver.configure(async_mode=args.async_mode, message_queue=args.message_queue)
+    if args.workers > 1:
+        sys.exit(run_workers(args))
+    serve(args)
+
+
+if __name__ == '__main__':
+    main()
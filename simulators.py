@@ -0,0 +1,474 @@
+#!/usr/bin/env python3
+"""
+Local HTTP simulators of the Paperless-NGX and Bigcapital endpoints used by
+PaperlessNGXClient and BigcapitalClient, for load testing the middleware
+without real instances. Latency, error rate, 429 rate limiting and the size of
+the document corpus are configurable. A minimal Redis pub/sub server stands in
+for the message queue shared by several web workers.
+"""
+
+import json
+import random
+import re
+import socketserver
+import threading
+import time
+from collections import Counter
+from dataclasses import dataclass
+from datetime import date, timedelta
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Dict, List, Optional
+from urllib.parse import parse_qs, urlparse
+
+CUSTOMER_NAMES = ['Acme Corp', 'Globex', 'Initech', 'Umbrella Ltd', 'Stark Industries',
+                  'Wayne Enterprises', 'Hooli', 'Vandelay Industries', 'Soylent Corp', 'Tyrell Corp']
+
+
+@dataclass
+class FaultConfig:
+    """Latency and failures injected into every simulated request"""
+    latency: float = 0.0  # mean seconds added to each request
+    jitter: float = 0.5  # latency varies by +/- this fraction
+    error_rate: float = 0.0  # probability of a 503 response
+    rate_limit_rate: float = 0.0  # probability of a 429 response with Retry-After
+
+
+class _SimulatorHandler(BaseHTTPRequestHandler):
+    """Routes requests to ``do_<METHOD>`` handlers on the owning simulator"""
+
+    protocol_version = 'HTTP/1.1'
+
+    def log_message(self, format, *args):
+        pass  # Keep load test output readable
+
+    def _handle(self, method: str):
+        simulator = self.server.simulator
+        parsed = urlparse(self.path)
+        params = {key: values[-1] for key, values in parse_qs(parsed.query).items()}
+        length = int(self.headers.get('Content-Length') or 0)
+        body = json.loads(self.rfile.read(length) or b'null') if length else None
+
+        status, payload, headers = simulator.dispatch(method, parsed.path, params, body)
+        headers = dict(headers)
+        if isinstance(payload, bytes):
+            data = payload  # A document file; the route sets its Content-Type
+            content_type = headers.pop('Content-Type', 'application/octet-stream')
+        else:
+            data = json.dumps(payload).encode()
+            content_type = 'application/json'
+        self.send_response(status)
+        self.send_header('Content-Type', content_type)
+        self.send_header('Content-Length', str(len(data)))
+        for key, value in headers.items():
+            self.send_header(key, value)
+        self.end_headers()
+        self.wfile.write(data)
+
+    def do_GET(self):
+        self._handle('GET')
+
+    def do_POST(self):
+        self._handle('POST')
+
+    def do_PATCH(self):
+        self._handle('PATCH')
+
+
+class _Simulator:
+    """Threaded HTTP server with fault injection and request accounting"""
+
+    def __init__(self, faults: FaultConfig = None, seed: int = None):
+        self.faults = faults or FaultConfig()
+        self.random = random.Random(seed)
+        self.requests = Counter()  # (method, route, status) -> count
+        self._lock = threading.RLock()
+        self._server: Optional[ThreadingHTTPServer] = None
+        self._thread: Optional[threading.Thread] = None
+
+    @property
+    def url(self) -> str:
+        host, port = self._server.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def start(self, host: str = '127.0.0.1', port: int = 0) -> '_Simulator':
+        self._server = ThreadingHTTPServer((host, port), _SimulatorHandler)
+        self._server.daemon_threads = True
+        self._server.simulator = self
+        self._thread = threading.Thread(target=self._server.serve_forever, daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        if self._server:
+            self._server.shutdown()
+            self._server.server_close()
+            self._server = None
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, exc_type, exc, tb):
+        self.stop()
+
+    def dispatch(self, method: str, path: str, params: Dict, body):
+        """Apply injected latency and faults, then route the request"""
+        if self.faults.latency > 0:
+            spread = self.faults.latency * self.faults.jitter
+            time.sleep(max(0.0, self.faults.latency + self.random.uniform(-spread, spread)))
+
+        route = re.sub(r'/\d+/?', '/{id}/', path)
+        roll = self.random.random()
+        if roll < self.faults.rate_limit_rate:
+            result = (429, {'detail': 'Request was throttled.'}, {'Retry-After': '1'})
+        elif roll < self.faults.rate_limit_rate + self.faults.error_rate:
+            result = (503, {'detail': 'Service unavailable'}, {})
+        else:
+            try:
+                result = self.route(method, path, params, body)
+            except KeyError:
+                result = (404, {'detail': 'Not found.'}, {})
+            if len(result) == 2:
+                result = (*result, {})
+
+        with self._lock:
+            self.requests[(method, route, result[0])] += 1
+        return result
+
+    def route(self, method: str, path: str, params: Dict, body):
+        raise NotImplementedError
+
+
+class PaperlessSimulator(_Simulator):
+    """Simulated Paperless-NGX documents, tags and correspondents API"""
+
+    def __init__(self, corpus_size: int = 100, receipt_ratio: float = 0.3,
+                 faults: FaultConfig = None, seed: int = None):
+        super().__init__(faults, seed)
+        self.tags: Dict[int, Dict] = {1: {'id': 1, 'name': 'invoice'}, 2: {'id': 2, 'name': 'receipt'}}
+        self.documents: Dict[int, Dict] = {}
+        self.first_fetched: Dict[int, float] = {}
+        self.tagged_at: Dict[int, Dict[str, float]] = {}
+        self.customer_of: Dict[int, str] = {}  # the name each generated document bills
+        self.add_documents(corpus_size, receipt_ratio)
+
+    def add_documents(self, count: int, receipt_ratio: float = 0.3) -> List[int]:
+        """Grow the corpus with generated invoices and receipts that extract cleanly.
+
+        The extractor's customer pattern also matches "to" inside words such as
+        "Total" and runs on across lines of letters, so the bill-to line comes
+        before the total and is followed by a line item starting with a digit.
+        """
+        added = []
+        with self._lock:
+            start = max(self.documents, default=0) + 1
+            for doc_id in range(start, start + count):
+                is_receipt = self.random.random() < receipt_ratio
+                customer = self.random.choice(CUSTOMER_NAMES)
+                created = date(2024, 1, 1) + timedelta(days=doc_id % 365)
+                amount = round(self.random.uniform(10, 5000), 2)
+                if is_receipt:
+                    content = (f"Receipt #R-{doc_id:06d}\nDate: {created:%m/%d/%Y}\n"
+                               f"Amount: ${amount:.2f}\nReceived from: {customer}")
+                else:
+                    content = (f"Invoice #INV-{doc_id:06d}\nDate: {created:%m/%d/%Y}\n"
+                               f"Bill to: {customer}\n1 x Services\nTotal: ${amount:.2f}")
+                self.documents[doc_id] = {
+                    'id': doc_id,
+                    'title': f"{'Receipt' if is_receipt else 'Invoice'} {doc_id}",
+                    'content': content,
+                    'tags': [2 if is_receipt else 1],
+                    'correspondent': None,
+                    'created': f"{created.isoformat()}T00:00:00Z"
+                }
+                self.customer_of[doc_id] = customer
+                added.append(doc_id)
+        return added
+
+    def processed_ids(self, tag_name: str) -> List[int]:
+        with self._lock:
+            return [doc_id for doc_id, tags in self.tagged_at.items() if tag_name in tags]
+
+    def route(self, method: str, path: str, params: Dict, body):
+        with self._lock:
+            if path == '/api/documents/' and method == 'GET':
+                return 200, self._list_documents(params)
+
+            match = re.fullmatch(r'/api/documents/(\d+)/', path)
+            if match:
+                doc = self.documents[int(match.group(1))]
+                if method == 'GET':
+                    self.first_fetched.setdefault(doc['id'], time.time())
+                    return 200, doc
+                if method == 'PATCH':
+                    for tag_id in set(body.get('tags', [])) - set(doc['tags']):
+                        self.tagged_at.setdefault(doc['id'], {})[self.tags[tag_id]['name']] = time.time()
+                    doc['tags'] = body.get('tags', doc['tags'])
+                    return 200, doc
+
+            match = re.fullmatch(r'/api/documents/(\d+)/(download|preview|thumb)/', path)
+            if match and method == 'GET':
+                doc = self.documents.get(int(match.group(1)))
+                if doc is None:
+                    return 404, {'detail': 'Not found.'}
+                if match.group(2) == 'thumb':
+                    return 200, b'RIFF\x00\x00\x00\x00WEBP' + doc['title'].encode(), {'Content-Type': 'image/webp'}
+                # Padded so range requests and caching have something to work with
+                body = f"%PDF-1.4\n% {doc['title']}\n{doc['content']}\n".encode() + b'\0' * 64 * 1024
+                return 200, body, {'Content-Type': 'application/pdf'}
+
+            if path == '/api/tags/':
+                if method == 'POST':
+                    tag_id = max(self.tags) + 1
+                    self.tags[tag_id] = {'id': tag_id, 'name': body['name']}
+                    return 201, self.tags[tag_id]
+                tags = [tag for tag in self.tags.values()
+                        if 'name' not in params or tag['name'] == params['name']]
+                return 200, {'count': len(tags), 'next': None, 'results': tags}
+
+            if path == '/api/':
+                return 200, {'documents': '/api/documents/', 'tags': '/api/tags/'}
+
+            if path == '/api/correspondents/':
+                return 200, {'count': 0, 'next': None, 'results': []}
+
+        return 404, {'detail': 'Not found.'}
+
+    def _list_documents(self, params: Dict) -> Dict:
+        docs = sorted(self.documents.values(), key=lambda d: d['id'])
+        if params.get('tags__id__in'):
+            wanted = {int(tag_id) for tag_id in params['tags__id__in'].split(',')}
+            docs = [doc for doc in docs if wanted & set(doc['tags'])]
+        if params.get('tags__id__none'):
+            unwanted = {int(tag_id) for tag_id in params['tags__id__none'].split(',')}
+            docs = [doc for doc in docs if not unwanted & set(doc['tags'])]
+        if params.get('id__gt'):
+            docs = [doc for doc in docs if doc['id'] > int(params['id__gt'])]
+        if params.get('id__lte'):
+            docs = [doc for doc in docs if doc['id'] <= int(params['id__lte'])]
+        if params.get('created__date__gte'):
+            docs = [doc for doc in docs if doc['created'][:10] >= params['created__date__gte']]
+        if params.get('created__date__lte'):
+            docs = [doc for doc in docs if doc['created'][:10] <= params['created__date__lte']]
+
+        page, page_size = int(params.get('page', 1)), int(params.get('page_size', 25))
+        window = docs[(page - 1) * page_size:page * page_size]
+        return {
+            'count': len(docs),
+            'next': f"?page={page + 1}" if page * page_size < len(docs) else None,
+            'previous': f"?page={page - 1}" if page > 1 else None,
+            'results': window
+        }
+
+
+class BigcapitalSimulator(_Simulator):
+    """Simulated Bigcapital accounts, customers, invoices and receipts API"""
+
+    def __init__(self, faults: FaultConfig = None, seed: int = None):
+        super().__init__(faults, seed)
+        self.accounts: List[Dict] = [
+            {'id': 1, 'code': '1000', 'name': 'Cash', 'account_type': 'asset'},
+            {'id': 2, 'code': '4000', 'name': 'Sales Revenue', 'account_type': 'revenue'},
+            {'id': 3, 'code': '6100', 'name': 'Office Supplies', 'account_type': 'expense'},
+        ]
+        self.customers: Dict[int, Dict] = {}
+        self.invoices: List[Dict] = []
+        self.receipts: List[Dict] = []
+
+    def route(self, method: str, path: str, params: Dict, body):
+        with self._lock:
+            if path == '/api/customers':
+                if method == 'POST':
+                    customer_id = len(self.customers) + 1
+                    self.customers[customer_id] = dict(body, id=customer_id)
+                    return 201, self.customers[customer_id]
+                search = params.get('search', '').lower()
+                matches = [c for c in self.customers.values() if search in c['name'].lower()]
+                return 200, {'data': self._page(matches, params)}
+
+            if path == '/api/accounts' and method == 'GET':
+                return 200, {'data': self._page(self.accounts, params)}
+
+            if path == '/api/invoices' and method == 'POST':
+                self.invoices.append(body)
+                return 201, {'id': len(self.invoices), 'data': body}
+
+            if path == '/api/receipts' and method == 'POST':
+                self.receipts.append(body)
+                return 201, {'id': len(self.receipts), 'data': body}
+
+        return 404, {'message': 'Not found'}
+
+    @staticmethod
+    def _page(records: List[Dict], params: Dict) -> List[Dict]:
+        if 'page_size' not in params:
+            return records
+        page, page_size = int(params.get('page', 1)), int(params['page_size'])
+        return records[(page - 1) * page_size:page * page_size]
+
+
+class _RespHandler(socketserver.StreamRequestHandler):
+    """One Redis client connection; commands arrive as RESP arrays of bulk strings"""
+
+    def setup(self):
+        super().setup()
+        self.write_lock = threading.Lock()  # Publishers on other connections write here too
+        self.channels = set()
+
+    def read_command(self) -> Optional[List[bytes]]:
+        line = self.rfile.readline()
+        if not line:
+            return None
+        if not line.startswith(b'*'):
+            return line.split()  # Inline command, e.g. typed into telnet
+        args = []
+        for _ in range(int(line[1:])):
+            size = int(self.rfile.readline()[1:])
+            args.append(self.rfile.read(size + 2)[:-2])
+        return args
+
+    def send(self, reply):
+        with self.write_lock:
+            self.wfile.write(_encode_resp(reply))
+
+    def handle(self):
+        broker = self.server.simulator
+        try:
+            while True:
+                command = self.read_command()
+                if command is None:
+                    break
+                if command:
+                    broker.execute(self, command[0].upper(), command[1:])
+        except (ConnectionError, ValueError):
+            pass
+        finally:
+            broker.unsubscribe(self, list(self.channels), reply=False)
+
+
+class _RespServer(socketserver.ThreadingTCPServer):
+    allow_reuse_address = True
+    daemon_threads = True
+
+
+def _encode_resp(value) -> bytes:
+    if value is None:
+        return b'$-1\r\n'
+    if isinstance(value, Exception):
+        return f"-ERR {value}\r\n".encode()
+    if isinstance(value, int):
+        return f":{value}\r\n".encode()
+    if isinstance(value, str):
+        return f"+{value}\r\n".encode()
+    if isinstance(value, bytes):
+        return b'$%d\r\n%s\r\n' % (len(value), value)
+    return b'*%d\r\n' % len(value) + b''.join(_encode_resp(item) for item in value)
+
+
+class MessageQueueSimulator:
+    """Redis pub/sub stand-in (PUBLISH, SUBSCRIBE, UNSUBSCRIBE, PING) for Socket.IO message queues"""
+
+    def __init__(self):
+        self.published = Counter()  # channel -> messages published
+        self._subscribers: Dict[bytes, set] = {}
+        self._lock = threading.Lock()
+        self._server: Optional[_RespServer] = None
+
+    @property
+    def url(self) -> str:
+        host, port = self._server.server_address[:2]
+        return f"redis://{host}:{port}/0"
+
+    def start(self, host: str = '127.0.0.1', port: int = 0) -> 'MessageQueueSimulator':
+        self._server = _RespServer((host, port), _RespHandler)
+        self._server.simulator = self
+        threading.Thread(target=self._server.serve_forever, daemon=True).start()
+        return self
+
+    def stop(self):
+        if self._server:
+            self._server.shutdown()
+            self._server.server_close()
+            self._server = None
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, exc_type, exc, tb):
+        self.stop()
+
+    def execute(self, client: _RespHandler, command: bytes, args: List[bytes]):
+        if command == b'PING':
+            client.send('PONG')
+        elif command == b'PUBLISH' and len(args) == 2:
+            client.send(self.publish(args[0], args[1]))
+        elif command == b'SUBSCRIBE' and args:
+            for channel in args:
+                with self._lock:
+                    self._subscribers.setdefault(channel, set()).add(client)
+                    client.channels.add(channel)
+                client.send([b'subscribe', channel, len(client.channels)])
+        elif command == b'UNSUBSCRIBE':
+            self.unsubscribe(client, args or list(client.channels))
+        elif command in (b'SELECT', b'CLIENT', b'AUTH'):
+            client.send('OK')  # One keyspace, no names or passwords
+        else:
+            client.send(Exception(f"unknown command '{command.decode(errors='replace')}'"))
+
+    def publish(self, channel: bytes, message: bytes) -> int:
+        with self._lock:
+            self.published[channel.decode(errors='replace')] += 1
+            subscribers = list(self._subscribers.get(channel, ()))
+        delivered = 0
+        for subscriber in subscribers:
+            try:
+                subscriber.send([b'message', channel, message])
+                delivered += 1
+            except OSError:
+                pass  # Gone; its handler cleans up
+        return delivered
+
+    def unsubscribe(self, client: _RespHandler, channels: List[bytes], reply: bool = True):
+        if not channels and reply:
+            client.send([b'unsubscribe', None, 0])
+        for channel in channels:
+            with self._lock:
+                self._subscribers.get(channel, set()).discard(client)
+                client.channels.discard(channel)
+            if reply:
+                client.send([b'unsubscribe', channel, len(client.channels)])
+
+
+if __name__ == "__main__":
+    # Serve both simulators for manual testing against a running middleware
+    import argparse
+
+    parser = argparse.ArgumentParser(description='Run local Paperless-NGX and Bigcapital simulators')
+    parser.add_argument('--documents', type=int, default=100, help='Corpus size')
+    parser.add_argument('--paperless-port', type=int, default=8000)
+    parser.add_argument('--bigcapital-port', type=int, default=3000)
+    parser.add_argument('--latency', type=float, default=0.0, help='Mean latency per request (seconds)')
+    parser.add_argument('--error-rate', type=float, default=0.0, help='Probability of a 503 response')
+    parser.add_argument('--rate-limit-rate', type=float, default=0.0, help='Probability of a 429 response')
+    parser.add_argument('--message-queue-port', type=int,
+                        help='Also serve the Redis pub/sub stand-in, e.g. 6379, for serve.py --message-queue')
+
+    args = parser.parse_args()
+    faults = FaultConfig(args.latency, error_rate=args.error_rate, rate_limit_rate=args.rate_limit_rate)
+
+    paperless = PaperlessSimulator(args.documents, faults=faults).start(port=args.paperless_port)
+    bigcapital = BigcapitalSimulator(faults=faults).start(port=args.bigcapital_port)
+    print(f"Paperless-NGX simulator at {paperless.url} with {args.documents} documents")
+    print(f"Bigcapital simulator at {bigcapital.url}")
+    message_queue = None
+    if args.message_queue_port is not None:
+        message_queue = MessageQueueSimulator().start(port=args.message_queue_port)
+        print(f"Message queue simulator at {message_queue.url}")
+
+    try:
+        while True:
+            time.sleep(1)
+    except KeyboardInterrupt:
+        paperless.stop()
+        bigcapital.stop()
+        if message_queue:
+            message_queue.stop()
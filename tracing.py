@@ -0,0 +1,307 @@
+#!/usr/bin/env python3
+"""
+Per-document tracing for the Paperless-Bigcapital middleware.
+Every processing attempt of a document opens a root span; pipeline stages,
+client calls and upstream HTTP requests open nested spans under it. Recent
+traces are kept in memory for the ``/api/trace/<doc_id>`` waterfall and can be
+exported to a local file as JSON lines or OTLP JSON.
+"""
+
+import contextvars
+import functools
+import json
+import logging
+import os
+import threading
+import time
+from collections import OrderedDict
+from contextlib import contextmanager
+from dataclasses import asdict, dataclass, field
+from typing import Dict, List, Optional
+
+logger = logging.getLogger(__name__)
+
+
+@dataclass
+class SpanContext:
+    """Reference to a span that can travel with a work item, even to another process"""
+    trace_id: str
+    span_id: str
+    doc_id: int
+
+
+@dataclass
+class Span:
+    """A timed operation within a document trace"""
+    name: str
+    trace_id: str
+    span_id: str
+    parent_id: Optional[str]
+    doc_id: int
+    start: float  # wall clock, seconds since the epoch
+    duration: float = 0.0
+    attributes: Dict = field(default_factory=dict)
+    error: Optional[str] = None
+
+    @property
+    def context(self) -> SpanContext:
+        return SpanContext(self.trace_id, self.span_id, self.doc_id)
+
+
+# Innermost open span of the current thread
+_current: contextvars.ContextVar = contextvars.ContextVar('current_span', default=None)
+
+
+def _new_id(size: int) -> str:
+    return os.urandom(size).hex()
+
+
+class JsonLinesExporter:
+    """Append every span as one JSON object per line"""
+
+    def __init__(self, path: str):
+        self.path = path
+        self._lock = threading.Lock()
+
+    def export(self, spans: List[Span]):
+        lines = ''.join(json.dumps(asdict(span), default=str) + '\n' for span in spans)
+        with self._lock, open(self.path, 'a') as f:
+            f.write(lines)
+
+
+class OtlpFileExporter:
+    """Append each trace as an OTLP/JSON ``ExportTraceServiceRequest`` line, as the
+    OpenTelemetry collector's file exporter does"""
+
+    def __init__(self, path: str, service_name: str = 'paperless-bigcapital-middleware'):
+        self.path = path
+        self.service_name = service_name
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def _attribute(key: str, value) -> Dict:
+        if isinstance(value, bool):
+            return {'key': key, 'value': {'boolValue': value}}
+        if isinstance(value, int):
+            return {'key': key, 'value': {'intValue': str(value)}}
+        if isinstance(value, float):
+            return {'key': key, 'value': {'doubleValue': value}}
+        return {'key': key, 'value': {'stringValue': str(value)}}
+
+    def _span(self, span: Span) -> Dict:
+        start = int(span.start * 1e9)
+        otlp = {
+            'traceId': span.trace_id,
+            'spanId': span.span_id,
+            'name': span.name,
+            'kind': 1,  # SPAN_KIND_INTERNAL
+            'startTimeUnixNano': str(start),
+            'endTimeUnixNano': str(start + int(span.duration * 1e9)),
+            'attributes': [self._attribute(key, value) for key, value in
+                           {'document.id': span.doc_id, **span.attributes}.items()],
+            'status': {'code': 2, 'message': span.error} if span.error else {'code': 1}
+        }
+        if span.parent_id:
+            otlp['parentSpanId'] = span.parent_id
+        return otlp
+
+    def export(self, spans: List[Span]):
+        request = {'resourceSpans': [{
+            'resource': {'attributes': [self._attribute('service.name', self.service_name)]},
+            'scopeSpans': [{'scope': {'name': __name__}, 'spans': [self._span(span) for span in spans]}]
+        }]}
+        with self._lock, open(self.path, 'a') as f:
+            f.write(json.dumps(request) + '\n')
+
+
+class Tracer:
+    """Records spans for recent documents and hands finished traces to an exporter"""
+
+    def __init__(self, enabled: bool = True, keep_documents: int = 500, exporter=None):
+        self.enabled = enabled
+        self.keep_documents = keep_documents
+        self.exporter = exporter
+        self.max_spans_per_document = 1000
+        self._documents: 'OrderedDict[int, List[Span]]' = OrderedDict()
+        self._roots: Dict[int, Span] = {}  # open root span per document
+        self._closing: Dict[str, Span] = {}  # finished roots waiting for their open spans
+        self._lock = threading.Lock()
+
+    def configure(self, enabled: bool = True, keep_documents: int = 500, exporter=None):
+        with self._lock:
+            self.enabled = enabled
+            self.keep_documents = max(1, keep_documents)
+            self.exporter = exporter
+            while len(self._documents) > self.keep_documents:
+                self._documents.popitem(last=False)
+
+    def start_document(self, doc_id: int, **attributes) -> Optional[SpanContext]:
+        """Open the root span of a processing attempt"""
+        if not self.enabled:
+            return None
+        root = Span('document', _new_id(16), _new_id(8), None, doc_id, time.time(), attributes=attributes)
+        with self._lock:
+            self._roots[doc_id] = root
+        return root.context
+
+    def finish_document(self, doc_id: int, outcome: str, error: str = None):
+        """Close the document's root span and export its trace.
+
+        Called from inside one of the trace's own spans (e.g. the tag stage),
+        the root is closed once that span exits so the export is complete.
+        """
+        with self._lock:
+            root = self._roots.pop(doc_id, None)
+        if root is None:
+            return
+        root.attributes['outcome'] = outcome
+        root.error = error
+
+        current = _current.get()
+        if current is not None and current.trace_id == root.trace_id:
+            with self._lock:
+                self._closing[root.trace_id] = root
+            return
+        self._close(root)
+
+    def _close(self, root: Span):
+        """Record the finished root span and export the whole trace"""
+        doc_id = root.doc_id
+        root.duration = time.time() - root.start
+        self._record(root)
+
+        if self.exporter is not None:
+            spans = [span for span in self.trace(doc_id) if span.trace_id == root.trace_id]
+            try:
+                self.exporter.export(spans)
+            except Exception as e:
+                logger.error(f"Failed to export trace for document {doc_id}: {e}")
+
+    @contextmanager
+    def span(self, name: str, parent: SpanContext = None, **attributes):
+        """Time the ``with`` block as a child of ``parent`` or of the thread's current span.
+
+        Outside any document trace this does nothing, so instrumented client
+        calls cost nothing when used on their own.
+        """
+        parent = parent or _current.get()
+        if not self.enabled or parent is None:
+            yield None
+            return
+
+        span = Span(name, parent.trace_id, _new_id(8), parent.span_id, parent.doc_id, time.time(),
+                    attributes=attributes)
+        token = _current.set(span.context)
+        began = time.perf_counter()
+        try:
+            yield span
+        except Exception as e:
+            span.error = f"{type(e).__name__}: {e}"
+            raise
+        finally:
+            span.duration = time.perf_counter() - began
+            _current.reset(token)
+            self._record(span)
+            if _current.get() is None:
+                with self._lock:
+                    root = self._closing.pop(span.trace_id, None)
+                if root is not None:
+                    self._close(root)
+
+    def _record(self, span: Span):
+        with self._lock:
+            spans = self._documents.get(span.doc_id)
+            if spans is None:
+                spans = self._documents[span.doc_id] = []
+                while len(self._documents) > self.keep_documents:
+                    self._documents.popitem(last=False)
+            else:
+                self._documents.move_to_end(span.doc_id)
+            if len(spans) < self.max_spans_per_document:
+                spans.append(span)
+
+    def trace(self, doc_id: int) -> List[Span]:
+        """Spans recorded for a document, oldest first"""
+        with self._lock:
+            return sorted(self._documents.get(doc_id, []), key=lambda span: span.start)
+
+    def waterfall(self, doc_id: int) -> List[Dict]:
+        """Traces of a document's recent attempts with each span's offset and depth"""
+        attempts: 'OrderedDict[str, List[Span]]' = OrderedDict()
+        for span in self.trace(doc_id):
+            attempts.setdefault(span.trace_id, []).append(span)
+
+        traces = []
+        for trace_id, spans in attempts.items():
+            by_id = {span.span_id: span for span in spans}
+            root = next((span for span in spans if span.parent_id is None), None)
+            origin = min(span.start for span in spans)
+
+            def depth(span: Span) -> int:
+                level = 0
+                while span.parent_id in by_id:
+                    span = by_id[span.parent_id]
+                    level += 1
+                return level
+
+            traces.append({
+                'trace_id': trace_id,
+                'started_at': origin,
+                'duration_ms': round(root.duration * 1000, 1) if root else None,
+                'outcome': root.attributes.get('outcome') if root else 'in progress',
+                'spans': [{
+                    'name': span.name,
+                    'span_id': span.span_id,
+                    'parent_id': span.parent_id,
+                    'depth': depth(span),
+                    'offset_ms': round((span.start - origin) * 1000, 1),
+                    'duration_ms': round(span.duration * 1000, 1),
+                    'attributes': span.attributes,
+                    'error': span.error
+                } for span in spans]
+            })
+        return traces
+
+    def render_waterfall(self, doc_id: int, width: int = 60) -> str:
+        """Plain-text waterfall of a document's recent attempts"""
+        lines = []
+        for trace in self.waterfall(doc_id):
+            total = max([span['offset_ms'] + span['duration_ms'] for span in trace['spans']] + [0.001])
+            lines.append(f"trace {trace['trace_id']}  outcome={trace['outcome']}  {total:.1f} ms")
+            for span in trace['spans']:
+                start = int(span['offset_ms'] / total * width)
+                length = max(1, int(span['duration_ms'] / total * width))
+                label = ('  ' * span['depth'] + span['name'])[:40]
+                marker = ' !' if span['error'] else ''
+                lines.append(f"  {label:<40} |{' ' * start}{'#' * length:<{width - start}}| "
+                             f"{span['duration_ms']:>9.1f} ms{marker}")
+            lines.append('')
+        return '\n'.join(lines)
+
+
+TRACER = Tracer()
+
+
+def traced(name: str):
+    """Decorator opening a span around a method whenever it runs inside a document trace"""
+    def decorator(func):
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            if _current.get() is None:
+                return func(*args, **kwargs)
+            with TRACER.span(name):
+                return func(*args, **kwargs)
+        return wrapper
+    return decorator
+
+
+def build_exporter(kind: str, path: str):
+    """Exporter for the ``[tracing] export`` setting: none, jsonl or otlp"""
+    kind = (kind or 'none').lower()
+    if kind == 'jsonl':
+        return JsonLinesExporter(path)
+    if kind == 'otlp':
+        return OtlpFileExporter(path)
+    if kind != 'none':
+        raise ValueError(f"Unknown trace exporter: {kind}")
+    return None
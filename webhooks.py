@@ -0,0 +1,161 @@
+#!/usr/bin/env python3
+"""
+Paperless-NGX workflow webhook handling for the Paperless-Bigcapital middleware.
+Webhook calls are parsed into document ids and held in a debounce window, so a
+burst of events for the same document (added, then updated, then re-tagged)
+is coalesced into a single enqueue once the document has gone quiet.
+"""
+
+import logging
+import re
+import threading
+import time
+from typing import Any, Callable, Dict, List, Optional
+
+import requests
+
+logger = logging.getLogger(__name__)
+
+HOOK_PATH = '/api/hooks/paperless'
+
+_DOC_URL_PATTERN = re.compile(r'/documents/(\d+)')
+
+
+def parse_webhook_payload(payload: Any) -> List[int]:
+    """Extract document ids from a Paperless workflow webhook body.
+
+    Paperless lets the workflow author choose the body, so accept the common
+    shapes: an explicit id field, a list of ids, or the ``{doc_url}``
+    placeholder pointing at the document. Anything that is not an object
+    yields no ids.
+    """
+    if not isinstance(payload, dict):
+        return []
+
+    doc_ids = []
+
+    for key in ('document_id', 'doc_id', 'id'):
+        value = payload.get(key)
+        if value is not None and str(value).isdigit():
+            doc_ids.append(int(value))
+
+    documents = payload.get('documents') or []
+    if not isinstance(documents, (list, tuple)):
+        documents = [documents]
+    for value in documents:
+        if str(value).isdigit():
+            doc_ids.append(int(value))
+
+    for key in ('doc_url', 'url'):
+        match = _DOC_URL_PATTERN.search(str(payload.get(key) or ''))
+        if match:
+            doc_ids.append(int(match.group(1)))
+
+    return sorted(set(doc_ids))
+
+
+class WebhookDebouncer:
+    """Coalesce webhook events per document and flush them after a quiet period"""
+
+    def __init__(self, on_flush: Callable[[List[int]], None], debounce_seconds: float = 5.0,
+                 max_wait_seconds: float = 30.0):
+        self.on_flush = on_flush
+        self.debounce_seconds = debounce_seconds
+        self.max_wait_seconds = max(max_wait_seconds, debounce_seconds)
+        self._pending: Dict[int, Dict[str, float]] = {}
+        self._cond = threading.Condition()
+        self._running = False
+        self._thread: Optional[threading.Thread] = None
+        self.received = 0
+        self.coalesced = 0
+
+    def submit(self, doc_ids: List[int]):
+        """Record webhook events; repeated events for a queued document are coalesced"""
+        now = time.monotonic()
+        with self._cond:
+            for doc_id in doc_ids:
+                self.received += 1
+                entry = self._pending.get(doc_id)
+                if entry:
+                    entry['last_seen'] = now
+                    self.coalesced += 1
+                else:
+                    self._pending[doc_id] = {'first_seen': now, 'last_seen': now}
+            self._cond.notify()
+
+    def pending(self) -> int:
+        with self._cond:
+            return len(self._pending)
+
+    def start(self):
+        with self._cond:
+            if self._running:
+                return
+            self._running = True
+        self._thread = threading.Thread(target=self._run, name='webhook-debouncer', daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        with self._cond:
+            self._running = False
+            self._cond.notify()
+        if self._thread:
+            self._thread.join()
+            self._thread = None
+
+    def _due(self, now: float) -> List[int]:
+        """Documents that have been quiet for the debounce window or waited too long"""
+        return [doc_id for doc_id, entry in self._pending.items()
+                if now - entry['last_seen'] >= self.debounce_seconds
+                or now - entry['first_seen'] >= self.max_wait_seconds]
+
+    def _next_deadline(self) -> Optional[float]:
+        if not self._pending:
+            return None
+        return min(min(entry['last_seen'] + self.debounce_seconds,
+                       entry['first_seen'] + self.max_wait_seconds)
+                   for entry in self._pending.values())
+
+    def _run(self):
+        while True:
+            with self._cond:
+                if not self._running:
+                    return
+                deadline = self._next_deadline()
+                timeout = None if deadline is None else max(0.0, deadline - time.monotonic())
+                self._cond.wait(timeout)
+                due = self._due(time.monotonic())
+                for doc_id in due:
+                    del self._pending[doc_id]
+
+            if due:
+                try:
+                    self.on_flush(due)
+                except Exception as e:
+                    logger.error(f"Failed to enqueue webhook documents {due}: {e}")
+
+
+def fire_webhook(base_url: str, doc_id: int, secret: str = None, timeout: float = 10) -> requests.Response:
+    """Send a webhook the way a Paperless workflow with a {doc_url} body would"""
+    headers = {'X-Webhook-Secret': secret} if secret else {}
+    payload = {'doc_url': f"http://paperless.local/documents/{doc_id}/", 'doc_id': doc_id}
+    return requests.post(f"{base_url.rstrip('/')}{HOOK_PATH}", json=payload,
+                         headers=headers, timeout=timeout)
+
+
+if __name__ == "__main__":
+    # Local stand-in for Paperless: fire webhooks at a running middleware
+    import argparse
+
+    parser = argparse.ArgumentParser(description='Fire Paperless-NGX workflow webhooks at the middleware')
+    parser.add_argument('doc_ids', type=int, nargs='+', help='Document IDs to announce')
+    parser.add_argument('--url', default='http://localhost:5000', help='Middleware web interface URL')
+    parser.add_argument('--secret', help='Shared webhook secret')
+    parser.add_argument('--repeat', type=int, default=1, help='Send each event this many times')
+
+    args = parser.parse_args()
+
+    for doc_id in args.doc_ids:
+        for _ in range(args.repeat):
+            response = fire_webhook(args.url, doc_id, args.secret)
+            print(f"Document {doc_id}: HTTP {response.status_code} {response.text.strip()}")
@@ -0,0 +1,66 @@
+#!/usr/bin/env python3
+"""
+Serving settings shared by the dashboard and document editor backends.
+In development both run on Werkzeug's threaded server. In production they
+run under gevent (see serve.py): the process is monkey patched
+before anything else is imported, so threads become green threads and
+blocking socket, lock, queue and database calls yield to other connections.
+Several server processes can share Socket.IO broadcasts through a message
+queue.
+"""
+
+# Imported before monkey patching, so only modules that are safe to patch later
+import configparser
+from typing import Dict
+
+ASYNC_MODES = ('threading', 'gevent')
+
+# Set by serve.py from its command line; take precedence over config.ini
+_overrides: Dict[str, str] = {}
+
+
+def configure(**settings):
+    """Override config.ini settings for this process, ignoring ``None`` values"""
+    _overrides.update({key: value for key, value in settings.items() if value is not None})
+
+
+def settings(config_path: str = 'config.ini') -> Dict[str, str]:
+    """``async_mode`` and ``message_queue`` for this process"""
+    config = configparser.ConfigParser()
+    config.read(config_path)
+    result = {
+        'async_mode': config.get('web_interface', 'async_mode', fallback='threading'),
+        'message_queue': config.get('web_interface', 'message_queue', fallback='')
+    }
+    result.update(_overrides)
+    if result['async_mode'] not in ASYNC_MODES:
+        raise ValueError(f"Unknown async_mode {result['async_mode']!r}; expected one of {', '.join(ASYNC_MODES)}")
+    return result
+
+
+def socketio_options(channel: str, config_path: str = 'config.ini') -> Dict[str, str]:
+    """Keyword arguments for ``SocketIO()``; ``channel`` keeps each backend's events apart on a shared queue"""
+    current = settings(config_path)
+    options = {'async_mode': current['async_mode']}
+    if current['message_queue']:
+        # redis:// in production; any Kombu URL works, e.g. memory:// as a single-process stand-in
+        options['message_queue'] = current['message_queue']
+        options['channel'] = channel
+    return options
+
+
+def monkey_patch(async_mode: str):
+    """Make blocking calls cooperative for ``async_mode``; call before importing a backend"""
+    if async_mode == 'gevent':
+        from gevent import monkey
+        monkey.patch_all()
+    else:
+        return
+
+    # psycopg2 waits in C unless told to wait through the (now green) select module
+    try:
+        import psycopg2.extensions
+        import psycopg2.extras
+    except ImportError:
+        return
+    psycopg2.extensions.set_wait_callback(psycopg2.extras.wait_select)
@@ -0,0 +1,321 @@
+#!/usr/bin/env python3
+"""
+Lease-based work queue for the Paperless-Bigcapital middleware.
+Discovered documents are enqueued once and claimed in batches under a lease
+that the claiming worker keeps renewing. The PostgreSQL backend claims with
+FOR UPDATE SKIP LOCKED so several middleware replicas can share one backlog
+without processing the same document twice; the in-memory backend gives a
+single replica the same interface without a database.
+
+Failures are split into transient ones (timeouts, connection errors, 429 and
+5xx responses), which are retried with exponential backoff, and permanent
+ones, which go straight to the dead-letter queue together with documents that
+ran out of retries.
+"""
+
+import logging
+import os
+import random
+import socket
+import threading
+import time
+from dataclasses import dataclass
+from typing import Dict, Iterable, List, Optional, Tuple
+
+import requests
+
+logger = logging.getLogger(__name__)
+
+# HTTP statuses worth retrying: timeouts, rate limiting and server errors
+TRANSIENT_STATUS_CODES = {408, 425, 429}
+
+# Longest wait between two attempts, however many retries have failed
+MAX_RETRY_DELAY = 24 * 3600
+
+
+def is_transient_error(error: Exception) -> bool:
+    """Whether an error is likely to go away if the document is retried later"""
+    if isinstance(error, (requests.Timeout, requests.ConnectionError)):
+        return True
+    if isinstance(error, requests.HTTPError) and error.response is not None:
+        status = error.response.status_code
+        return status in TRANSIENT_STATUS_CODES or status >= 500
+    return False
+
+
+def retry_delay_for(attempts: int, base_delay: float) -> float:
+    """Exponential backoff with a little jitter so retries after an outage spread out"""
+    delay = min(MAX_RETRY_DELAY, base_delay * (2 ** max(0, attempts - 1)))
+    return delay * random.uniform(0.9, 1.1)
+
+
+def default_worker_id() -> str:
+    """Identify this replica in lease ownership records"""
+    return f"{socket.gethostname()}-{os.getpid()}"
+
+
+@dataclass
+class QueueEntry:
+    """A claimed document"""
+    doc_id: int
+    doc_type: str
+    attempts: int = 1
+    posted: bool = False  # already created in Bigcapital by an earlier attempt
+
+
+class MemoryWorkQueue:
+    """Work queue held in process memory, for single replica deployments"""
+
+    def __init__(self, worker_id: str = None, lease_seconds: int = 300,
+                 max_retries: int = 3, retry_delay: float = 60):
+        self.worker_id = worker_id or default_worker_id()
+        self.lease_seconds = lease_seconds
+        self.max_retries = max_retries
+        self.retry_delay = retry_delay
+        self._items: Dict[int, Dict] = {}
+        self._dead: Dict[int, Dict] = {}
+        self._lock = threading.Lock()
+
+    def enqueue(self, entries: Iterable[Tuple[int, str]]) -> int:
+        """Add documents that are not queued or in flight; returns how many were added"""
+        added = 0
+        with self._lock:
+            for doc_id, doc_type in entries:
+                if doc_id in self._items:
+                    continue
+                # Rediscovered after its error tag was removed; don't post it twice
+                dead = self._dead.pop(doc_id, None)
+                self._items[doc_id] = {
+                    'doc_type': doc_type,
+                    'status': 'pending',
+                    'owner': None,
+                    'lease_expires_at': None,
+                    'heartbeat_at': None,
+                    'attempts': 0,
+                    'posted': dead['posted'] if dead else False,
+                    'next_attempt_at': None,
+                    'last_error': None,
+                    'enqueued_at': time.time()
+                }
+                added += 1
+        return added
+
+    def claim(self, limit: int) -> List[QueueEntry]:
+        """Lease up to ``limit`` pending or expired documents to this worker"""
+        now = time.time()
+        claimed = []
+        with self._lock:
+            candidates = sorted(
+                (item['enqueued_at'], doc_id) for doc_id, item in self._items.items()
+                if (item['status'] == 'pending'
+                    and (item['next_attempt_at'] is None or item['next_attempt_at'] <= now))
+                or (item['status'] == 'leased' and item['lease_expires_at'] < now)
+            )
+            for _, doc_id in candidates[:limit]:
+                item = self._items[doc_id]
+                item.update(status='leased', owner=self.worker_id,
+                            lease_expires_at=now + self.lease_seconds, heartbeat_at=now)
+                item['attempts'] += 1
+                claimed.append(QueueEntry(doc_id, item['doc_type'], item['attempts'], item['posted']))
+        return claimed
+
+    def heartbeat(self, doc_ids: Iterable[int]) -> int:
+        """Extend the lease on documents this worker still holds"""
+        now = time.time()
+        renewed = 0
+        with self._lock:
+            for doc_id in doc_ids:
+                item = self._items.get(doc_id)
+                if item and item['status'] == 'leased' and item['owner'] == self.worker_id:
+                    item['lease_expires_at'] = now + self.lease_seconds
+                    item['heartbeat_at'] = now
+                    renewed += 1
+        return renewed
+
+    def complete(self, doc_id: int):
+        """Finish a document; finished documents are tagged in Paperless so they are dropped"""
+        with self._lock:
+            item = self._items.get(doc_id)
+            if item and item['owner'] == self.worker_id:
+                del self._items[doc_id]
+
+    def fail(self, doc_id: int, error: str, transient: bool, posted: bool = False,
+             attempts: int = None) -> str:
+        """Schedule a retry for a transient failure, otherwise dead-letter the document.
+
+        Returns 'retry' or 'dead'. The in-memory queue tracks ``attempts`` itself.
+        """
+        with self._lock:
+            item = self._items.get(doc_id)
+            if not item or item['owner'] != self.worker_id:
+                return 'dead'
+            item['posted'] = item['posted'] or posted
+            item['last_error'] = error
+
+            if transient and item['attempts'] <= self.max_retries:
+                item.update(status='pending', owner=None, lease_expires_at=None,
+                            next_attempt_at=time.time() + retry_delay_for(item['attempts'], self.retry_delay))
+                return 'retry'
+
+            del self._items[doc_id]
+            self._dead[doc_id] = {
+                'paperless_id': doc_id,
+                'doc_type': item['doc_type'],
+                'attempts': item['attempts'],
+                'posted': item['posted'],
+                'error_kind': 'transient' if transient else 'permanent',
+                'last_error': error,
+                'failed_at': time.time()
+            }
+            return 'dead'
+
+    def dead_letters(self, limit: int = 100) -> List[Dict]:
+        """Most recently dead-lettered documents first"""
+        with self._lock:
+            return sorted(self._dead.values(), key=lambda d: d['failed_at'], reverse=True)[:limit]
+
+    def redrive(self, doc_ids: List[int] = None) -> List[int]:
+        """Put dead-lettered documents (all of them when ``doc_ids`` is None) back in the queue"""
+        redriven = []
+        with self._lock:
+            for doc_id in list(self._dead if doc_ids is None else doc_ids):
+                dead = self._dead.pop(doc_id, None)
+                if dead is None:
+                    continue
+                self._items[doc_id] = {
+                    'doc_type': dead['doc_type'], 'status': 'pending', 'owner': None,
+                    'lease_expires_at': None, 'heartbeat_at': None, 'attempts': 0,
+                    'posted': dead['posted'], 'next_attempt_at': None, 'last_error': None,
+                    'enqueued_at': time.time()
+                }
+                redriven.append(doc_id)
+        return redriven
+
+    def release(self, doc_id: int):
+        """Hand a leased document back to the queue without finishing it"""
+        with self._lock:
+            item = self._items.get(doc_id)
+            if item and item['owner'] == self.worker_id:
+                item.update(status='pending', owner=None, lease_expires_at=None)
+
+    def owners(self) -> List[Dict]:
+        """Summarise which workers hold leases"""
+        summary: Dict[str, Dict] = {}
+        with self._lock:
+            for item in self._items.values():
+                if item['status'] != 'leased':
+                    continue
+                owner = summary.setdefault(item['owner'], {
+                    'owner': item['owner'], 'leased': 0,
+                    'next_expiry': item['lease_expires_at'], 'last_heartbeat': item['heartbeat_at']
+                })
+                owner['leased'] += 1
+                owner['next_expiry'] = min(owner['next_expiry'], item['lease_expires_at'])
+                owner['last_heartbeat'] = max(owner['last_heartbeat'], item['heartbeat_at'])
+        return list(summary.values())
+
+    def depth(self) -> Dict[str, int]:
+        """Count queued documents by status"""
+        counts: Dict[str, int] = {}
+        with self._lock:
+            for item in self._items.values():
+                counts[item['status']] = counts.get(item['status'], 0) + 1
+            if self._dead:
+                counts['dead'] = len(self._dead)
+        return counts
+
+
+class PostgresWorkQueue:
+    """Work queue stored in the ``work_queue`` table, shared by every replica"""
+
+    def __init__(self, db, worker_id: str = None, lease_seconds: int = 300,
+                 max_retries: int = 3, retry_delay: float = 60):
+        self.db = db
+        self.worker_id = worker_id or default_worker_id()
+        self.lease_seconds = lease_seconds
+        self.max_retries = max_retries
+        self.retry_delay = retry_delay
+
+    def enqueue(self, entries: Iterable[Tuple[int, str]]) -> int:
+        return self.db.enqueue_work(list(entries))
+
+    def claim(self, limit: int) -> List[QueueEntry]:
+        rows = self.db.claim_work(self.worker_id, limit, self.lease_seconds)
+        return [QueueEntry(row['paperless_id'], row['doc_type'], row['attempts'], row['posted'])
+                for row in rows]
+
+    def heartbeat(self, doc_ids: Iterable[int]) -> int:
+        return self.db.heartbeat_work(self.worker_id, list(doc_ids), self.lease_seconds)
+
+    def complete(self, doc_id: int):
+        self.db.complete_work(self.worker_id, doc_id)
+
+    def fail(self, doc_id: int, error: str, transient: bool, posted: bool = False,
+             attempts: int = 1) -> str:
+        if transient and attempts <= self.max_retries:
+            delay = retry_delay_for(attempts, self.retry_delay)
+            if self.db.retry_work(self.worker_id, doc_id, error, posted, delay):
+                return 'retry'
+        self.db.dead_letter_work(self.worker_id, doc_id, error, posted,
+                                 'transient' if transient else 'permanent')
+        return 'dead'
+
+    def dead_letters(self, limit: int = 100) -> List[Dict]:
+        return self.db.get_dead_letters(limit)
+
+    def redrive(self, doc_ids: List[int] = None) -> List[int]:
+        return self.db.redrive_dead_letters(doc_ids)
+
+    def release(self, doc_id: int):
+        self.db.release_work(self.worker_id, doc_id)
+
+    def owners(self) -> List[Dict]:
+        return self.db.get_work_owners()
+
+    def depth(self) -> Dict[str, int]:
+        return self.db.get_work_queue_depth()
+
+
+class LeaseHeartbeat:
+    """Background thread renewing the leases of documents still in flight"""
+
+    def __init__(self, work_queue, interval: float):
+        self.work_queue = work_queue
+        self.interval = max(1.0, interval)
+        self._in_flight = set()
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    def add(self, doc_id: int):
+        with self._lock:
+            self._in_flight.add(doc_id)
+
+    def discard(self, doc_id: int):
+        with self._lock:
+            self._in_flight.discard(doc_id)
+
+    def in_flight(self) -> List[int]:
+        with self._lock:
+            return list(self._in_flight)
+
+    def start(self):
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, name='lease-heartbeat', daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        if self._thread:
+            self._thread.join()
+            self._thread = None
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            doc_ids = self.in_flight()
+            if not doc_ids:
+                continue
+            try:
+                self.work_queue.heartbeat(doc_ids)
+            except Exception as e:
+                logger.error(f"Failed to renew leases for {len(doc_ids)} documents: {e}")